@@ -15,19 +15,90 @@ __email__ = "tpovedatd@gmail.com"
 import logging
 
 import tpDcc as tp
+from tpDcc.libs.python import decorators
 
 import artellapipe
 from artellapipe.core import node
 
-from solstice.core import utils
+from solstice.core import utils, shadermapping, sceneindex
+
+if tp.is_maya():
+    import tpDcc.dccs.maya as maya
+    from tpDcc.dccs.maya.core import decorators as maya_decorators
+    undo_decorator = maya_decorators.undo_chunk
+    refresh_decorator = maya_decorators.suspend_refresh
+else:
+    undo_decorator = decorators.empty_decorator
+    refresh_decorator = decorators.empty_decorator
 
 LOGGER = logging.getLogger()
 
+# Defines the attribute used to identify the look assignment operators created by Solstice
+LOOK_OPERATOR_ATTRIBUTE = 'solsticeLook'
+
+
+class AssetNodeKinds(object):
+    RIG = 'rig'
+    GPU_CACHE = 'gpuCache'
+    STANDIN = 'aiStandIn'
+    OTHER = 'other'
+
 
 class SolsticeAssetNode(node.ArtellaAssetNode, object):
+
+    # Incremented each time nodes are added, removed or renamed in the scene. Cached kinds computed with an older
+    # generation are not valid anymore
+    _kinds_generation = 0
+
     def __init__(self, project, asset, node=None, **kwargs):
+        self._kind = None
+        self._kind_generation = -1
         super(SolsticeAssetNode, self).__init__(project=project, asset=asset, node=node, **kwargs)
 
+    @classmethod
+    def invalidate_kinds(cls, *args, **kwargs):
+        """
+        Invalidates the cached kind of all asset nodes
+        Called by the scene asset nodes index callbacks when nodes are added, removed or renamed
+        """
+
+        cls._kinds_generation += 1
+
+    def get_kind(self, force=False):
+        """
+        Returns the kind of the asset node (AssetNodeKinds)
+        Kind is cached until nodes are added, removed or renamed in the scene, so repeated classification of the
+        same node does not query the DCC. Kinds stored in the scene asset nodes index are reused
+        :param force: bool, whether or not to force the classification of the node
+        :return: str
+        """
+
+        if force or not self.has_cached_kind():
+            kind = None if force else sceneindex.get_index().get_node_kind(self._node, update=False)
+            self.set_cached_kind(kind or self._compute_kind())
+
+        return self._kind
+
+    def has_cached_kind(self):
+        """
+        Returns whether or not the asset node has a valid cached kind
+        :return: bool
+        """
+
+        return self._kind is not None and self._kind_generation == SolsticeAssetNode._kinds_generation and \
+            sceneindex.get_index().callbacks_registered
+
+    def set_cached_kind(self, kind):
+        """
+        Caches given kind for this asset node
+        :param kind: str
+        """
+
+        # Scene asset nodes index owns the DCC callbacks that invalidate cached kinds
+        sceneindex.get_index().register_callbacks()
+        self._kind = kind
+        self._kind_generation = SolsticeAssetNode._kinds_generation
+
     # def get_current_extension(self):
     #     """
     #     Overrides base ArtellaAsset get_current_extension function
@@ -63,14 +134,7 @@ class SolsticeAssetNode(node.ArtellaAssetNode, object):
                 return
             tp.Dcc.set_integer_attribute_value(self._node, 'type', 0)
         elif self.is_gpu_cache():
-            asset_shape_operator = self.get_shape_operator()
-            if not asset_shape_operator:
-                asset_shape_operator = self.create_shape_operator()
-            if not asset_shape_operator:
-                LOGGER.warning('Impossible to switch proxy for GPU Cache "{}"'.format(self.id))
-                return
-            self.remove_shape_operator_assignment('subdiv_type')
-            self.remove_shape_operator_assignment('subdiv_iterations')
+            self._switch_shape_operator(hires=False)
 
     def switch_to_hires(self):
         if self.is_rig():
@@ -79,14 +143,83 @@ class SolsticeAssetNode(node.ArtellaAssetNode, object):
                 return
             tp.Dcc.set_integer_attribute_value(self._node, 'type', 1)
         elif self.is_gpu_cache():
-            asset_shape_operator = self.get_shape_operator()
-            if not asset_shape_operator:
-                asset_shape_operator = self.create_shape_operator()
-            if not asset_shape_operator:
-                LOGGER.warning('Impossible to switch proxy for GPU Cache "{}"'.format(self.id))
-                return
-            self.add_shape_operator_assignment("subdiv_type = 'catclark'")
-            self.add_shape_operator_assignment('subdiv_iterations = 2')
+            self._switch_shape_operator(hires=True)
+
+    @undo_decorator
+    def assign_look(self, shader_mapping):
+        """
+        Assigns the shaders of the given mapping to the geometries of current GPU cache or standin asset
+        Instead of swapping to full geometry and assigning shaders per shape, an Arnold set parameter operator with
+        a selection expression is created for each shading group and chained into the shape operator of the asset.
+        All the operators are edited in a single undo chunk
+        :param shader_mapping: dict or ShaderMapping, mapping data ({geometry: {shading_group: [shaders]}})
+        :return: list(str) or None, created look operators
+        """
+
+        if not tp.is_maya():
+            LOGGER.warning('Look assignment is only supported in Maya!')
+            return None
+
+        if not self.is_gpu_cache() and not self.is_standin():
+            LOGGER.warning('Look assignment is only supported for GPU Caches and Standins: "{}"'.format(self.id))
+            return None
+
+        asset_shape_operator = self.get_shape_operator()
+        if not asset_shape_operator:
+            asset_shape_operator = self.create_shape_operator()
+        if not asset_shape_operator:
+            LOGGER.warning('Impossible to assign look for "{}"'.format(self.id))
+            return None
+
+        if not isinstance(shader_mapping, shadermapping.ShaderMapping):
+            shader_mapping = shadermapping.ShaderMapping(shader_mapping)
+
+        self.remove_look()
+
+        node_name = self._node.split('|')[-1].split(':')[-1]
+        look_operators = list()
+        for shading_group, geometries in shader_mapping.get_shading_group_geometry_mapping().items():
+            surface_shader = self._get_surface_shader(
+                shading_group, shader_mapping.get_shading_group_shaders(shading_group))
+            if not surface_shader or not geometries:
+                continue
+            look_operator = maya.cmds.createNode(
+                'aiSetParameter', name='{}_{}_look'.format(node_name, shading_group.split(':')[-1]))
+            maya.cmds.addAttr(look_operator, longName=LOOK_OPERATOR_ATTRIBUTE, attributeType='bool')
+            maya.cmds.setAttr(
+                '{}.selection'.format(look_operator), shadermapping.get_selection_expression(geometries),
+                type='string')
+            maya.cmds.setAttr(
+                '{}.assignment[0]'.format(look_operator), "shader = '{}'".format(surface_shader), type='string')
+            maya.cmds.connectAttr(
+                '{}.out'.format(look_operator), '{}.inputs'.format(asset_shape_operator), nextAvailable=True)
+            look_operators.append(look_operator)
+
+        LOGGER.info('Assigned {} shading groups to "{}" with shape operators'.format(len(look_operators), self.id))
+
+        return look_operators
+
+    def remove_look(self):
+        """
+        Removes the look assignment operators of current asset
+        :return: int, number of removed look operators
+        """
+
+        if not tp.is_maya():
+            return 0
+
+        asset_shape_operator = self.get_shape_operator()
+        if not asset_shape_operator:
+            return 0
+
+        look_operators = [
+            operator for operator in maya.cmds.listConnections(
+                '{}.inputs'.format(asset_shape_operator), source=True, destination=False) or list()
+            if maya.cmds.attributeQuery(LOOK_OPERATOR_ATTRIBUTE, node=operator, exists=True)]
+        if look_operators:
+            maya.cmds.delete(look_operators)
+
+        return len(look_operators)
 
     def is_rig(self):
         """
@@ -94,11 +227,7 @@ class SolsticeAssetNode(node.ArtellaAssetNode, object):
         :return: bool
         """
 
-        tag_node = self.get_tag_node()
-        if not tag_node:
-            return False
-
-        return True
+        return self.get_kind() == AssetNodeKinds.RIG
 
     def is_gpu_cache(self):
         """
@@ -106,16 +235,7 @@ class SolsticeAssetNode(node.ArtellaAssetNode, object):
         :return: bool
         """
 
-        shapes = tp.Dcc.list_shapes(self._node)
-        if not shapes:
-            return False
-
-        for shape in shapes:
-            shape_type = tp.Dcc.node_type(shape)
-            if shape_type == 'gpuCache':
-                return True
-
-        return False
+        return self.get_kind() == AssetNodeKinds.GPU_CACHE
 
     def is_standin(self):
         """
@@ -123,16 +243,7 @@ class SolsticeAssetNode(node.ArtellaAssetNode, object):
         :return: bool
         """
 
-        shapes = tp.Dcc.list_shapes(self._node)
-        if not shapes:
-            return False
-
-        for shape in shapes:
-            shape_type = tp.Dcc.node_type(shape)
-            if shape_type == 'aiStandIn':
-                return True
-
-        return False
+        return self.get_kind() == AssetNodeKinds.STANDIN
 
     def get_control(self, rig_control):
         """
@@ -143,14 +254,10 @@ class SolsticeAssetNode(node.ArtellaAssetNode, object):
         if not rig_control:
             rig_control = 'root_ctrl'
 
-        tag_node = artellapipe.TagsMgr().get_tag_node(project=self._project, node=self.node)
-        if not tag_node:
-            LOGGER.warning('No Tag Node found! Aborting operation ...')
-            return None
-        asset_node = tag_node.get_asset_node()
+        asset_node = utils.get_asset_node(self.node, project=self._project)
         if not asset_node:
-            LOGGER.warning('Tag Data node: {} is not linked to any asset! Aborting operation ...'.format(tag_node))
-            return
+            LOGGER.warning('No Asset Node found for "{}"! Aborting operation ...'.format(self.node))
+            return None
         node_to_apply_xform = asset_node.node
         attrs = tp.Dcc.list_user_attributes(node_to_apply_xform)
         if attrs and type(attrs) == list:
@@ -210,7 +317,8 @@ class SolsticeAssetNode(node.ArtellaAssetNode, object):
 
         tp.Dcc.set_node_matrix(root_ctrl, current_matrix)
         if parent_node and tp.Dcc.object_exists(parent_node):
-            asset_node = artellapipe.AssetsMgr().get_asset_node_in_scene(root_ctrl)
+            asset_node = sceneindex.get_index().get_asset_node_from_node(
+                root_ctrl) or artellapipe.AssetsMgr().get_asset_node_in_scene(root_ctrl)
             if not asset_node:
                 return
             tp.Dcc.set_parent(asset_node.node, parent_node)
@@ -330,5 +438,252 @@ class SolsticeAssetNode(node.ArtellaAssetNode, object):
 
         return True
 
+    def _compute_kind(self):
+        """
+        Internal function that classifies the asset node querying its shapes once
+        GPU caches and standins are identified by their shapes. Other nodes are rigs if they have a tag node
+        :return: str
+        """
+
+        if not self._node or not tp.Dcc.object_exists(self._node):
+            return AssetNodeKinds.OTHER
+
+        shapes = tp.Dcc.list_shapes(self._node) or list()
+        if tp.is_maya():
+            shape_types = set((maya.cmds.ls(shapes, showType=True) or list())[1::2]) if shapes else set()
+        else:
+            shape_types = set(tp.Dcc.node_type(shape) for shape in shapes)
+        if AssetNodeKinds.GPU_CACHE in shape_types:
+            return AssetNodeKinds.GPU_CACHE
+        elif AssetNodeKinds.STANDIN in shape_types:
+            return AssetNodeKinds.STANDIN
+        elif self.get_tag_node():
+            return AssetNodeKinds.RIG
+
+        return AssetNodeKinds.OTHER
+
+    def _get_surface_shader(self, shading_group, shaders):
+        """
+        Internal function that returns the surface shader of the given shading group
+        Shading groups can also be connected to displacement or volume shaders, so the shader connected to the
+        surfaceShader attribute of the shading group is used. If the shading group is not in the scene, the first of
+        the given shaders classified as a surface shader is used
+        :param shading_group: str
+        :param shaders: list(str), shaders of the shading group in its shader mapping
+        :return: str or None
+        """
+
+        if maya.cmds.objExists(shading_group) and maya.cmds.attributeQuery(
+                'surfaceShader', node=shading_group, exists=True):
+            surface_shaders = maya.cmds.listConnections(
+                '{}.surfaceShader'.format(shading_group), source=True, destination=False) or list()
+            if surface_shaders:
+                return surface_shaders[0]
+
+        for shader in shaders or list():
+            if maya.cmds.objExists(shader) and maya.cmds.getClassification(
+                    maya.cmds.nodeType(shader), satisfies='shader/surface'):
+                return shader
+
+        LOGGER.warning('No surface shader found for shading group "{}"'.format(shading_group))
+
+        return None
+
+    def _switch_shape_operator(self, hires):
+        """
+        Internal function that switches between proxy and hires subdivision using the shape operator of the asset
+        :param hires: bool
+        :return: bool
+        """
+
+        asset_shape_operator = self.get_shape_operator()
+        if not asset_shape_operator:
+            asset_shape_operator = self.create_shape_operator()
+        if not asset_shape_operator:
+            LOGGER.warning('Impossible to switch proxy for GPU Cache "{}"'.format(self.id))
+            return False
+
+        if hires:
+            self.add_shape_operator_assignment("subdiv_type = 'catclark'")
+            self.add_shape_operator_assignment('subdiv_iterations = 2')
+        else:
+            self.remove_shape_operator_assignment('subdiv_type')
+            self.remove_shape_operator_assignment('subdiv_iterations')
+
+        return True
+
+
+def get_asset_nodes_kinds(asset_nodes):
+    """
+    Returns the kind (rig, GPU cache, standin or other) of all the given asset nodes
+    Nodes with a valid cached kind are not queried. Shapes and tag attributes of the other nodes are retrieved with a
+    single scene query each, so tag nodes are only looked up for nodes that can have one. Kinds are classified with
+    the same rules as SolsticeAssetNode.get_kind
+    :param asset_nodes: list(SolsticeAssetNode)
+    :return: dict(SolsticeAssetNode, str), maps each asset node with its kind (AssetNodeKinds)
+    """
+
+    if not asset_nodes:
+        return dict()
+
+    asset_nodes_kinds = dict(
+        (asset_node, asset_node.get_kind()) for asset_node in asset_nodes
+        if not tp.is_maya() or asset_node.has_cached_kind())
+    asset_nodes = [asset_node for asset_node in asset_nodes if asset_node not in asset_nodes_kinds]
+    if not asset_nodes:
+        return asset_nodes_kinds
+
+    node_names = [asset_node.node for asset_node in asset_nodes]
+    nodes_by_leaf = _get_asset_nodes_by_leaf(asset_nodes)
+
+    node_shape_types = dict()
+    try:
+        shapes = maya.cmds.listRelatives(node_names, shapes=True, fullPath=True) or list()
+    except ValueError:
+        # Some of the nodes do not exist anymore, so we classify them one by one
+        asset_nodes_kinds.update((asset_node, asset_node.get_kind()) for asset_node in asset_nodes)
+        return asset_nodes_kinds
+    shapes_info = maya.cmds.ls(shapes, long=True, showType=True) if shapes else list()
+    for shape, shape_type in zip(shapes_info[::2], shapes_info[1::2]):
+        parent = shape.rsplit('|', 1)[0]
+        for asset_node in nodes_by_leaf.get(parent.split('|')[-1], list()):
+            if _is_same_node(parent, asset_node.node):
+                node_shape_types.setdefault(asset_node, set()).add(shape_type)
+
+    # Only nodes with tag attributes can have a tag node, so other nodes do not need a tag node lookup
+    tagged_nodes = _get_asset_nodes_with_attribute(asset_nodes, 'tag_data', nodes_by_leaf=nodes_by_leaf)
+    tagged_nodes.update(_get_asset_nodes_with_attribute(asset_nodes, 'tag_info', nodes_by_leaf=nodes_by_leaf))
+
+    for asset_node in asset_nodes:
+        shape_types = node_shape_types.get(asset_node, set())
+        if AssetNodeKinds.GPU_CACHE in shape_types:
+            kind = AssetNodeKinds.GPU_CACHE
+        elif AssetNodeKinds.STANDIN in shape_types:
+            kind = AssetNodeKinds.STANDIN
+        elif asset_node in tagged_nodes and asset_node.get_tag_node():
+            # Same rule as _compute_kind, so batch and per node classifications always match
+            kind = AssetNodeKinds.RIG
+        else:
+            kind = AssetNodeKinds.OTHER
+        asset_node.set_cached_kind(kind)
+        asset_nodes_kinds[asset_node] = kind
+
+    return asset_nodes_kinds
+
+
+def switch_asset_nodes_to_proxy(asset_nodes):
+    """
+    Switches all the given asset nodes to their proxy models
+    :param asset_nodes: list(SolsticeAssetNode)
+    :return: list(SolsticeAssetNode), switched asset nodes
+    """
+
+    return _switch_asset_nodes(asset_nodes, hires=False)
+
+
+def switch_asset_nodes_to_hires(asset_nodes):
+    """
+    Switches all the given asset nodes to their hires models
+    :param asset_nodes: list(SolsticeAssetNode)
+    :return: list(SolsticeAssetNode), switched asset nodes
+    """
+
+    return _switch_asset_nodes(asset_nodes, hires=True)
+
+
+@undo_decorator
+@refresh_decorator
+def _switch_asset_nodes(asset_nodes, hires):
+    """
+    Internal function that switches all the given asset nodes between their proxy and hires models
+    All nodes are classified at once and all the changes are done in a single undo chunk with viewport refresh
+    suspended
+    :param asset_nodes: list(SolsticeAssetNode)
+    :param hires: bool
+    :return: list(SolsticeAssetNode), switched asset nodes
+    """
+
+    asset_nodes_kinds = get_asset_nodes_kinds(asset_nodes)
+    rig_nodes = [asset_node for asset_node, kind in asset_nodes_kinds.items() if kind == AssetNodeKinds.RIG]
+    if tp.is_maya():
+        ready_rig_nodes = _get_asset_nodes_with_attribute(rig_nodes, 'type')
+    else:
+        ready_rig_nodes = set(
+            rig_node for rig_node in rig_nodes if tp.Dcc.attribute_exists(rig_node.node, 'type'))
+
+    switched_nodes = list()
+    for asset_node in asset_nodes:
+        kind = asset_nodes_kinds[asset_node]
+        if kind == AssetNodeKinds.RIG:
+            if asset_node not in ready_rig_nodes:
+                LOGGER.warning('Rig for "{}" is not ready to switch between proxy/high models'.format(asset_node.id))
+                continue
+            tp.Dcc.set_integer_attribute_value(asset_node.node, 'type', int(hires))
+        elif kind == AssetNodeKinds.GPU_CACHE:
+            if not asset_node._switch_shape_operator(hires=hires):
+                continue
+        else:
+            continue
+        switched_nodes.append(asset_node)
+
+    LOGGER.info('Switched {} of {} asset nodes to {}'.format(
+        len(switched_nodes), len(asset_nodes), 'hires' if hires else 'proxy'))
+
+    return switched_nodes
+
+
+def _get_asset_nodes_by_leaf(asset_nodes):
+    """
+    Internal function that groups given asset nodes by the short name of their nodes
+    :param asset_nodes: list(SolsticeAssetNode)
+    :return: dict(str, list(SolsticeAssetNode))
+    """
+
+    nodes_by_leaf = dict()
+    for asset_node in asset_nodes:
+        nodes_by_leaf.setdefault(asset_node.node.split('|')[-1], list()).append(asset_node)
+
+    return nodes_by_leaf
+
+
+def _is_same_node(long_name, node_name):
+    """
+    Internal function that returns whether or not given long name (full DAG path) and node name (full, partial or
+    short DAG path) point to the same node
+    :param long_name: str
+    :param node_name: str
+    :return: bool
+    """
+
+    return long_name == node_name or long_name.endswith('|{}'.format(node_name.lstrip('|')))
+
+
+def _get_asset_nodes_with_attribute(asset_nodes, attribute_name, nodes_by_leaf=None):
+    """
+    Internal function that returns the asset nodes whose nodes have the given attribute with a single scene query
+    Maya lists plugs with the shortest unique names of their nodes, so plugs are listed with long names and compared
+    with the nodes of the asset nodes
+    :param asset_nodes: list(SolsticeAssetNode)
+    :param attribute_name: str
+    :param nodes_by_leaf: dict(str, list(SolsticeAssetNode)) or None, asset nodes grouped by short node name
+    :return: set(SolsticeAssetNode)
+    """
+
+    if not asset_nodes:
+        return set()
+
+    nodes_by_leaf = nodes_by_leaf or _get_asset_nodes_by_leaf(asset_nodes)
+    plugs = maya.cmds.ls(
+        ['{}.{}'.format(asset_node.node, attribute_name) for asset_node in asset_nodes], long=True) or list()
+
+    found_nodes = set()
+    for plug in plugs:
+        node_name = plug.rsplit('.', 1)[0]
+        for asset_node in nodes_by_leaf.get(node_name.split('|')[-1], list()):
+            if _is_same_node(node_name, asset_node.node):
+                found_nodes.add(asset_node)
+
+    return found_nodes
+
 
 artellapipe.register.register_class('AssetNode', SolsticeAssetNode)
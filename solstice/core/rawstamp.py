@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains NumPy based compositing backend used to stamp (burn-in) image sequences
+Frames are decoded as raw RGB frames, composited in memory and piped into a single FFMpeg encoder
+"""
+
+from __future__ import print_function, division, absolute_import
+
+__author__ = "Tomas Poveda"
+__license__ = "MIT"
+__maintainer__ = "Tomas Poveda"
+__email__ = "tpovedatd@gmail.com"
+
+import logging
+import tempfile
+import subprocess
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from solstice.core import stamp
+
+LOGGER = logging.getLogger()
+
+# Defines the characters that can be drawn per frame (frame counter and timecode)
+FRAME_CHARACTERS = '0123456789:;() '
+
+
+def is_available():
+    """
+    Returns whether NumPy compositing backend can be used or not
+    :return: bool
+    """
+
+    return np is not None
+
+
+def read_image(image_path, width=None, height=None, ffmpeg_executable=None):
+    """
+    Decodes given image into a RGBA array of shape (height, width, 4)
+    Image is decoded by FFMpeg, so all the image formats supported by FFMpeg can be read
+    :param image_path: str
+    :param width: int or None, if given image is resized to this width
+    :param height: int or None, if given image is resized to this height
+    :param ffmpeg_executable: str or None
+    :return: numpy.ndarray
+    """
+
+    if not width or not height:
+        image_info = stamp.probe_video(image_path, ffmpeg_executable=ffmpeg_executable)
+        width = width or image_info['width']
+        height = height or image_info['height']
+
+    data = stamp.run_ffmpeg(
+        ['-i', image_path, '-frames:v', 1, '-vf', 'scale={}:{}'.format(width, height),
+         '-f', 'rawvideo', '-pix_fmt', 'rgba', '-'], ffmpeg_executable=ffmpeg_executable)
+    frame_size = width * height * 4
+    if len(data) < frame_size:
+        raise stamp.StampError('Impossible to decode image "{}"'.format(image_path))
+
+    return np.frombuffer(data[:frame_size], dtype=np.uint8).reshape((height, width, 4))
+
+
+def iter_sequence_frames(input_args, width, height, ffmpeg_executable=None):
+    """
+    Generator that decodes all the frames of the given FFMpeg input with a single FFMpeg process
+    :param input_args: list(str), FFMpeg input arguments (for example, stamp.get_image_sequence_input_args)
+    :param width: int, width of the decoded frames
+    :param height: int, height of the decoded frames
+    :param ffmpeg_executable: str or None
+    :return: generator(numpy.ndarray), RGB arrays of shape (height, width, 3)
+    """
+
+    command = stamp.get_ffmpeg_command(
+        list(input_args) + ['-vf', 'scale={}:{}'.format(width, height), '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'],
+        ffmpeg_executable=ffmpeg_executable)
+    frame_size = width * height * 3
+    with tempfile.TemporaryFile() as error_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=error_file)
+        try:
+            while True:
+                data = process.stdout.read(frame_size)
+                if len(data) < frame_size:
+                    break
+                yield np.frombuffer(data, dtype=np.uint8).reshape((height, width, 3))
+        finally:
+            process.stdout.close()
+            if process.wait() != 0:
+                error_file.seek(0)
+                LOGGER.warning('FFMpeg frames decoding failed: {}'.format(
+                    error_file.read().decode('utf-8', 'replace')))
+
+
+def iter_image_frames(image_paths, width, height, ffmpeg_executable=None):
+    """
+    Generator that decodes the given list of images. Used for sequences that cannot be read with a single pattern
+    :param image_paths: list(str)
+    :param width: int
+    :param height: int
+    :param ffmpeg_executable: str or None
+    :return: generator(numpy.ndarray), RGB arrays of shape (height, width, 3)
+    """
+
+    for image_path in image_paths:
+        yield read_image(image_path, width=width, height=height, ffmpeg_executable=ffmpeg_executable)[..., :3]
+
+
+class StampLayer(object):
+    """
+    Class that stores a RGBA layer ready to be alpha blended on top of frames
+    Only the rows that contain visible pixels are stored, and color is stored premultiplied by its alpha
+    """
+
+    def __init__(self, rgba, x=0, y=0):
+        super(StampLayer, self).__init__()
+
+        rgba = np.asarray(rgba, dtype=np.uint8)
+        visible_rows = np.nonzero(rgba[..., 3].any(axis=1))[0]
+        visible_columns = np.nonzero(rgba[..., 3].any(axis=0))[0]
+        if not len(visible_rows):
+            self._y = self._x = 0
+            self._premultiplied = self._inverse_alpha = None
+            return
+
+        top, bottom = visible_rows[0], visible_rows[-1] + 1
+        left, right = visible_columns[0], visible_columns[-1] + 1
+        rgba = rgba[top:bottom, left:right].astype(np.uint16)
+        alpha = rgba[..., 3:4]
+        self._y = y + top
+        self._x = x + left
+        self._premultiplied = rgba[..., :3] * alpha
+        self._inverse_alpha = 255 - alpha
+
+    def blend(self, frame):
+        """
+        Blends layer on top of the given frame. Frame is modified in place
+        :param frame: numpy.ndarray, writable RGB array
+        :return: numpy.ndarray
+        """
+
+        if self._premultiplied is None:
+            return frame
+
+        height, width = self._premultiplied.shape[:2]
+        region = frame[self._y:self._y + height, self._x:self._x + width]
+        region_height, region_width = region.shape[:2]
+        blended = region.astype(np.uint16) * self._inverse_alpha[:region_height, :region_width]
+        blended += self._premultiplied[:region_height, :region_width]
+        blended += 127
+        region[...] = blended // 255
+
+        return frame
+
+
+class GlyphAtlas(object):
+    """
+    Class that stores pre-rasterized glyphs used to draw per frame texts without rasterizing text per frame
+    """
+
+    def __init__(self, rgba, glyph_boxes, ascent=0):
+        """
+        :param rgba: numpy.ndarray, RGBA array with all glyphs rasterized in a single row
+        :param glyph_boxes: dict(str, tuple(int, int)), maps each character with its x offset and width in the atlas
+        :param ascent: int, distance between the top of the atlas and the baseline of its glyphs
+        """
+
+        super(GlyphAtlas, self).__init__()
+
+        rgba = np.asarray(rgba, dtype=np.uint8)
+        self._height = rgba.shape[0]
+        self._ascent = int(ascent)
+        self._glyphs = dict()
+        for character, (x, width) in glyph_boxes.items():
+            glyph = rgba[:, x:x + width].astype(np.uint16)
+            alpha = glyph[..., 3:4]
+            self._glyphs[character] = (glyph[..., :3] * alpha, 255 - alpha)
+
+    def draw_text(self, frame, text, x, y):
+        """
+        Draws given text in the given frame. Frame is modified in place
+        Characters not included in the atlas are skipped
+        :param frame: numpy.ndarray, writable RGB array
+        :param text: str
+        :param x: int
+        :param y: int, baseline of the text
+        :return: numpy.ndarray
+        """
+
+        y -= self._ascent
+        frame_height, frame_width = frame.shape[:2]
+        bottom = min(y + self._height, frame_height)
+        if y < 0 or bottom <= y:
+            return frame
+
+        for character in text:
+            glyph = self._glyphs.get(character, None)
+            if glyph is None:
+                continue
+            premultiplied, inverse_alpha = glyph
+            right = min(x + premultiplied.shape[1], frame_width)
+            if right > x >= 0:
+                region = frame[y:bottom, x:right]
+                blended = region.astype(np.uint16) * inverse_alpha[:bottom - y, :right - x]
+                blended += premultiplied[:bottom - y, :right - x]
+                blended += 127
+                region[...] = blended // 255
+            x += premultiplied.shape[1]
+
+        return frame
+
+
+class FrameCompositor(object):
+    """
+    Class that composites stamp layout elements on top of decoded frames
+    """
+
+    def __init__(self, layout, static_layer=None, glyph_atlas=None):
+        """
+        :param layout: stamp.StampLayout
+        :param static_layer: numpy.ndarray or None, RGBA array with bands and static texts precomposited
+        :param glyph_atlas: GlyphAtlas or None, atlas used to draw frame counter and timecode
+        """
+
+        super(FrameCompositor, self).__init__()
+
+        self._layout = layout
+        self._static_layer = StampLayer(static_layer) if static_layer is not None else None
+        self._glyph_atlas = glyph_atlas
+        self._background = np.empty((layout.height, layout.width, 3), dtype=np.uint8)
+        self._background[...] = np.asarray(layout.background_color[:3], dtype=np.uint8)
+
+    def composite(self, frame, frame_index):
+        """
+        Returns stamped version of the given frame
+        :param frame: numpy.ndarray, RGB array of shape (source_height, source_width, 3)
+        :param frame_index: int, index of the frame in its sequence
+        :return: numpy.ndarray, RGB array of shape (layout.height, layout.width, 3)
+        """
+
+        layout = self._layout
+        stamped_frame = self._background.copy()
+        stamped_frame[layout.top_band_height:layout.top_band_height + layout.source_height] = frame
+        if self._static_layer:
+            self._static_layer.blend(stamped_frame)
+        if self._glyph_atlas:
+            frame_x, frame_y = layout.frame_text_position
+            self._glyph_atlas.draw_text(stamped_frame, layout.get_frame_text(frame_index), frame_x, frame_y)
+            timecode_x, timecode_y = layout.timecode_position
+            self._glyph_atlas.draw_text(
+                stamped_frame, stamp.get_timecode_text(layout, frame_index), timecode_x, timecode_y)
+
+        return stamped_frame
+
+
+def encode_frames(frames, output_specs, width, height, fps=24, frames_count=None, ffmpeg_executable=None):
+    """
+    Encodes given RGB frames into a movie with a single FFMpeg process that reads raw frames from its stdin
+    :param frames: iterable(numpy.ndarray), RGB arrays of shape (height, width, 3)
+    :param output_specs: list(stamp.OutputSpec) or str, outputs generated from the frames or path of the movie
+    :param width: int
+    :param height: int
+    :param fps: int
+    :param frames_count: int or None, number of frames that will be encoded
+    :param ffmpeg_executable: str or None
+    :return: int, number of encoded frames
+    """
+
+    if not isinstance(output_specs, (list, tuple)):
+        output_specs = stamp.get_output_specs(output_specs)
+
+    filter_graph = stamp.format_filter_chain([stamp.even_dimensions_filter()], inputs=['0:v'], outputs=['stamped'])
+    args = ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '{}x{}'.format(width, height), '-framerate', fps, '-i', '-']
+    args.extend(stamp.get_outputs_args(filter_graph, output_specs, fps=fps, frames_count=frames_count))
+
+    frames_data = (np.ascontiguousarray(frame, dtype=np.uint8).tobytes() for frame in frames)
+
+    return stamp.pipe_to_ffmpeg(frames_data, args, ffmpeg_executable=ffmpeg_executable)
+
+
+def stamp_frames(frames, output_specs, compositor, layout, max_in_flight_frames=stamp.DEFAULT_MAX_IN_FLIGHT_FRAMES,
+                 frames_count=None, ffmpeg_executable=None):
+    """
+    Composites and encodes given decoded frames into a movie
+    Frames are decoded, composited and encoded at the same time by different threads connected through bounded
+    queues, so peak memory usage depends on the number of in flight frames and not on the length of the sequence
+    :param frames: iterable(numpy.ndarray), decoded source frames
+    :param output_specs: list(stamp.OutputSpec) or str, outputs generated from the frames or path of the movie
+    :param compositor: FrameCompositor
+    :param layout: stamp.StampLayout
+    :param max_in_flight_frames: int, maximum number of decoded or composited frames waiting to be processed
+    :param frames_count: int or None, number of frames that will be stamped
+    :param ffmpeg_executable: str or None
+    :return: int, number of stamped frames
+    """
+
+    stage_frames = max(1, int(max_in_flight_frames or 1) // 2)
+    decoded_frames = stamp.iter_in_background(frames, max_items=stage_frames)
+    stamped_frames = stamp.iter_in_background(
+        (compositor.composite(frame, i) for i, frame in enumerate(decoded_frames)), max_items=stage_frames)
+
+    return encode_frames(
+        stamped_frames, output_specs, layout.width, layout.height, fps=layout.fps, frames_count=frames_count,
+        ffmpeg_executable=ffmpeg_executable)
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains scene wide index of Solstice asset nodes
+"""
+
+from __future__ import print_function, division, absolute_import
+
+__author__ = "Tomas Poveda"
+__license__ = "MIT"
+__maintainer__ = "Tomas Poveda"
+__email__ = "tpovedatd@gmail.com"
+
+import logging
+
+import tpDcc as tp
+from tpDcc.managers import callbacks
+
+import artellapipe
+
+if tp.is_maya():
+    import maya.api.OpenMaya as OpenMaya
+
+LOGGER = logging.getLogger()
+
+# Defines the types of the nodes whose creation or deletion can change the asset nodes of the scene or their kinds
+# (asset nodes, GPU cache and standin shapes and tag data nodes)
+INDEXED_NODE_TYPES = ('transform', 'gpuCache', 'aiStandIn', 'network')
+
+
+class AssetNodesIndex(object):
+    """
+    Class that indexes the asset nodes of current scene by asset id, namespace and tag node, and stores the kind of
+    each node. Index is built with a single pass over the scene the first time it is queried. After that, DCC
+    callbacks mark the namespaces of added, removed and renamed nodes as dirty, and only those namespaces are
+    indexed again the next time the index is queried. The same callbacks invalidate the kinds cached by asset nodes
+    """
+
+    def __init__(self):
+        super(AssetNodesIndex, self).__init__()
+
+        self._built = False
+        self._dirty_namespaces = set()
+        self._asset_nodes = dict()
+        self._namespace_nodes = dict()
+        self._tag_nodes = dict()
+        self._node_kinds = dict()
+        self._callbacks_registered = False
+        self._maya_callbacks = list()
+
+    @property
+    def callbacks_registered(self):
+        """
+        Returns whether or not the DCC callbacks that keep the index up to date are registered
+        If not, nothing indexed or cached can be trusted once the scene changes
+        :return: bool
+        """
+
+        return self._callbacks_registered
+
+    def __len__(self):
+        self._update()
+        return len(self._namespace_nodes)
+
+    def get_scene_asset_nodes(self):
+        """
+        Returns all the asset nodes of current scene
+        :return: list(SolsticeAssetNode)
+        """
+
+        self._update()
+
+        return list(self._namespace_nodes.values())
+
+    def get_asset_nodes(self, asset_id):
+        """
+        Returns all the scene asset nodes of the given asset
+        :param asset_id: str
+        :return: list(SolsticeAssetNode)
+        """
+
+        self._update()
+
+        return list(self._asset_nodes.get(asset_id, list()))
+
+    def get_asset_node_by_namespace(self, namespace):
+        """
+        Returns asset node loaded with the given namespace
+        :param namespace: str
+        :return: SolsticeAssetNode or None
+        """
+
+        self._update()
+
+        return self._namespace_nodes.get(namespace.lstrip(':'), None) if namespace else None
+
+    def get_asset_node_by_tag_node(self, tag_node):
+        """
+        Returns asset node linked to the given tag node
+        :param tag_node: str or ArtellaTagNode
+        :return: SolsticeAssetNode or None
+        """
+
+        self._update()
+
+        return self._tag_nodes.get(getattr(tag_node, 'node', tag_node), None)
+
+    def get_asset_node_from_node(self, node):
+        """
+        Returns asset node the given node (for example, a rig control) belongs to
+        :param node: str
+        :return: SolsticeAssetNode or None
+        """
+
+        self._update()
+
+        for namespace in reversed(_get_node_namespaces(node)):
+            asset_node = self._namespace_nodes.get(namespace, None)
+            if asset_node:
+                return asset_node
+
+        return None
+
+    def get_node_kind(self, node, update=True):
+        """
+        Returns the kind (AssetNodeKinds) of the given asset node
+        :param node: str
+        :param update: bool, whether or not the index should be built or updated before the query. If False, kind is
+            only returned if the index is built and the node did not change since then
+        :return: str or None
+        """
+
+        if update:
+            self._update()
+        elif not self._built or not self._callbacks_registered or any(namespace in self._dirty_namespaces for namespace in _get_node_namespaces(node)):
+            return None
+
+        return self._node_kinds.get(node, None)
+
+    def invalidate(self, namespace=None):
+        """
+        Invalidates the given namespace, so it is indexed again the next time the index is queried
+        If no namespace is given, the whole index is built again
+        :param namespace: str or None
+        """
+
+        if namespace is None:
+            self._built = False
+            self._dirty_namespaces.clear()
+        elif self._built:
+            self._dirty_namespaces.add(namespace.lstrip(':'))
+
+    def register_callbacks(self):
+        """
+        Registers the DCC callbacks that keep the index and the kinds cached by asset nodes up to date
+        """
+
+        if self._callbacks_registered:
+            return
+
+        if tp.is_maya():
+            # DCC callbacks manager only notifies about transforms and does not provide rename notifications, so
+            # Maya messages are used instead
+            for node_type in INDEXED_NODE_TYPES:
+                try:
+                    self._maya_callbacks.append(
+                        OpenMaya.MDGMessage.addNodeAddedCallback(self._on_maya_node_changed, node_type))
+                    self._maya_callbacks.append(
+                        OpenMaya.MDGMessage.addNodeRemovedCallback(self._on_maya_node_changed, node_type))
+                except RuntimeError:
+                    # Node type is not available (for example, its plugin is not loaded)
+                    LOGGER.debug('Impossible to register callbacks for "{}" nodes'.format(node_type))
+            self._maya_callbacks.append(
+                OpenMaya.MNodeMessage.addNameChangedCallback(OpenMaya.MObject(), self._on_node_renamed))
+            for scene_message in (OpenMaya.MSceneMessage.kAfterNew, OpenMaya.MSceneMessage.kAfterOpen):
+                self._maya_callbacks.append(
+                    OpenMaya.MSceneMessage.addCallback(scene_message, self._on_scene_changed))
+        else:
+            if not getattr(callbacks.CallbacksManager, '_initialized', False):
+                LOGGER.debug('DCC callbacks manager is not initialized. Scene asset nodes index is not cached')
+                return
+            callbacks.CallbacksManager.register('NodeAdded', self._on_node_changed, owner=self)
+            callbacks.CallbacksManager.register('NodeDeleted', self._on_node_changed, owner=self)
+            callbacks.CallbacksManager.register('SceneNewFinished', self._on_scene_changed, owner=self)
+            callbacks.CallbacksManager.register('SceneOpenFinished', self._on_scene_changed, owner=self)
+        self._callbacks_registered = True
+
+    def unregister_callbacks(self):
+        """
+        Unregisters the DCC callbacks that keep the index up to date. Index is built again when queried
+        """
+
+        if not self._callbacks_registered:
+            return
+
+        if self._maya_callbacks:
+            OpenMaya.MMessage.removeCallbacks(self._maya_callbacks)
+            self._maya_callbacks = list()
+        else:
+            callbacks.CallbacksManager.unregister('NodeAdded', self._on_node_changed)
+            callbacks.CallbacksManager.unregister('NodeDeleted', self._on_node_changed)
+            callbacks.CallbacksManager.unregister('SceneNewFinished', self._on_scene_changed)
+            callbacks.CallbacksManager.unregister('SceneOpenFinished', self._on_scene_changed)
+        self._callbacks_registered = False
+        self.invalidate()
+        _invalidate_kinds()
+
+    def _update(self):
+        """
+        Internal function that builds the index or indexes again its dirty namespaces
+        """
+
+        if not self._built or not self._callbacks_registered:
+            # Without callbacks, changes of the scene are not tracked, so the index is always built again
+            self._build()
+            return
+        if not self._dirty_namespaces:
+            return
+
+        dirty_namespaces = set(self._dirty_namespaces)
+        self._dirty_namespaces.clear()
+        for namespace in dirty_namespaces:
+            self._remove_namespace(namespace)
+
+        # Each query of scene assets walks the whole scene, so a single query is done for all dirty namespaces.
+        # Scene assets namespaces can start with ":", index ones never do
+        scene_asset_nodes = artellapipe.AssetsMgr().get_scene_assets() or list()
+        self._add_asset_nodes([
+            asset_node for asset_node in scene_asset_nodes
+            if (asset_node.id or '').lstrip(':') in dirty_namespaces])
+
+    def _build(self):
+        """
+        Internal function that indexes all the asset nodes of current scene
+        """
+
+        self.register_callbacks()
+
+        self._asset_nodes.clear()
+        self._namespace_nodes.clear()
+        self._tag_nodes.clear()
+        self._node_kinds.clear()
+        self._dirty_namespaces.clear()
+
+        self._add_asset_nodes(artellapipe.AssetsMgr().get_scene_assets() or list())
+        self._built = True
+
+        LOGGER.debug('Indexed {} asset nodes in current scene'.format(len(self._namespace_nodes)))
+
+    def _add_asset_nodes(self, asset_nodes):
+        """
+        Internal function that adds given asset nodes to the index
+        :param asset_nodes: list(SolsticeAssetNode)
+        """
+
+        if not asset_nodes:
+            return
+
+        asset_nodes_kinds = _get_asset_nodes_kinds(asset_nodes)
+        for asset_node in asset_nodes:
+            namespace = (asset_node.id or '').lstrip(':')
+            asset_id = asset_node.asset.get_id() if asset_node.asset else namespace
+            self._asset_nodes.setdefault(asset_id, list()).append(asset_node)
+            self._namespace_nodes[namespace] = asset_node
+            self._node_kinds[asset_node.node] = asset_nodes_kinds.get(asset_node, None)
+            tag_node = asset_node.get_tag_node()
+            if tag_node:
+                self._tag_nodes[tag_node.node] = asset_node
+
+    def _remove_namespace(self, namespace):
+        """
+        Internal function that removes from the index the asset node loaded with the given namespace
+        :param namespace: str
+        """
+
+        asset_node = self._namespace_nodes.pop(namespace, None)
+        if not asset_node:
+            return
+
+        for asset_id, asset_nodes in list(self._asset_nodes.items()):
+            if asset_node in asset_nodes:
+                asset_nodes.remove(asset_node)
+            if not asset_nodes:
+                self._asset_nodes.pop(asset_id)
+        for tag_node, tag_asset_node in list(self._tag_nodes.items()):
+            if tag_asset_node is asset_node:
+                self._tag_nodes.pop(tag_node)
+        self._node_kinds.pop(asset_node.node, None)
+
+    def _on_node_changed(self, path, name, *args):
+        """
+        Internal callback function that is called when a node is added or removed from the scene
+        :param path: str
+        :param name: str
+        """
+
+        _invalidate_kinds()
+        for namespace in _get_node_namespaces(name or path):
+            self.invalidate(namespace)
+
+    def _on_maya_node_changed(self, mobj, *args):
+        """
+        Internal callback function that is called when an indexed node type is added or removed from a Maya scene
+        :param mobj: OpenMaya.MObject
+        """
+
+        try:
+            node_name = OpenMaya.MFnDependencyNode(mobj).name()
+        except Exception:
+            node_name = None
+        if node_name:
+            self._on_node_changed(node_name, node_name)
+        else:
+            _invalidate_kinds()
+            self.invalidate()
+
+    def _on_scene_changed(self, *args):
+        """
+        Internal callback function that is called when a new scene is created or opened
+        Nothing indexed or cached for the previous scene is valid anymore
+        """
+
+        _invalidate_kinds()
+        self.invalidate()
+
+    def _on_node_renamed(self, mobj, previous_name, *args):
+        """
+        Internal callback function that is called when a node is renamed
+        :param mobj: OpenMaya.MObject
+        :param previous_name: str
+        """
+
+        _invalidate_kinds()
+        try:
+            node_names = [previous_name, OpenMaya.MFnDependencyNode(mobj).name()]
+        except Exception:
+            node_names = [previous_name]
+        for node_name in node_names:
+            for namespace in _get_node_namespaces(node_name):
+                self.invalidate(namespace)
+
+
+def _invalidate_kinds():
+    """
+    Internal function that invalidates the kinds cached by all the asset nodes
+    """
+
+    # Imported here to avoid cyclic imports, asset nodes use the index for their lookups
+    from solstice.core import node as solstice_node
+
+    solstice_node.SolsticeAssetNode.invalidate_kinds()
+
+
+def _get_asset_nodes_kinds(asset_nodes):
+    """
+    Internal function that returns the kind of all the given asset nodes
+    :param asset_nodes: list(SolsticeAssetNode)
+    :return: dict(SolsticeAssetNode, str)
+    """
+
+    # Imported here to avoid cyclic imports, asset nodes use the index for their lookups
+    from solstice.core import node as solstice_node
+
+    return solstice_node.get_asset_nodes_kinds(asset_nodes)
+
+
+def _get_node_namespaces(node):
+    """
+    Internal function that returns all the namespaces of the given node, from the root namespace to the deepest one
+    :param node: str
+    :return: list(str)
+    """
+
+    if not node:
+        return list()
+
+    namespaces = node.split('|')[-1].lstrip(':').split(':')[:-1]
+
+    return [':'.join(namespaces[:i + 1]) for i in range(len(namespaces))]
+
+
+_INDEX = AssetNodesIndex()
+
+
+def get_index():
+    """
+    Returns asset nodes index of current scene
+    :return: AssetNodesIndex
+    """
+
+    return _INDEX
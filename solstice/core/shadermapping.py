@@ -0,0 +1,578 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains indexed data structure used to query shader mapping files
+"""
+
+from __future__ import print_function, division, absolute_import
+
+__author__ = "Tomas Poveda"
+__license__ = "MIT"
+__maintainer__ = "Tomas Poveda"
+__email__ = "tpovedatd@gmail.com"
+
+import os
+import json
+import struct
+import logging
+import threading
+from collections import OrderedDict
+
+LOGGER = logging.getLogger()
+
+# Defines the maximum number of shader mapping files kept in memory by the shader mapping cache
+DEFAULT_CACHE_MAX_ENTRIES = 512
+
+# Defines the maximum amount of memory (estimated in bytes) used by the shader mapping cache
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Defines the header used to identify compact shader mapping files
+COMPACT_FORMAT_MAGIC = b'SLSMAP'
+
+# Defines the version of the compact shader mapping files written by this module
+COMPACT_FORMAT_VERSION = 1
+
+# Defines the index used in compact shader mapping files for shading groups without shaders
+COMPACT_FORMAT_NO_SHADER = 0xFFFFFFFF
+
+# Defines how many times bigger than its file we estimate an indexed mapping is in memory
+MEMORY_FILE_SIZE_RATIO = 4
+
+
+class ShaderMapping(object):
+    """
+    Class that stores the relations between geometries, shading groups and shaders of a shader mapping file
+    Mapping data ({geometry: {shading_group: [shaders]}}) is indexed once when the mapping is created, so all
+    queries are answered from forward and reverse indexes instead of walking the whole mapping.
+    Indexes are order preserving sets (OrderedDict keys), so results keep the order of the mapping data
+    """
+
+    def __init__(self, data=None):
+        super(ShaderMapping, self).__init__()
+
+        self._data = data or dict()
+        self._shaders = OrderedDict()
+        self._geometry_shading_groups = OrderedDict()
+        self._geometry_shaders = OrderedDict()
+        self._shading_group_shaders = OrderedDict()
+        self._shading_group_geometries = OrderedDict()
+        self._shader_geometries = OrderedDict()
+        self._shader_shading_groups = OrderedDict()
+
+        for geometry, shading_groups in self._data.items():
+            for shading_group, shaders_list in shading_groups.items():
+                self._add_relation(geometry, shading_group, shaders_list)
+
+    def __len__(self):
+        return len(self._geometry_shading_groups)
+
+    def __contains__(self, geometry):
+        return geometry in self._geometry_shading_groups
+
+    @property
+    def data(self):
+        """
+        Returns mapping data used to create this mapping
+        Data is shared with the mapping indexes (and with all the users of cached mappings), so it must not be modified
+        :return: dict
+        """
+
+        return self._data
+
+    @classmethod
+    def from_relations(cls, relations):
+        """
+        Creates a new mapping from the given relations
+        :param relations: iterable(tuple(str, str, str)), list of (geometry, shading group, shader) relations
+        :return: ShaderMapping
+        """
+
+        data = OrderedDict()
+        for geometry, shading_group, shader in relations:
+            shaders_list = data.setdefault(geometry, OrderedDict()).setdefault(shading_group, list())
+            if shader is not None:
+                shaders_list.append(shader)
+
+        return cls(data)
+
+    def iter_relations(self):
+        """
+        Generator that returns all the relations of the mapping
+        Shading groups without shaders are returned with a None shader
+        :return: generator(tuple(str, str, str))
+        """
+
+        for geometry, shading_groups in self._data.items():
+            for shading_group, shaders_list in shading_groups.items():
+                if not shaders_list:
+                    yield geometry, shading_group, None
+                for shader in shaders_list:
+                    yield geometry, shading_group, shader
+
+    def get_geometries(self):
+        """
+        Returns all the geometries of the mapping
+        :return: list(str)
+        """
+
+        return list(self._geometry_shading_groups)
+
+    def get_shading_groups(self):
+        """
+        Returns all the shading groups of the mapping
+        :return: list(str)
+        """
+
+        return list(self._shading_group_shaders)
+
+    def get_shaders(self):
+        """
+        Returns all the shaders of the mapping
+        :return: list(str)
+        """
+
+        return list(self._shaders)
+
+    def get_geometry_shading_groups(self, geometry):
+        """
+        Returns shading groups assigned to the given geometry
+        :param geometry: str
+        :return: list(str)
+        """
+
+        return list(self._geometry_shading_groups.get(geometry, ()))
+
+    def get_geometry_shaders(self, geometry):
+        """
+        Returns shaders assigned to the given geometry
+        :param geometry: str
+        :return: list(str)
+        """
+
+        return list(self._geometry_shaders.get(geometry, ()))
+
+    def get_shading_group_shaders(self, shading_group):
+        """
+        Returns shaders connected to the given shading group
+        :param shading_group: str
+        :return: list(str)
+        """
+
+        return list(self._shading_group_shaders.get(shading_group, ()))
+
+    def get_shading_group_geometries(self, shading_group):
+        """
+        Returns geometries the given shading group is assigned to
+        :param shading_group: str
+        :return: list(str)
+        """
+
+        return list(self._shading_group_geometries.get(shading_group, ()))
+
+    def get_shader_geometries(self, shader):
+        """
+        Returns geometries the given shader is assigned to
+        :param shader: str
+        :return: list(str)
+        """
+
+        return list(self._shader_geometries.get(shader, ()))
+
+    def get_shader_shading_groups(self, shader):
+        """
+        Returns shading groups the given shader is connected to
+        :param shader: str
+        :return: list(str)
+        """
+
+        return list(self._shader_shading_groups.get(shader, ()))
+
+    def get_shading_geometry_mapping(self):
+        """
+        Returns dictionary that maps each geometry with the shaders assigned to it
+        :return: dict(str, list(str))
+        """
+
+        return dict((geometry, list(shaders)) for geometry, shaders in self._geometry_shaders.items())
+
+    def get_shading_group_geometry_mapping(self):
+        """
+        Returns dictionary that maps each shading group with the geometries it is assigned to
+        :return: OrderedDict(str, list(str))
+        """
+
+        return OrderedDict(
+            (shading_group, list(geometries)) for shading_group, geometries in self._shading_group_geometries.items())
+
+    def get_shading_group_shader_mapping(self):
+        """
+        Returns dictionary that maps each shading group with the shaders connected to it
+        :return: dict(str, list(str))
+        """
+
+        return dict(
+            (shading_group, list(shaders)) for shading_group, shaders in self._shading_group_shaders.items())
+
+    def _add_relation(self, geometry, shading_group, shaders_list):
+        """
+        Internal function that indexes the relation between given geometry, shading group and shaders
+        :param geometry: str
+        :param shading_group: str
+        :param shaders_list: list(str)
+        """
+
+        self._geometry_shading_groups.setdefault(geometry, OrderedDict())[shading_group] = None
+        geometry_shaders = self._geometry_shaders.setdefault(geometry, OrderedDict())
+        shading_group_shaders = self._shading_group_shaders.setdefault(shading_group, OrderedDict())
+        self._shading_group_geometries.setdefault(shading_group, OrderedDict())[geometry] = None
+        for shader in shaders_list or list():
+            self._shaders[shader] = None
+            geometry_shaders[shader] = None
+            shading_group_shaders[shader] = None
+            self._shader_geometries.setdefault(shader, OrderedDict())[geometry] = None
+            self._shader_shading_groups.setdefault(shader, OrderedDict())[shading_group] = None
+
+
+def get_selection_expression(geometries):
+    """
+    Returns the renderer selection expression (Arnold operators syntax) that matches all the given geometries
+    DAG paths are converted to procedural object paths without namespaces, so the expression matches the objects of
+    a GPU cache or standin no matter the namespace the asset was exported with
+    :param geometries: list(str), DAG paths of the geometries
+    :return: str
+    """
+
+    object_paths = OrderedDict()
+    for geometry in geometries:
+        nodes = [node.split(':')[-1] for node in geometry.split('|') if node]
+        if nodes:
+            object_paths['*/{}'.format('/'.join(nodes))] = None
+
+    return ' or '.join(object_paths)
+
+
+def load_shader_mapping_file(file_path):
+    """
+    Loads given shader mapping file from disk. Both JSON and compact shader mapping files are supported
+    :param file_path: str
+    :return: ShaderMapping
+    """
+
+    with open(file_path, 'rb') as fh:
+        is_compact = fh.read(len(COMPACT_FORMAT_MAGIC)) == COMPACT_FORMAT_MAGIC
+    if is_compact:
+        return load_compact_shader_mapping_file(file_path)
+
+    with open(file_path, 'r') as fh:
+        return ShaderMapping(json.load(fh, object_pairs_hook=OrderedDict))
+
+
+def write_shader_mapping_file(file_path, data):
+    """
+    Writes given mapping data into a compact shader mapping file
+    Compact files store each name once in a string table and relations as triplets of uint32 indexes. DAG paths
+    are stored as their parent path index plus their leaf name, so shared parent paths are only stored once:
+
+        magic (6 bytes) | version (uint16) | strings count (uint32) | relations count (uint32)
+        string parents (uint32 x strings count) | string offsets (uint32 x strings count + 1)
+        relations (uint32 x 3 x relations count) | UTF-8 leaf names
+
+    :param file_path: str
+    :param data: dict or ShaderMapping, mapping data ({geometry: {shading_group: [shaders]}})
+    :return: str
+    """
+
+    mapping = data if isinstance(data, ShaderMapping) else ShaderMapping(data)
+
+    strings = OrderedDict()
+
+    def _intern(name):
+        if name is None:
+            return COMPACT_FORMAT_NO_SHADER
+        if name not in strings:
+            parent_index, leaf = COMPACT_FORMAT_NO_SHADER, name
+            separator_index = name.rfind('|')
+            if separator_index > 0:
+                parent_index, leaf = _intern(name[:separator_index]), name[separator_index + 1:]
+            strings[name] = (len(strings), parent_index, leaf)
+        return strings[name][0]
+
+    relations = list()
+    for relation in mapping.iter_relations():
+        relations.extend([_intern(name) for name in relation])
+
+    table = list(strings.values())
+    parents = [parent_index for _, parent_index, _ in table]
+    encoded_leaves = [leaf.encode('utf-8') for _, _, leaf in table]
+    offsets = [0]
+    for encoded_leaf in encoded_leaves:
+        offsets.append(offsets[-1] + len(encoded_leaf))
+
+    with open(file_path, 'wb') as fh:
+        fh.write(COMPACT_FORMAT_MAGIC)
+        fh.write(struct.pack('<HII', COMPACT_FORMAT_VERSION, len(table), len(relations) // 3))
+        fh.write(struct.pack('<{}I'.format(len(parents)), *parents))
+        fh.write(struct.pack('<{}I'.format(len(offsets)), *offsets))
+        fh.write(struct.pack('<{}I'.format(len(relations)), *relations))
+        fh.write(b''.join(encoded_leaves))
+
+    return file_path
+
+
+def replace_shader_mapping_file(source_path, file_path):
+    """
+    Replaces given shader mapping file with the given (already written) source file
+    Source file should be in the same folder as the file to replace, so the file is replaced with a rename and
+    readers never find a partially written mapping file
+    :param source_path: str
+    :param file_path: str
+    :return: str
+    """
+
+    if os.path.isfile(file_path):
+        try:
+            os.rename(source_path, file_path)
+        except OSError:
+            # Windows does not allow to rename a file over an existing one
+            os.remove(file_path)
+            os.rename(source_path, file_path)
+    else:
+        os.rename(source_path, file_path)
+
+    get_cache().invalidate(file_path)
+
+    return file_path
+
+
+def update_shader_mapping_file(file_path, data, lock_fn=None, unlock_fn=None):
+    """
+    Updates given shader mapping file with the given mapping data
+    New mapping is compared against the one stored in the file, so the file is not written if nothing changed.
+    Otherwise, the new mapping is written into a temporary file and the file is only locked while the temporary file
+    replaces it. Empty mappings are never written, so a failed shaders collection does not wipe a valid file
+    :param file_path: str
+    :param data: dict or ShaderMapping, mapping data ({geometry: {shading_group: [shaders]}})
+    :param lock_fn: fn or None, function called with the file path before replacing an existing file
+    :param unlock_fn: fn or None, function called with the file path after replacing an existing file
+    :return: OrderedDict or None, {'added', 'removed', 'changed'} geometries of the updated mapping
+    """
+
+    if not data:
+        LOGGER.warning('No shaders mapping to export into "{}". Skip exporting ...'.format(file_path))
+        return None
+
+    file_exists = os.path.isfile(file_path)
+    old_mapping = ShaderMapping()
+    if file_exists:
+        try:
+            old_mapping = get_cache().get_mapping(file_path)
+        except Exception as exc:
+            LOGGER.warning('Impossible to read Shaders Mapping File "{}". It will be overwritten | {}'.format(
+                file_path, exc))
+
+    mapping_diff = diff_shader_mappings(old_mapping, data)
+    if file_exists and not any(mapping_diff.values()):
+        LOGGER.info('Shaders Mapping File "{}" is up to date. Skip exporting ...'.format(file_path))
+        return mapping_diff
+
+    temp_path = '{}.{}.tmp'.format(file_path, os.getpid())
+    try:
+        write_shader_mapping_file(temp_path, data)
+        if file_exists and lock_fn:
+            lock_fn(file_path)
+        try:
+            replace_shader_mapping_file(temp_path, file_path)
+        finally:
+            if file_exists and unlock_fn:
+                unlock_fn(file_path)
+    except Exception as exc:
+        LOGGER.error('Error while exporting Shaders Mapping File "{}" | {}'.format(file_path, exc))
+        return None
+    finally:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+
+    LOGGER.info('Shaders Mapping File "{}" updated: {} added, {} removed and {} changed geometries'.format(
+        file_path, len(mapping_diff['added']), len(mapping_diff['removed']), len(mapping_diff['changed'])))
+
+    return mapping_diff
+
+
+def diff_shader_mappings(old_data, new_data):
+    """
+    Returns the geometries whose shading changed between the given mappings
+    :param old_data: dict or ShaderMapping, mapping data ({geometry: {shading_group: [shaders]}})
+    :param new_data: dict or ShaderMapping, mapping data ({geometry: {shading_group: [shaders]}})
+    :return: OrderedDict, {'added': list(str), 'removed': list(str), 'changed': list(str)}
+    """
+
+    old_data = old_data.data if isinstance(old_data, ShaderMapping) else old_data or dict()
+    new_data = new_data.data if isinstance(new_data, ShaderMapping) else new_data or dict()
+
+    def _get_shading(shading_groups):
+        return dict((shading_group, list(shaders or list())) for shading_group, shaders in shading_groups.items())
+
+    mapping_diff = OrderedDict([('added', list()), ('removed', list()), ('changed', list())])
+    for geometry, shading_groups in new_data.items():
+        if geometry not in old_data:
+            mapping_diff['added'].append(geometry)
+        elif _get_shading(shading_groups) != _get_shading(old_data[geometry]):
+            mapping_diff['changed'].append(geometry)
+    mapping_diff['removed'] = [geometry for geometry in old_data if geometry not in new_data]
+
+    return mapping_diff
+
+
+def load_compact_shader_mapping_file(file_path):
+    """
+    Loads given compact shader mapping file
+    Mappings index all their relations when they are created, so the whole file is read and decoded at once. Each
+    string of the string table is only decoded once, no matter how many relations (or child DAG paths) reference it
+    :param file_path: str
+    :return: ShaderMapping
+    """
+
+    with open(file_path, 'rb') as fh:
+        file_data = fh.read()
+
+    offset = len(COMPACT_FORMAT_MAGIC)
+    version, strings_count, relations_count = struct.unpack_from('<HII', file_data, offset)
+    if version > COMPACT_FORMAT_VERSION:
+        raise ValueError('Shader mapping file "{}" version {} is not supported'.format(file_path, version))
+    offset += struct.calcsize('<HII')
+    parents = struct.unpack_from('<{}I'.format(strings_count), file_data, offset)
+    offset += strings_count * 4
+    string_offsets = struct.unpack_from('<{}I'.format(strings_count + 1), file_data, offset)
+    offset += (strings_count + 1) * 4
+    relations = struct.unpack_from('<{}I'.format(relations_count * 3), file_data, offset)
+    strings_offset = offset + relations_count * 3 * 4
+
+    decoded_strings = dict()
+
+    def _get_string(index):
+        if index == COMPACT_FORMAT_NO_SHADER:
+            return None
+        if index not in decoded_strings:
+            leaf = file_data[
+                strings_offset + string_offsets[index]:strings_offset + string_offsets[index + 1]].decode('utf-8')
+            parent = _get_string(parents[index])
+            decoded_strings[index] = leaf if parent is None else '{}|{}'.format(parent, leaf)
+        return decoded_strings[index]
+
+    return ShaderMapping.from_relations(
+        (_get_string(relations[i]), _get_string(relations[i + 1]), _get_string(relations[i + 2]))
+        for i in range(0, len(relations), 3))
+
+
+class ShaderMappingCache(object):
+    """
+    Class that caches loaded shader mapping files so each file is only loaded from disk once per process
+    Entries are keyed by resolved path, modification time and size, so modified files are loaded again.
+    Least recently used entries are evicted when the maximum number of entries or the memory cap is reached
+    Cached mappings are shared by all their users and must not be modified
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_MAX_ENTRIES, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        super(ShaderMappingCache, self).__init__()
+
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """
+        Returns estimated memory (in bytes) used by the cached mappings
+        :return: int
+        """
+
+        return self._size
+
+    def get_stats(self):
+        """
+        Returns cache statistics
+        :return: dict
+        """
+
+        return {
+            'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'size': self._size,
+            'max_entries': self._max_entries, 'max_bytes': self._max_bytes}
+
+    def get_mapping(self, file_path, loader=None):
+        """
+        Returns shader mapping of the given file, loading it from disk only if it is not cached or it was modified
+        :param file_path: str
+        :param loader: fn or None, function that loads a file path into a ShaderMapping
+        :return: ShaderMapping
+        """
+
+        resolved_path = os.path.normcase(os.path.realpath(file_path))
+        file_stat = os.stat(resolved_path)
+        key = (file_stat.st_mtime, file_stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(resolved_path, None)
+            if entry and entry[0] == key:
+                self.hits += 1
+                self._entries.pop(resolved_path)
+                self._entries[resolved_path] = entry
+                return entry[1]
+            self.misses += 1
+
+        mapping = (loader or load_shader_mapping_file)(resolved_path)
+        entry_size = file_stat.st_size * MEMORY_FILE_SIZE_RATIO
+
+        with self._lock:
+            old_entry = self._entries.pop(resolved_path, None)
+            if old_entry:
+                self._size -= old_entry[2]
+            if entry_size <= self._max_bytes:
+                self._entries[resolved_path] = (key, mapping, entry_size)
+                self._size += entry_size
+            while self._entries and (len(self._entries) > self._max_entries or self._size > self._max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+        return mapping
+
+    def invalidate(self, file_path=None):
+        """
+        Removes given file from the cache. If no file is given, the whole cache is cleared
+        :param file_path: str or None
+        """
+
+        with self._lock:
+            if file_path is None:
+                self._entries.clear()
+                self._size = 0
+                return
+            entry = self._entries.pop(os.path.normcase(os.path.realpath(file_path)), None)
+            if entry:
+                self._size -= entry[2]
+
+    def reset_stats(self):
+        """
+        Resets hit and miss counters
+        """
+
+        self.hits = self.misses = 0
+
+
+_CACHE = ShaderMappingCache()
+
+
+def get_cache():
+    """
+    Returns shader mapping cache shared by the whole process
+    :return: ShaderMappingCache
+    """
+
+    return _CACHE
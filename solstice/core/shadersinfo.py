@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains functions to store and parse the shaders info of tag nodes
+"""
+
+from __future__ import print_function, division, absolute_import
+
+__author__ = "Tomas Poveda"
+__license__ = "MIT"
+__maintainer__ = "Tomas Poveda"
+__email__ = "tpovedatd@gmail.com"
+
+import ast
+import json
+import logging
+
+LOGGER = logging.getLogger()
+
+# Defines the version of the shaders info stored in tag nodes
+SHADERS_INFO_SCHEMA_VERSION = 1
+
+# Defines the maximum number of parsed shaders info that are cached
+SHADERS_INFO_CACHE_MAX_ENTRIES = 4096
+
+_SHADERS_INFO_CACHE = dict()
+
+
+def encode_shaders_info(shaders_dict):
+    """
+    Returns the string that should be stored in the shaders attribute of a tag node
+    :param shaders_dict: dict
+    :return: str
+    """
+
+    return json.dumps(
+        {'version': SHADERS_INFO_SCHEMA_VERSION, 'shaders': shaders_dict}, sort_keys=True, separators=(',', ':'))
+
+
+def decode_shaders_info(shaders_info):
+    """
+    Parses given shaders info string. Both versioned JSON and legacy (Python repr) shaders info are supported
+    :param shaders_info: str
+    :return: dict or None
+    """
+
+    if not shaders_info:
+        return None
+
+    try:
+        shaders_dict = json.loads(shaders_info)
+    except ValueError:
+        # Legacy shaders info was stored with the Python representation of the shaders dictionary
+        try:
+            shaders_dict = ast.literal_eval(shaders_info.replace("'", "\""))
+        except (ValueError, TypeError, SyntaxError):
+            return None
+    except TypeError:
+        return None
+    else:
+        if isinstance(shaders_dict, dict) and 'version' in shaders_dict and 'shaders' in shaders_dict:
+            if not isinstance(shaders_dict['version'], int) or shaders_dict['version'] > SHADERS_INFO_SCHEMA_VERSION:
+                LOGGER.warning('Shaders info version {} is not supported'.format(shaders_dict['version']))
+                return None
+            shaders_dict = shaders_dict['shaders']
+
+    if not isinstance(shaders_dict, dict):
+        return None
+
+    return shaders_dict
+
+
+def get_shaders_info(node, shaders_info):
+    """
+    Returns parsed shaders info of the given node
+    Parsed shaders info is cached by node and shaders info, so reading an unchanged tag node again is a dictionary
+    lookup
+    :param node: str
+    :param shaders_info: str
+    :return: dict or None
+    """
+
+    key = (node, shaders_info)
+    try:
+        if key in _SHADERS_INFO_CACHE:
+            return _SHADERS_INFO_CACHE[key]
+    except TypeError:
+        # Shaders info that cannot be hashed is not cached
+        return decode_shaders_info(shaders_info)
+
+    shaders_dict = decode_shaders_info(shaders_info)
+    if len(_SHADERS_INFO_CACHE) >= SHADERS_INFO_CACHE_MAX_ENTRIES:
+        _SHADERS_INFO_CACHE.clear()
+    _SHADERS_INFO_CACHE[key] = shaders_dict
+
+    return shaders_dict
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains functions to compare the structure of shading networks
+"""
+
+from __future__ import print_function, division, absolute_import
+
+__author__ = "Tomas Poveda"
+__license__ = "MIT"
+__maintainer__ = "Tomas Poveda"
+__email__ = "tpovedatd@gmail.com"
+
+import json
+import hashlib
+import logging
+
+LOGGER = logging.getLogger()
+
+# Defines the version of the structural hashes. Increase it when the hashed description of networks changes
+STRUCTURE_HASH_VERSION = 2
+
+# Defines the attributes that store the members of shading groups. They depend on the assignments of the network and
+# not on its structure, so they are ignored
+SET_MEMBERSHIP_ATTRIBUTES = ('dagSetMembers', 'dnSetMembers', 'groupNodes', 'partition', 'instObjGroups')
+
+# Defines the types of the nodes that are assigned to shading networks (geometry, transforms and component
+# assignment helpers). They are not part of the structure of the network, so they are ignored
+MEMBER_NODE_TYPES = (
+    'transform', 'mesh', 'nurbsSurface', 'nurbsCurve', 'subdiv', 'gpuCache', 'aiStandIn', 'xgmDescription',
+    'pfxHair', 'groupId', 'groupParts')
+
+# Defines the attributes of shading groups that are connected to the shaders of the network. Shading networks are
+# collected starting from the nodes connected to these attributes
+SHADING_GROUP_SHADER_ATTRIBUTES = (
+    'surfaceShader', 'displacementShader', 'volumeShader', 'aiSurfaceShader', 'aiVolumeShader')
+
+
+def get_network_structure_hash(shading_network):
+    """
+    Returns a hash that identifies the structure of the given shading network, ignoring the names of its nodes
+    Two networks with the same node types, attribute values and connections return the same hash even if they
+    were published with different node names, so copies of the same shader can be detected. Assignments of the
+    network are not taken into account (see get_network_structure)
+    :param shading_network: dict, shading network description ({node: {'type', 'attr', 'connection', ...}})
+    :return: str or None
+    """
+
+    shading_network = get_network_structure(shading_network)
+    if not shading_network:
+        return None
+
+    node_hashes = dict()
+    visiting = set()
+
+    def _get_node_hash(node):
+        if node in node_hashes:
+            return node_hashes[node]
+        if node in visiting:
+            # Cyclic networks are not supported by DCCs but we make sure we do not recurse forever
+            return 'cycle'
+        visiting.add(node)
+        node_data = json.dumps(
+            _replace_node_names(shading_network[node]), sort_keys=True, default=str, separators=(',', ':'))
+        visiting.discard(node)
+        node_hashes[node] = hashlib.sha1(node_data.encode('utf-8')).hexdigest()
+        return node_hashes[node]
+
+    def _replace_node_names(value):
+        if isinstance(value, dict):
+            return dict((_replace_node_names(key), _replace_node_names(item)) for key, item in value.items())
+        if isinstance(value, (list, tuple)):
+            return [_replace_node_names(item) for item in value]
+        try:
+            node_name, separator, attribute = value.partition('.')
+        except (AttributeError, TypeError):
+            return value
+        if value in shading_network:
+            return '<{}>'.format(_get_node_hash(value))
+        if separator and node_name in shading_network:
+            return '<{}>.{}'.format(_get_node_hash(node_name), attribute)
+        return value
+
+    network_data = json.dumps(
+        [STRUCTURE_HASH_VERSION, sorted(_get_node_hash(node) for node in shading_network)], separators=(',', ':'))
+
+    return hashlib.sha1(network_data.encode('utf-8')).hexdigest()
+
+
+def get_network_structure(shading_network):
+    """
+    Returns given shading network without the nodes and connections that depend on its assignments
+    Set membership attributes and geometry nodes are removed, and so are the nodes that were only part of the network
+    because they were connected to its geometries (for example, construction history of assigned meshes)
+    :param shading_network: dict, shading network description ({node: {'type', 'attr', 'connection', ...}})
+    :return: dict
+    """
+
+    if not shading_network:
+        return dict()
+
+    network_structure = dict()
+    for node, node_data in shading_network.items():
+        if not isinstance(node_data, dict):
+            network_structure[node] = node_data
+            continue
+        if node_data.get('type', None) in MEMBER_NODE_TYPES:
+            continue
+        node_data = dict(node_data)
+        for key in ('attr', 'connection'):
+            if isinstance(node_data.get(key, None), dict):
+                node_data[key] = dict(
+                    (attribute, value) for attribute, value in node_data[key].items()
+                    if not _is_set_membership_attribute(attribute))
+        network_structure[node] = node_data
+
+    # Only the nodes that are still connected to the shading groups (or to the root nodes if the network has no
+    # shading groups) are part of the structure of the network
+    root_nodes = [
+        node for node, node_data in network_structure.items()
+        if isinstance(node_data, dict) and node_data.get('type', None) == 'shadingEngine']
+    if not root_nodes:
+        return network_structure
+
+    connected_nodes = set()
+    nodes_to_visit = list(root_nodes)
+    while nodes_to_visit:
+        node = nodes_to_visit.pop()
+        if node in connected_nodes:
+            continue
+        connected_nodes.add(node)
+        node_data = network_structure[node]
+        connections = node_data.get('connection', None) if isinstance(node_data, dict) else None
+        for value in (connections or dict()).values():
+            try:
+                source_node = value.partition('.')[0]
+            except (AttributeError, TypeError):
+                continue
+            if source_node in network_structure:
+                nodes_to_visit.append(source_node)
+
+    return dict((node, node_data) for node, node_data in network_structure.items() if node in connected_nodes)
+
+
+def collect_network_nodes(root_nodes, get_source_nodes, get_node_type=None):
+    """
+    Returns all the nodes the given root nodes depend on, walking their source connections
+    Each node is visited only once, so cyclic connections are supported. Nodes assigned to shading networks (see
+    MEMBER_NODE_TYPES) and other shading groups are never walked, so the walk never enters the geometries of the
+    scene or their history
+    :param root_nodes: list(str), nodes the walk starts from (for example, the shaders of a shading group)
+    :param get_source_nodes: fn, function that returns the nodes connected to the inputs of the given node
+    :param get_node_type: fn or None, function that returns the type of the given node
+    :return: list(str), visited nodes, in visit order
+    """
+
+    visited_nodes = list()
+    visited_nodes_set = set()
+    nodes_to_visit = list(reversed(root_nodes or list()))
+    while nodes_to_visit:
+        node = nodes_to_visit.pop()
+        if not node or node in visited_nodes_set:
+            continue
+        visited_nodes_set.add(node)
+        node_type = get_node_type(node) if get_node_type else None
+        if node_type in MEMBER_NODE_TYPES or node_type == 'shadingEngine':
+            continue
+        visited_nodes.append(node)
+        nodes_to_visit.extend(reversed(get_source_nodes(node) or list()))
+
+    return visited_nodes
+
+
+def _is_set_membership_attribute(attribute):
+    """
+    Internal function that returns whether or not given attribute stores the members of a shading group
+    :param attribute: str
+    :return: bool
+    """
+
+    try:
+        attribute_name = attribute.split('.')[0].split('[')[0]
+    except (AttributeError, TypeError):
+        return False
+
+    return attribute_name in SET_MEMBERSHIP_ATTRIBUTES
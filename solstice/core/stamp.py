@@ -0,0 +1,1148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains DCC agnostic utilities used to stamp (burn-in) playblasts and videos
+"""
+
+from __future__ import print_function, division, absolute_import
+
+__author__ = "Tomas Poveda"
+__license__ = "MIT"
+__maintainer__ = "Tomas Poveda"
+__email__ = "tpovedatd@gmail.com"
+
+import os
+import re
+import copy
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import traceback
+import subprocess
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+LOGGER = logging.getLogger()
+
+# Defines the default number of frames rendered by each stamp job
+DEFAULT_CHUNK_SIZE = 16
+
+# Defines the maximum number of stamp jobs that are executed at the same time by default
+DEFAULT_MAX_WORKERS = 4
+
+# Defines the maximum number of frames that are decoded, composited or encoded at the same time by default
+DEFAULT_MAX_IN_FLIGHT_FRAMES = 32
+
+# Defines the maximum ratio of frames of a stamp that can be replaced by its closest valid frame by default. If more
+# frames fail, the stamp fails
+DEFAULT_MAX_MISSING_FRAMES_RATIO = 0.05
+
+# Defines the extensions of the files that are stamped as videos (instead of image sequences)
+VIDEO_EXTENSIONS = ['.mov', '.mp4', '.avi', '.mkv', '.webm']
+
+
+class ChunkResult(object):
+    """
+    Class that stores the result of the execution of a chunk of stamp work
+    """
+
+    def __init__(self, index, items, result=None, error=None):
+        super(ChunkResult, self).__init__()
+
+        self.index = index
+        self.items = items
+        self.result = result
+        self.error = error
+
+    @property
+    def success(self):
+        """
+        Returns whether the chunk was executed without errors or not
+        :return: bool
+        """
+
+        return self.error is None
+
+
+def get_workers_count(workers=None):
+    """
+    Returns the number of workers that should be used to execute stamp jobs
+    :param workers: int or None, number of workers requested. If None, default number of workers is used
+    :return: int
+    """
+
+    try:
+        cpu_count = multiprocessing.cpu_count()
+    except NotImplementedError:
+        cpu_count = 1
+
+    if workers is None:
+        workers = min(DEFAULT_MAX_WORKERS, max(1, cpu_count - 1))
+
+    return max(1, min(int(workers), cpu_count))
+
+
+def split_workers(workers, jobs_count):
+    """
+    Splits the given workers between the jobs executed at the same time and the chunks of each job, so nested pools
+    (jobs that render their frames in chunks) never run more FFMpeg processes at the same time than given workers
+    :param workers: int or None, number of workers requested. If None, default number of workers is used
+    :param jobs_count: int, number of jobs to execute
+    :return: tuple(int, int), number of jobs executed at the same time and number of workers of each job
+    """
+
+    workers = get_workers_count(workers)
+    jobs_workers = max(1, min(workers, int(jobs_count)))
+
+    return jobs_workers, max(1, workers // jobs_workers)
+
+
+def split_in_chunks(items, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Splits given items in consecutive chunks of the given size
+    :param items: list
+    :param chunk_size: int
+    :return: list(list)
+    """
+
+    items = list(items)
+    chunk_size = max(1, int(chunk_size or DEFAULT_CHUNK_SIZE))
+
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def run_chunks(fn, chunks, workers=None):
+    """
+    Executes given function for each one of the given chunks using a bounded pool of workers
+    Results are returned in the same order chunks were given and an error in a chunk does not stop the others
+    Stamp jobs spend their time waiting for FFMpeg processes, so a pool of threads is enough to keep a bounded
+    number of FFMpeg processes working in parallel without spawning new DCC processes
+    :param fn: fn, function that receives a chunk and returns its result
+    :param chunks: list(list)
+    :param workers: int or None
+    :return: list(ChunkResult)
+    """
+
+    def _run_chunk(chunk_data):
+        chunk_index, chunk_items = chunk_data
+        try:
+            return ChunkResult(chunk_index, chunk_items, result=fn(chunk_items))
+        except Exception as exc:
+            LOGGER.error('Error while executing stamp chunk {} | {} | {}'.format(
+                chunk_index, exc, traceback.format_exc()))
+            return ChunkResult(chunk_index, chunk_items, error=exc)
+
+    chunks = list(enumerate(chunks))
+    if not chunks:
+        return list()
+
+    workers = min(get_workers_count(workers), len(chunks))
+    if workers <= 1:
+        return [_run_chunk(chunk) for chunk in chunks]
+
+    pool = ThreadPool(workers)
+    try:
+        return list(pool.imap(_run_chunk, chunks))
+    finally:
+        pool.close()
+        pool.join()
+
+
+class StampJobResult(object):
+    """
+    Class that stores the result of a stamp job of a batch
+    """
+
+    def __init__(self, source, output, result=None, error=None, elapsed=0.0):
+        super(StampJobResult, self).__init__()
+
+        self.source = source
+        self.output = output
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def success(self):
+        """
+        Returns whether the job stamped its output or not
+        :return: bool
+        """
+
+        return self.error is None and bool(self.result)
+
+    def as_dict(self):
+        """
+        Returns a dictionary with the result of the job, used to report batch results
+        :return: dict
+        """
+
+        return {
+            'source': self.source, 'output': self.output, 'success': self.success,
+            'error': str(self.error) if self.error is not None else None, 'elapsed': round(self.elapsed, 3)}
+
+
+def is_video_file(file_path):
+    """
+    Returns whether given file is stamped as a video or as an image sequence
+    :param file_path: str
+    :return: bool
+    """
+
+    return os.path.splitext(file_path or '')[-1].lower() in VIDEO_EXTENSIONS
+
+
+class StampModes(object):
+    """
+    Class that defines the different modes that can be used to stamp an image sequence
+    """
+
+    FILTERGRAPH = 'filtergraph'     # Image sequence is stamped and encoded in a single FFMpeg pass
+    FRAMES = 'frames'               # Each frame is stamped into an intermediate image before encoding
+    NUMPY = 'numpy'                 # Frames are composited in memory with NumPy and piped into a single encoder
+
+
+class StampError(Exception):
+    """
+    Exception raised when a FFMpeg stamp process fails
+    """
+
+    pass
+
+
+class StampText(object):
+    """
+    Class that defines a text drawn in a stamp layout
+    Text position is the position of the left end of its baseline (see get_text_y)
+    """
+
+    def __init__(self, text, x=0, y=0):
+        super(StampText, self).__init__()
+
+        self.text = str(text)
+        self.x = int(x)
+        self.y = int(y)
+
+
+class StampLayout(object):
+    """
+    Class that stores all the values needed to stamp a sequence of frames
+    Layout is computed once per stamp job and shared by all the frames of the job
+    """
+
+    def __init__(self, source_width, source_height, **kwargs):
+        super(StampLayout, self).__init__()
+
+        self.source_width = int(source_width)
+        self.source_height = int(source_height)
+        self.top_band = kwargs.get('top_band', None)
+        self.top_band_height = int(kwargs.get('top_band_height', 0))
+        self.bottom_band = kwargs.get('bottom_band', None)
+        self.bottom_band_height = int(kwargs.get('bottom_band_height', 0))
+        self.background_color = kwargs.get('background_color', (92, 92, 92))
+        self.font_file = kwargs.get('font_file', None)
+        self.font_family = kwargs.get('font_family', None)
+        self.font_size = int(kwargs.get('font_size', 32))
+        self.font_color = kwargs.get('font_color', 'white')
+        self.texts = kwargs.get('texts', None) or list()
+        self.frame_text_position = kwargs.get('frame_text_position', (0, 0))
+        self.start_frame = int(float(kwargs.get('start_frame', 0) or 0))
+        self.fps = kwargs.get('fps', 24)
+        self.framecode = kwargs.get('framecode', '00:00:00:00')
+        self.timecode_text = kwargs.get('timecode_text', 'Time: ')
+        self.timecode_position = kwargs.get('timecode_position', (0, 0))
+        self.static_layer = kwargs.get('static_layer', None)
+        self.empty_frame = kwargs.get('empty_frame', None)
+        self.glyph_atlas = kwargs.get('glyph_atlas', None)
+        self.frames_count = kwargs.get('frames_count', None)
+        self.temp_dir = kwargs.get('temp_dir', None)
+
+    @property
+    def width(self):
+        """
+        Returns width of the stamped frames
+        :return: int
+        """
+
+        return self.source_width
+
+    @property
+    def height(self):
+        """
+        Returns height of the stamped frames
+        :return: int
+        """
+
+        return self.source_height + self.top_band_height + self.bottom_band_height
+
+    def get_frame_text(self, frame_index):
+        """
+        Returns frame counter text for the given frame index of the sequence
+        :param frame_index: int
+        :return: str
+        """
+
+        return '{} ({})'.format(self.start_frame + frame_index, frame_index + 1)
+
+
+def get_timecode_text(layout, frame_index):
+    """
+    Returns timecode text drawn in the given frame index of the sequence
+    Matches the text drawn by the FFMpeg drawtext timecode option
+    :param layout: StampLayout
+    :param frame_index: int
+    :return: str
+    """
+
+    rate = int(round(float(layout.fps))) or 1
+    hours, minutes, seconds, frames = [int(value) for value in re.split('[:;.]', layout.framecode)]
+    total_frames = (((hours * 60) + minutes) * 60 + seconds) * rate + frames + frame_index
+    frames = total_frames % rate
+    total_seconds = total_frames // rate
+
+    return '{}{:02d}:{:02d}:{:02d}:{:02d}'.format(
+        layout.timecode_text, (total_seconds // 3600) % 24, (total_seconds // 60) % 60, total_seconds % 60, frames)
+
+
+def find_ffmpeg_executable(ffmpeg_executable=None):
+    """
+    Returns path of the FFMpeg executable to use. If given executable is not valid, PATH is searched
+    :param ffmpeg_executable: str or None
+    :return: str or None
+    """
+
+    if ffmpeg_executable and os.path.isfile(ffmpeg_executable):
+        return ffmpeg_executable
+
+    try:
+        from shutil import which
+    except ImportError:
+        from distutils.spawn import find_executable as which
+
+    return which('ffmpeg')
+
+
+def find_ffprobe_executable(ffmpeg_executable=None):
+    """
+    Returns path of the FFProbe executable to use. FFProbe located next to FFMpeg executable is used if possible
+    :param ffmpeg_executable: str or None
+    :return: str or None
+    """
+
+    ffmpeg_executable = find_ffmpeg_executable(ffmpeg_executable)
+    if ffmpeg_executable:
+        ffmpeg_dir, ffmpeg_name = os.path.split(ffmpeg_executable)
+        ffprobe_executable = os.path.join(ffmpeg_dir, ffmpeg_name.replace('ffmpeg', 'ffprobe'))
+        if ffprobe_executable != ffmpeg_executable and os.path.isfile(ffprobe_executable):
+            return ffprobe_executable
+
+    try:
+        from shutil import which
+    except ImportError:
+        from distutils.spawn import find_executable as which
+
+    return which('ffprobe')
+
+
+def probe_video(video_path, ffmpeg_executable=None):
+    """
+    Returns resolution, frame rate and number of frames (None if unknown) of the first video stream of the given
+    video file
+    :param video_path: str
+    :param ffmpeg_executable: str or None
+    :return: dict
+    """
+
+    ffprobe_executable = find_ffprobe_executable(ffmpeg_executable)
+    if ffprobe_executable:
+        process = subprocess.Popen([
+            ffprobe_executable, '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height,r_frame_rate,nb_frames,duration', '-of', 'json', video_path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        if process.returncode != 0:
+            raise StampError('Impossible to probe video "{}": {}'.format(video_path, err.decode('utf-8', 'replace')))
+        streams = json.loads(out.decode('utf-8')).get('streams', None)
+        if not streams:
+            raise StampError('No video stream found in "{}"'.format(video_path))
+        rate_num, _, rate_den = streams[0].get('r_frame_rate', '24/1').partition('/')
+        fps = float(rate_num) / float(rate_den or 1)
+        frames = streams[0].get('nb_frames', None)
+        if frames and str(frames).isdigit():
+            frames = int(frames)
+        elif streams[0].get('duration', None) not in (None, 'N/A'):
+            frames = int(round(float(streams[0]['duration']) * fps))
+        else:
+            frames = None
+        return {'width': int(streams[0]['width']), 'height': int(streams[0]['height']), 'fps': fps, 'frames': frames}
+
+    # If FFProbe is not available we parse the information FFMpeg prints for the given input
+    ffmpeg_executable = find_ffmpeg_executable(ffmpeg_executable)
+    if not ffmpeg_executable:
+        raise StampError('No FFMpeg executable found!')
+    process = subprocess.Popen(
+        [ffmpeg_executable, '-hide_banner', '-i', video_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate()
+    err = err.decode('utf-8', 'replace')
+    video_match = re.search(r'Video:.*?, (\d{2,})x(\d{2,}).*?, ([\d.]+) (?:fps|tbr)', err)
+    if not video_match:
+        raise StampError('No video stream found in "{}"'.format(video_path))
+    fps = float(video_match.group(3))
+    frames = None
+    duration_match = re.search(r'Duration: (\d+):(\d+):([\d.]+)', err)
+    if duration_match:
+        hours, minutes, seconds = duration_match.groups()
+        frames = int(round(((int(hours) * 60 + int(minutes)) * 60 + float(seconds)) * fps))
+
+    return {'width': int(video_match.group(1)), 'height': int(video_match.group(2)), 'fps': fps, 'frames': frames}
+
+
+def escape_filter_option(value):
+    """
+    Escapes given value so it can be used as a FFMpeg filter option value
+    :param value: variant
+    :return: str
+    """
+
+    value = str(value)
+    for char in ('\\', '\'', ':'):
+        value = value.replace(char, '\\' + char)
+
+    return value
+
+
+def escape_filter_graph(value):
+    """
+    Escapes given filter description so it can be used inside a FFMpeg filter graph
+    :param value: str
+    :return: str
+    """
+
+    for char in ('\\', '\'', '[', ']', ',', ';'):
+        value = value.replace(char, '\\' + char)
+
+    return value
+
+
+def format_filter(filter_name, options=None):
+    """
+    Returns FFMpeg filter description with the given name and options
+    :param filter_name: str
+    :param options: list(tuple(str, variant)), ordered list of options
+    :return: str
+    """
+
+    if not options:
+        return filter_name
+
+    return '{}={}'.format(filter_name, ':'.join(
+        '{}={}'.format(option_name, escape_filter_graph(escape_filter_option(option_value)))
+        for option_name, option_value in options))
+
+
+def format_filter_chain(filters, inputs=None, outputs=None):
+    """
+    Returns a FFMpeg filter chain with the given filters and input/output labels
+    :param filters: list(str)
+    :param inputs: list(str)
+    :param outputs: list(str)
+    :return: str
+    """
+
+    return '{}{}{}'.format(
+        ''.join('[{}]'.format(label) for label in inputs or list()), ','.join(filters),
+        ''.join('[{}]'.format(label) for label in outputs or list()))
+
+
+def format_color(color):
+    """
+    Returns FFMpeg color description of the given RGB color
+    :param color: tuple(int, int, int)
+    :return: str
+    """
+
+    return '0x{:02x}{:02x}{:02x}'.format(*[int(c) for c in color[:3]])
+
+
+def format_font_file(font_file):
+    """
+    Returns font file path in a format that can be used by FFMpeg drawtext filter
+    :param font_file: str
+    :return: str
+    """
+
+    return font_file.replace('\\', '/') if font_file else font_file
+
+
+def get_text_y(y):
+    """
+    Returns drawtext y expression that places the baseline of a text in the given y coordinate
+    drawtext y is the top of the text, and the distance between that top and the baseline depends on the rendered
+    glyphs (and on FFMpeg version), so all the texts of a stamp are positioned by their baseline instead
+    :param y: int
+    :return: str
+    """
+
+    return '{}-ascent'.format(int(y))
+
+
+def draw_text_filter(layout, text, x, y, expand=False):
+    """
+    Returns FFMpeg drawtext filter description to draw given text with the font of the given layout
+    :param layout: StampLayout
+    :param text: str
+    :param x: int or str
+    :param y: int, baseline of the text
+    :param expand: bool, Whether FFMpeg text expansion (%{...} sequences) is enabled or not
+    :return: str
+    """
+
+    options = list()
+    if layout.font_file:
+        options.append(('fontfile', format_font_file(layout.font_file)))
+    options.extend([
+        ('fontsize', layout.font_size), ('fontcolor', layout.font_color), ('x', x), ('y', get_text_y(y)),
+        ('expansion', 'normal' if expand else 'none'), ('text', text)])
+
+    return format_filter('drawtext', options)
+
+
+def frame_counter_filter(layout):
+    """
+    Returns FFMpeg drawtext filter description that draws the frame counter of the given layout
+    :param layout: StampLayout
+    :return: str
+    """
+
+    frame_text = '%{{eif:n+{}:d}} (%{{eif:n+1:d}})'.format(layout.start_frame)
+    x, y = layout.frame_text_position
+
+    return draw_text_filter(layout, frame_text, x, y, expand=True)
+
+
+def timecode_filter(layout):
+    """
+    Returns FFMpeg drawtext filter description that draws the timecode of the given layout
+    :param layout: StampLayout
+    :return: str
+    """
+
+    options = list()
+    if layout.font_file:
+        options.append(('fontfile', format_font_file(layout.font_file)))
+    x, y = layout.timecode_position
+    options.extend([
+        ('fontsize', layout.font_size), ('fontcolor', layout.font_color), ('x', x), ('y', get_text_y(y)),
+        ('text', layout.timecode_text), ('timecode', layout.framecode), ('rate', layout.fps)])
+
+    return format_filter('drawtext', options)
+
+
+def even_dimensions_filter():
+    """
+    Returns FFMpeg filter description that pads frames to even dimensions (needed by H264 encoding)
+    :return: str
+    """
+
+    return 'pad=ceil(iw/2)*2:ceil(ih/2)*2'
+
+
+def build_stamp_filter_graph(layout, source_label='0:v', static_layer_label=None, top_band_label=None,
+                             bottom_band_label=None, output_label='stamped'):
+    """
+    Returns FFMpeg filter graph that stamps the frames of the given input with the given layout
+    If a static layer is given, bands and static texts are not drawn because they are already composited in that
+    layer, so per frame cost does not depend on the number of texts of the layout
+    :param layout: StampLayout
+    :param source_label: str, label of the frames to stamp
+    :param static_layer_label: str or None, label of the precomposited static layer image input
+    :param top_band_label: str or None, label of the top band image input
+    :param bottom_band_label: str or None, label of the bottom band image input
+    :param output_label: str, label of the stamped frames
+    :return: str
+    """
+
+    chains = [format_filter_chain([format_filter('pad', [
+        ('width', layout.width), ('height', layout.height), ('x', 0), ('y', layout.top_band_height),
+        ('color', format_color(layout.background_color))])], inputs=[source_label], outputs=['base'])]
+
+    current_label = 'base'
+    text_filters = list()
+    if static_layer_label:
+        chains.append(format_filter_chain(
+            [format_filter('overlay', [('x', 0), ('y', 0)])],
+            inputs=[current_label, static_layer_label], outputs=['static']))
+        current_label = 'static'
+    else:
+        if top_band_label:
+            chains.append(format_filter_chain(
+                [format_filter('overlay', [('x', 0), ('y', 0)])],
+                inputs=[current_label, top_band_label], outputs=['top']))
+            current_label = 'top'
+        if bottom_band_label:
+            chains.append(format_filter_chain(
+                [format_filter('overlay', [('x', 0), ('y', layout.height - layout.bottom_band_height)])],
+                inputs=[current_label, bottom_band_label], outputs=['bottom']))
+            current_label = 'bottom'
+        text_filters.extend([draw_text_filter(layout, stamp_text.text, stamp_text.x, stamp_text.y)
+                             for stamp_text in layout.texts])
+
+    text_filters.append(frame_counter_filter(layout))
+    text_filters.append(timecode_filter(layout))
+    text_filters.append(even_dimensions_filter())
+    chains.append(format_filter_chain(text_filters, inputs=[current_label], outputs=[output_label]))
+
+    return ';'.join(chains)
+
+
+def get_static_layer_args(layout, file_path):
+    """
+    Returns FFMpeg arguments to render into a transparent image all the elements of the given layout that are the
+    same for all the frames (bands and texts)
+    Texts are drawn with the same drawtext filter used for frame counter and timecode, so all the texts of a stamp
+    share font file, rasterization and baseline. Transparent pixels use the font color, so antialiased text edges
+    keep their color when the layer is composited
+    :param layout: StampLayout
+    :param file_path: str, path of the static layer image
+    :return: list(str)
+    """
+
+    input_args = ['-f', 'lavfi', '-i', ','.join([format_filter('color', [
+        ('color', '{}@0.0'.format(layout.font_color)), ('size', '{}x{}'.format(layout.width, layout.height)),
+        ('duration', 1)]), format_filter('format', [('pix_fmts', 'rgba')])])]
+    chains = list()
+    current_label = '0:v'
+    for band, band_y, band_label in (
+            (layout.top_band, 0, 'top'), (layout.bottom_band, layout.height - layout.bottom_band_height, 'bottom')):
+        if not band:
+            continue
+        input_args.extend(['-i', band])
+        chains.append(format_filter_chain(
+            [format_filter('overlay', [('x', 0), ('y', band_y), ('format', 'rgb')])],
+            inputs=[current_label, '{}:v'.format(input_args.count('-i') - 1)], outputs=[band_label]))
+        current_label = band_label
+    filters = [draw_text_filter(layout, stamp_text.text, stamp_text.x, stamp_text.y) for stamp_text in layout.texts]
+    filters.append(format_filter('format', [('pix_fmts', 'rgba')]))
+    chains.append(format_filter_chain(filters, inputs=[current_label], outputs=['static']))
+
+    return input_args + ['-filter_complex', ';'.join(chains), '-map', '[static]', '-frames:v', '1', file_path]
+
+
+def render_static_layer(layout, file_path, ffmpeg_executable=None):
+    """
+    Renders the static layer of the given layout into the given image file (see get_static_layer_args)
+    :param layout: StampLayout
+    :param file_path: str
+    :param ffmpeg_executable: str or None
+    :return: str
+    """
+
+    run_ffmpeg(get_static_layer_args(layout, file_path), ffmpeg_executable=ffmpeg_executable)
+
+    return file_path
+
+
+def get_image_sequence_input_args(sequence_pattern, start_number=None, fps=24):
+    """
+    Returns FFMpeg arguments to read the given image sequence
+    :param sequence_pattern: str, printf style pattern of the image sequence (image.%04d.png)
+    :param start_number: int or None
+    :param fps: int
+    :return: list(str)
+    """
+
+    input_args = ['-framerate', str(fps)]
+    if start_number is not None:
+        input_args.extend(['-start_number', str(start_number)])
+    input_args.extend(['-i', sequence_pattern])
+
+    return input_args
+
+
+def get_movie_output_args(output_path, label='stamped', fps=24, video_codec='libx264', audio_input=None):
+    """
+    Returns FFMpeg arguments to encode the given label into a movie file
+    :param output_path: str
+    :param label: str
+    :param fps: int
+    :param video_codec: str
+    :param audio_input: int or None, index of the input whose audio (if any) is muxed into the movie
+    :return: list(str)
+    """
+
+    output_args = ['-map', '[{}]'.format(label)]
+    if audio_input is not None:
+        output_args.extend(['-map', '{}:a?'.format(audio_input), '-c:a', 'aac'])
+    output_args.extend(['-c:v', video_codec, '-pix_fmt', 'yuv420p', '-r', str(fps), output_path])
+
+    return output_args
+
+
+def get_ffmpeg_command(args, ffmpeg_executable=None):
+    """
+    Returns command line used to execute FFMpeg with the given arguments
+    :param args: list(str)
+    :param ffmpeg_executable: str or None
+    :return: list(str)
+    """
+
+    ffmpeg_executable = find_ffmpeg_executable(ffmpeg_executable)
+    if not ffmpeg_executable:
+        raise StampError('No FFMpeg executable found!')
+
+    return [ffmpeg_executable, '-y', '-hide_banner', '-loglevel', 'error'] + [str(arg) for arg in args]
+
+
+class OutputTypes(object):
+    """
+    Class that defines the different types of outputs that can be generated from a stamped sequence
+    """
+
+    MOVIE = 'movie'                     # H264 movie (full resolution or scaled proxy)
+    THUMBNAIL = 'thumbnail'             # Still image of a single frame
+    CONTACT_SHEET = 'contact_sheet'     # Still image with a grid of frames sampled along the sequence
+
+
+class OutputSpec(object):
+    """
+    Class that defines an output generated from a stamped sequence
+    Scale is relative to the stamped frames, frame is the index (starting from 0) of the frame used by thumbnails
+    and columns and rows define the grid of contact sheets
+    """
+
+    def __init__(self, output_type, path, **kwargs):
+        super(OutputSpec, self).__init__()
+
+        self.output_type = output_type
+        self.path = path
+        self.scale = float(kwargs.get('scale', 1.0) or 1.0)
+        self.frame = int(kwargs.get('frame', 0) or 0)
+        self.columns = max(1, int(kwargs.get('columns', 4) or 4))
+        self.rows = max(1, int(kwargs.get('rows', 4) or 4))
+
+    @classmethod
+    def from_dict(cls, output_dict):
+        """
+        Creates an output spec from a dictionary: {'type': 'thumbnail', 'path': 'thumb.jpg', 'frame': 10}
+        :param output_dict: dict
+        :return: OutputSpec
+        """
+
+        output_dict = dict(output_dict)
+        output_type = output_dict.pop('type', OutputTypes.MOVIE)
+        output_path = output_dict.pop('path')
+
+        return cls(output_type, output_path, **output_dict)
+
+
+def get_output_specs(output_path, outputs=None):
+    """
+    Returns the output specs of a stamp job. First spec is always the full resolution movie of the given path
+    :param output_path: str, path of the main movie
+    :param outputs: list(OutputSpec or dict) or None, extra outputs to generate from the same stamped frames
+    :return: list(OutputSpec)
+    """
+
+    output_specs = [OutputSpec(OutputTypes.MOVIE, output_path)]
+    for output in outputs or list():
+        output_spec = output if isinstance(output, OutputSpec) else OutputSpec.from_dict(output)
+        if output_spec.path == output_path:
+            continue
+        output_specs.append(output_spec)
+
+    return output_specs
+
+
+def get_partial_output_specs(output_specs):
+    """
+    Returns copies of the given output specs that write into partial files next to their outputs
+    Partial files keep the extension of their outputs, so FFMpeg encodes them with the same format
+    :param output_specs: list(OutputSpec)
+    :return: list(OutputSpec)
+    """
+
+    partial_output_specs = list()
+    for output_spec in output_specs:
+        output_root, output_extension = os.path.splitext(output_spec.path)
+        partial_output_spec = copy.copy(output_spec)
+        partial_output_spec.path = '{}.partial{}{}'.format(output_root, os.getpid(), output_extension)
+        partial_output_specs.append(partial_output_spec)
+
+    return partial_output_specs
+
+
+def commit_partial_outputs(partial_output_specs, output_specs):
+    """
+    Replaces the outputs of the given output specs with their partial files
+    :param partial_output_specs: list(OutputSpec), specs returned by get_partial_output_specs
+    :param output_specs: list(OutputSpec)
+    """
+
+    for partial_output_spec, output_spec in zip(partial_output_specs, output_specs):
+        if not os.path.isfile(partial_output_spec.path):
+            continue
+        if os.path.isfile(output_spec.path):
+            # Windows does not allow to rename a file over an existing one
+            os.remove(output_spec.path)
+        os.rename(partial_output_spec.path, output_spec.path)
+
+
+def discard_partial_outputs(partial_output_specs):
+    """
+    Removes the partial files of the given output specs that were not committed
+    :param partial_output_specs: list(OutputSpec), specs returned by get_partial_output_specs
+    """
+
+    for partial_output_spec in partial_output_specs:
+        if os.path.isfile(partial_output_spec.path):
+            try:
+                os.remove(partial_output_spec.path)
+            except OSError:
+                LOGGER.warning('Impossible to remove partial output: {}'.format(partial_output_spec.path))
+
+
+def scale_filter(scale):
+    """
+    Returns FFMpeg filter description that scales frames by the given factor keeping even dimensions
+    :param scale: float
+    :return: str
+    """
+
+    return format_filter('scale', [
+        ('w', 'trunc(iw*{}/2)*2'.format(scale)), ('h', 'trunc(ih*{}/2)*2'.format(scale))])
+
+
+def get_outputs_args(filter_graph, output_specs, label='stamped', fps=24, audio_input=None, frames_count=None):
+    """
+    Returns FFMpeg arguments that generate all the given outputs from the given label of the given filter graph
+    Stamped frames are split inside the filter graph, so all the outputs are generated from a single decode pass
+    :param filter_graph: str, filter graph that generates the stamped frames
+    :param output_specs: list(OutputSpec)
+    :param label: str, label of the stamped frames in the filter graph
+    :param fps: int
+    :param audio_input: int or None, index of the input whose audio (if any) is muxed into the movies
+    :param frames_count: int or None, number of frames of the sequence. Used to sample contact sheet frames
+    :return: list(str)
+    """
+
+    if len(output_specs) == 1 and output_specs[0].output_type == OutputTypes.MOVIE and output_specs[0].scale == 1.0:
+        return ['-filter_complex', filter_graph] + get_movie_output_args(
+            output_specs[0].path, label=label, fps=fps, audio_input=audio_input)
+
+    split_labels = ['{}{}'.format(label, i) for i in range(len(output_specs))]
+    chains = [filter_graph, format_filter_chain(
+        [format_filter('split', [('outputs', len(output_specs))])], inputs=[label], outputs=split_labels)]
+    output_args = list()
+    for split_label, output_spec in zip(split_labels, output_specs):
+        output_label = '{}_out'.format(split_label)
+        filters = list()
+        if output_spec.output_type == OutputTypes.THUMBNAIL:
+            filters.append(format_filter('select', [('expr', 'eq(n,{})'.format(output_spec.frame))]))
+        elif output_spec.output_type == OutputTypes.CONTACT_SHEET:
+            tiles = output_spec.columns * output_spec.rows
+            step = max(1, -(-int(frames_count) // tiles)) if frames_count else 1
+            filters.append(format_filter('select', [('expr', 'not(mod(n,{}))'.format(step))]))
+        if output_spec.scale != 1.0:
+            filters.append(scale_filter(output_spec.scale))
+        if output_spec.output_type == OutputTypes.CONTACT_SHEET:
+            filters.append(format_filter('tile', [('layout', '{}x{}'.format(output_spec.columns, output_spec.rows))]))
+        if not filters:
+            filters.append('null')
+        chains.append(format_filter_chain(filters, inputs=[split_label], outputs=[output_label]))
+
+        if output_spec.output_type == OutputTypes.MOVIE:
+            output_args.extend(
+                get_movie_output_args(output_spec.path, label=output_label, fps=fps, audio_input=audio_input))
+        else:
+            output_args.extend(['-map', '[{}]'.format(output_label), '-frames:v', '1', '-q:v', '2',
+                                '-update', '1', output_spec.path])
+
+    return ['-filter_complex', ';'.join(chains)] + output_args
+
+
+def run_ffmpeg(args, ffmpeg_executable=None):
+    """
+    Executes FFMpeg with the given arguments
+    :param args: list(str)
+    :param ffmpeg_executable: str or None
+    :return: str, output of the FFMpeg process
+    """
+
+    command = get_ffmpeg_command(args, ffmpeg_executable=ffmpeg_executable)
+    LOGGER.debug('Running FFMpeg: {}'.format(subprocess.list2cmdline(command)))
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    if process.returncode != 0:
+        raise StampError('FFMpeg process failed ({}): {}'.format(process.returncode, err.decode('utf-8', 'replace')))
+
+    return out
+
+
+def pipe_to_ffmpeg(data_items, args, ffmpeg_executable=None):
+    """
+    Executes FFMpeg with the given arguments writing the given data into its stdin
+    Used to encode frames that are generated while the encoder is running (input arguments should read from "-")
+    :param data_items: iterable(bytes), data written in order into FFMpeg stdin (for example, one item per frame)
+    :param args: list(str)
+    :param ffmpeg_executable: str or None
+    :return: int, number of data items written into FFMpeg
+    """
+
+    command = get_ffmpeg_command(args, ffmpeg_executable=ffmpeg_executable)
+    LOGGER.debug('Running FFMpeg: {}'.format(subprocess.list2cmdline(command)))
+
+    items_count = 0
+    with tempfile.TemporaryFile() as error_file:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=error_file, stderr=error_file)
+        try:
+            for data in data_items:
+                process.stdin.write(data)
+                items_count += 1
+        except (IOError, OSError) as exc:
+            LOGGER.warning('FFMpeg process closed its input: {}'.format(exc))
+        finally:
+            try:
+                process.stdin.close()
+            except (IOError, OSError):
+                pass
+            process.wait()
+        if process.returncode != 0:
+            error_file.seek(0)
+            raise StampError('FFMpeg process failed ({}): {}'.format(
+                process.returncode, error_file.read().decode('utf-8', 'replace')))
+
+    return items_count
+
+
+def iter_in_background(items, max_items=DEFAULT_MAX_IN_FLIGHT_FRAMES):
+    """
+    Generator that consumes given iterable in a background thread and yields its items
+    Items are passed through a bounded queue, so the producer never gets more than max_items ahead of the consumer.
+    Chaining this generator between read, composite and encode stages caps the number of frames that are in memory
+    at the same time no matter the length of the sequence
+    Errors raised by the producer are raised again in the consumer thread
+    :param items: iterable
+    :param max_items: int, maximum number of items waiting in the queue
+    :return: generator
+    """
+
+    items_queue = queue.Queue(maxsize=max(1, int(max_items or 1)))
+    stop_event = threading.Event()
+    end_item = object()
+
+    def _put(item):
+        while not stop_event.is_set():
+            try:
+                items_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in items:
+                if not _put((item, None)):
+                    return
+            _put((end_item, None))
+        except Exception as exc:
+            _put((end_item, exc))
+
+    producer = threading.Thread(target=_produce)
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            item, error = items_queue.get()
+            if item is end_item:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop_event.set()
+        producer.join()
+
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """
+    Returns SHA1 hash of the contents of the given file
+    :param file_path: str
+    :param block_size: int
+    :return: str
+    """
+
+    file_hash = hashlib.sha1()
+    with open(file_path, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+def hash_values(*values):
+    """
+    Returns SHA1 hash of the given values
+    :param values: list(variant), JSON serializable values
+    :return: str
+    """
+
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_layout_hash(layout):
+    """
+    Returns a hash that identifies the elements of the given layout that are drawn in each stamped frame
+    :param layout: StampLayout
+    :return: str
+    """
+
+    static_layer_hash = None
+    if layout.static_layer and os.path.isfile(layout.static_layer):
+        static_layer_hash = hash_file(layout.static_layer)
+
+    return hash_values(
+        layout.width, layout.height, layout.top_band_height, layout.bottom_band_height,
+        list(layout.background_color), layout.font_file, layout.font_size, layout.font_color,
+        [(stamp_text.text, stamp_text.x, stamp_text.y) for stamp_text in layout.texts],
+        list(layout.frame_text_position), static_layer_hash)
+
+
+class StampManifest(object):
+    """
+    Class that stores, for each stamped frame, the hash of its source frame and of its overlay, so frames that did
+    not change since last stamp do not need to be stamped again
+    """
+
+    VERSION = 1
+
+    def __init__(self, file_path):
+        super(StampManifest, self).__init__()
+
+        self._file_path = file_path
+        self._frames = dict()
+
+    @property
+    def file_path(self):
+        """
+        Returns path where manifest is stored
+        :return: str
+        """
+
+        return self._file_path
+
+    def load(self):
+        """
+        Loads manifest data from disk. If manifest file is not valid, manifest is empty
+        :return: StampManifest
+        """
+
+        self._frames = dict()
+        if not self._file_path or not os.path.isfile(self._file_path):
+            return self
+
+        try:
+            with open(self._file_path, 'r') as fh:
+                manifest_data = json.load(fh)
+        except Exception as exc:
+            LOGGER.warning('Impossible to read stamp manifest "{}" | {}'.format(self._file_path, exc))
+            return self
+
+        if manifest_data.get('version', None) == self.VERSION:
+            self._frames = manifest_data.get('frames', dict())
+
+        return self
+
+    def save(self):
+        """
+        Stores manifest data into disk
+        """
+
+        with open(self._file_path, 'w') as fh:
+            json.dump({'version': self.VERSION, 'frames': self._frames}, fh, indent=4, sort_keys=True)
+
+    def get_source_hash(self, frame_path):
+        """
+        Returns hash of the contents of the given source frame
+        If the frame size and modification time did not change since last stamp, stored hash is returned
+        :param frame_path: str
+        :return: str
+        """
+
+        frame_stat = os.stat(frame_path)
+        frame_data = self._frames.get(frame_path, None)
+        if frame_data and frame_data.get('size') == frame_stat.st_size and \
+                frame_data.get('mtime') == frame_stat.st_mtime:
+            return frame_data['source_hash']
+
+        return hash_file(frame_path)
+
+    def is_frame_valid(self, frame_path, source_hash, overlay_hash, stamped_frame):
+        """
+        Returns whether stored stamped frame of the given source frame can be reused or not
+        :param frame_path: str, source frame path
+        :param source_hash: str, hash of the source frame contents
+        :param overlay_hash: str, hash of the overlay drawn on top of the frame
+        :param stamped_frame: str, stamped frame path
+        :return: bool
+        """
+
+        frame_data = self._frames.get(frame_path, None)
+        if not frame_data:
+            return False
+
+        return frame_data.get('source_hash') == source_hash and frame_data.get('overlay_hash') == overlay_hash \
+            and frame_data.get('stamped_frame') == stamped_frame and os.path.isfile(stamped_frame)
+
+    def set_frame(self, frame_path, source_hash, overlay_hash, stamped_frame):
+        """
+        Stores stamp info of the given source frame
+        :param frame_path: str
+        :param source_hash: str
+        :param overlay_hash: str
+        :param stamped_frame: str
+        """
+
+        frame_stat = os.stat(frame_path)
+        self._frames[frame_path] = {
+            'source_hash': source_hash, 'overlay_hash': overlay_hash, 'stamped_frame': stamped_frame,
+            'size': frame_stat.st_size, 'mtime': frame_stat.st_mtime}
+
+    def remove_frame(self, frame_path):
+        """
+        Removes stamp info of the given source frame
+        :param frame_path: str
+        """
+
+        self._frames.pop(frame_path, None)
+
+    def clean(self, frame_paths):
+        """
+        Removes stamp info of all frames not included in the given list of frames
+        :param frame_paths: list(str)
+        """
+
+        frame_paths = set(frame_paths)
+        for frame_path in list(self._frames.keys()):
+            if frame_path not in frame_paths:
+                self._frames.pop(frame_path)
+
+
+def build_timecode_filter_graph(layout, source_label='0:v', output_label='stamped'):
+    """
+    Returns FFMpeg filter graph that only draws the timecode of the given layout on already stamped frames
+    :param layout: StampLayout
+    :param source_label: str
+    :param output_label: str
+    :return: str
+    """
+
+    return format_filter_chain(
+        [timecode_filter(layout), even_dimensions_filter()], inputs=[source_label], outputs=[output_label])
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains content addressed cache for shader swatch thumbnails
+"""
+
+from __future__ import print_function, division, absolute_import
+
+__author__ = "Tomas Poveda"
+__license__ = "MIT"
+__maintainer__ = "Tomas Poveda"
+__email__ = "tpovedatd@gmail.com"
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+from solstice.core import shadingnetwork
+
+LOGGER = logging.getLogger()
+
+# Defines the version of the swatch hashes. Increase it to invalidate all the cached swatches
+SWATCH_HASH_VERSION = 2
+
+# Defines the maximum size (in bytes) of the swatch cache folder by default
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Defines the folder where swatches are cached by default
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'solstice', 'swatches')
+
+
+def get_network_hash(shading_network, swatch_size=None):
+    """
+    Returns a hash that identifies the structure of the given shading network
+    Hash is based on the structural hash of the network (see shadingnetwork.get_network_structure_hash), so
+    networks with the same node types, connections and attribute values share their swatches no matter the names of
+    their nodes or the geometries they are assigned to
+    :param shading_network: dict, shading network description ({node: {'type', 'attr', 'connection', ...}})
+    :param swatch_size: int or None, size of the swatch. Swatches of different sizes are cached separately
+    :return: str or None
+    """
+
+    structure_hash = shadingnetwork.get_network_structure_hash(shading_network)
+    if not structure_hash:
+        return None
+
+    network_data = json.dumps([SWATCH_HASH_VERSION, swatch_size, structure_hash], separators=(',', ':'))
+
+    return hashlib.sha1(network_data.encode('utf-8')).hexdigest()
+
+
+class SwatchCache(object):
+    """
+    Class that stores rendered swatches on disk keyed by the hash of their shading network
+    When the cache folder is bigger than its maximum size, least recently used swatches are removed. Size of the
+    cache folder is only computed the first time a swatch is added, and then updated with each added swatch
+    """
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        super(SwatchCache, self).__init__()
+
+        self._cache_path = cache_path
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    @property
+    def cache_path(self):
+        """
+        Returns folder where swatches are cached
+        :return: str
+        """
+
+        return self._cache_path
+
+    def get_swatch_path(self, network_hash):
+        """
+        Returns path where the swatch of the given network hash is stored
+        :param network_hash: str
+        :return: str
+        """
+
+        return os.path.join(self._cache_path, network_hash[:2], '{}.png'.format(network_hash))
+
+    def get(self, network_hash):
+        """
+        Returns cached swatch of the given network hash
+        :param network_hash: str
+        :return: str or None
+        """
+
+        swatch_path = self.get_swatch_path(network_hash)
+        if not os.path.isfile(swatch_path):
+            return None
+
+        # Access time is not reliable in all file systems, so modification time is used to track swatch usage
+        try:
+            os.utime(swatch_path, None)
+        except OSError:
+            pass
+
+        return swatch_path
+
+    def add(self, network_hash, swatch_file):
+        """
+        Stores given swatch file in the cache
+        :param network_hash: str
+        :param swatch_file: str, path of the rendered swatch
+        :return: str or None, path of the cached swatch
+        """
+
+        swatch_path = self.get_swatch_path(network_hash)
+        try:
+            if not os.path.isdir(os.path.dirname(swatch_path)):
+                os.makedirs(os.path.dirname(swatch_path))
+            temp_path = '{}.{}.tmp'.format(swatch_path, os.getpid())
+            shutil.copyfile(swatch_file, temp_path)
+            replaced_size = 0
+            if os.path.isfile(swatch_path):
+                replaced_size = os.path.getsize(swatch_path)
+                os.remove(swatch_path)
+            os.rename(temp_path, swatch_path)
+            added_size = os.path.getsize(swatch_path)
+        except (IOError, OSError) as exc:
+            LOGGER.warning('Impossible to cache swatch "{}" | {}'.format(swatch_file, exc))
+            return None
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._get_swatches()[1]
+            else:
+                self._total_bytes += added_size - replaced_size
+            needs_eviction = self._total_bytes > self._max_bytes
+        if needs_eviction:
+            self.evict()
+
+        return swatch_path
+
+    def evict(self):
+        """
+        Removes least recently used swatches until cache folder size is below its maximum size
+        :return: int, number of removed swatches
+        """
+
+        with self._lock:
+            swatches, total_size = self._get_swatches()
+            removed = 0
+            for _, swatch_size, swatch_path in sorted(swatches):
+                if total_size <= self._max_bytes:
+                    break
+                try:
+                    os.remove(swatch_path)
+                except OSError:
+                    continue
+                total_size -= swatch_size
+                removed += 1
+            self._total_bytes = total_size
+
+        return removed
+
+    def _get_swatches(self):
+        """
+        Internal function that returns all the swatches stored in the cache folder and their total size
+        :return: tuple(list(tuple(float, int, str)), int), (modification time, size, path) of each swatch and size
+            of all of them
+        """
+
+        swatches = list()
+        total_size = 0
+        for root, _, file_names in os.walk(self._cache_path):
+            for file_name in file_names:
+                if not file_name.endswith('.png'):
+                    continue
+                swatch_path = os.path.join(root, file_name)
+                try:
+                    swatch_stat = os.stat(swatch_path)
+                except OSError:
+                    continue
+                swatches.append((swatch_stat.st_mtime, swatch_stat.st_size, swatch_path))
+                total_size += swatch_stat.st_size
+
+        return swatches, total_size
+
+
+_CACHE = SwatchCache()
+
+
+def get_cache():
+    """
+    Returns swatch cache shared by the whole process
+    :return: SwatchCache
+    """
+
+    return _CACHE
@@ -12,7 +12,6 @@ __license__ = "MIT"
 __maintainer__ = "Tomas Poveda"
 __email__ = "tpovedatd@gmail.com"
 
-import ast
 import logging
 
 import tpDcc as tp
@@ -21,6 +20,8 @@ from tpDcc.libs.python import python
 import artellapipe.register
 from artellapipe.core import tag
 
+from solstice.core import shadersinfo
+
 LOGGER = logging.getLogger()
 
 
@@ -85,6 +86,7 @@ class SolsticeTagNode(tag.ArtellaTagNode, object):
     def get_shaders(self):
         """
         Returns shaders info linked to this node
+        Returned dictionary is shared by all the reads of the same shaders info, so it should not be modified
         :return: dict
         """
 
@@ -96,9 +98,8 @@ class SolsticeTagNode(tag.ArtellaTagNode, object):
             if not shaders_info:
                 LOGGER.warning('Impossible retrieve shaders info of node: {}'.format(self._node))
                 return
-            shaders_info_fixed = shaders_info.replace("'", "\"")
-            shaders_dict = ast.literal_eval(shaders_info_fixed)
-            if type(shaders_dict) != dict:
+            shaders_dict = shadersinfo.get_shaders_info(self._node, shaders_info)
+            if shaders_dict is None:
                 LOGGER.error(
                     'Impossible to get dictionary from shaders info. Maybe shaders are not set up properly. '
                     'Please contact TD!')
@@ -109,9 +110,8 @@ class SolsticeTagNode(tag.ArtellaTagNode, object):
                 return None
 
             shaders_attr = tp.Dcc.get_attribute_value(node=self._node, attribute_name='shaders')
-            shaders_attr_fixed = shaders_attr.replace("'", "\"")
-            shaders_dict = ast.literal_eval(shaders_attr_fixed)
-            if type(shaders_dict) != dict:
+            shaders_dict = shadersinfo.get_shaders_info(self._node, shaders_attr)
+            if shaders_dict is None:
                 LOGGER.error(
                     'Impossible to get dictionary from shaders attribute. Maybe shaders are not set up properly. '
                     'Please contact TD!')
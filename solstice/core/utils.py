@@ -17,22 +17,45 @@ import tpDcc as tp
 
 import artellapipe
 
+from solstice.core import sceneindex
+
 LOGGER = logging.getLogger()
 
 
-def get_control(node, rig_control):
+def get_asset_node(node, project=None):
     """
-    Returns main control of the current asset
-    :return: str
+    Returns asset node the given node belongs to
+    Asset node is looked up in the scene asset nodes index. If it is not indexed, it is retrieved through the tag
+    node of the given node
+    :param node: str
+    :param project: ArtellaProject or None
+    :return: ArtellaAssetNode or None
     """
 
-    tag_node = artellapipe.TagsMgr().get_tag_node(project=artellapipe.solstice, node=node)
+    asset_node = sceneindex.get_index().get_asset_node_from_node(node)
+    if asset_node:
+        return asset_node
+
+    tag_node = artellapipe.TagsMgr().get_tag_node(project=project or artellapipe.solstice, node=node)
     if not tag_node:
         return None
     asset_node = tag_node.get_asset_node()
     if not asset_node:
         LOGGER.warning('Tag Data node: {} is not linked to any asset! Aborting operation ...'.format(tag_node))
-        return
+        return None
+
+    return asset_node
+
+
+def get_control(node, rig_control):
+    """
+    Returns main control of the current asset
+    :return: str
+    """
+
+    asset_node = get_asset_node(node)
+    if not asset_node:
+        return None
     node_to_apply_xform = asset_node.node
     attrs = tp.Dcc.list_user_attributes(node_to_apply_xform)
     if attrs and type(attrs) == list:
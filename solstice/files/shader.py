@@ -13,26 +13,601 @@ __maintainer__ = "Tomas Poveda"
 __email__ = "tpovedatd@gmail.com"
 
 import os
-import json
+import copy
+import shutil
 import logging
+import tempfile
+import threading
 import traceback
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 from Qt.QtCore import *
 from Qt.QtWidgets import *
 from Qt.QtGui import *
 
 import tpDcc as tp
+from tpDcc.libs.python import decorators
 from tpDcc.libs.qt.core import qtutils
 
 import artellapipe
 from artellapipe.core import defines, file, assetfile
 from artellapipe.utils import shader
+from artellapipe.libs.artella.core import artellalib
+
+from solstice.core import shadermapping, shadingnetwork, swatches
 
 if tp.is_maya():
-    from tpDcc.dccs.maya.core import shader as maya_shader
+    import tpDcc.dccs.maya as maya
+    from tpDcc.dccs.maya.core import shader as maya_shader, decorators as maya_decorators
+    undo_decorator = maya_decorators.undo_chunk
+    refresh_decorator = maya_decorators.suspend_refresh
+else:
+    undo_decorator = decorators.empty_decorator
+    refresh_decorator = decorators.empty_decorator
 
 LOGGER = logging.getLogger()
 
+# Defines the size (in pixels) of the swatch icons stored with exported shaders
+SWATCH_SIZE = 100
+
+# Defines the maximum number of shader files that are synchronized at the same time
+DEFAULT_PREFETCH_WORKERS = 8
+
+# Artella client calls are not known to be thread safe (Artella tools synchronize files one by one from a single
+# thread), so shader files prefetched by different threads are synchronized one at a time
+_ARTELLA_LOCK = threading.Lock()
+
+# Structural hashes of the shading groups of current scene, computed by get_scene_networks_index
+_SCENE_NETWORKS_HASHES = {'scene': None, 'hashes': dict()}
+
+
+def export_shaders(shader_names, shaders_path, shader_extension, shader_swatches=None, swatch_size=SWATCH_SIZE):
+    """
+    Exports all the given shaders into the given path
+    All swatches are rendered first into uniquely named files of a temporary folder, so exports of different shaders
+    (or of the same shader in different processes) never share swatch files. Shaders whose swatch cannot be rendered
+    are exported with a placeholder icon
+    :param shader_names: list(str), names of the shaders to export
+    :param shaders_path: str, folder where shader files are exported
+    :param shader_extension: str
+    :param shader_swatches: dict(str, QWidget) or None, swatch widgets to use for each shader. Shaders without a
+        given swatch widget will use the swatch generated by the DCC
+    :param swatch_size: int
+    :return: OrderedDict(str, dict), maps each shader with its export result ({'success', 'result', 'error'})
+    """
+
+    export_results = OrderedDict(
+        (shader_name, {'success': False, 'result': None, 'error': None}) for shader_name in shader_names)
+    swatches_path = tempfile.mkdtemp(prefix='solstice_swatches_')
+    try:
+        swatch_files = _render_shader_swatches(
+            shader_names, swatches_path, shader_swatches=shader_swatches, swatch_size=swatch_size)
+        placeholder_swatch = None
+        if any(shader_name not in swatch_files for shader_name in shader_names):
+            placeholder_swatch = _render_placeholder_swatch(swatches_path, swatch_size=swatch_size)
+        for shader_name, export_result in export_results.items():
+            icon_path = swatch_files.get(shader_name, placeholder_swatch)
+            if not icon_path:
+                export_result['error'] = 'No swatch available for shader "{}"'.format(shader_name)
+                LOGGER.error('Impossible to export shader "{}" because it has no swatch'.format(shader_name))
+                continue
+            try:
+                export_result['result'] = shader.ShadingNetwork.write_network(
+                    shader_extension=shader_extension, shaders_path=shaders_path, shaders=[shader_name],
+                    icon_path=icon_path)
+                export_result['success'] = bool(export_result['result'])
+            except Exception as exc:
+                export_result['error'] = str(exc)
+                LOGGER.error('Error while exporting shader "{}": {} | {}'.format(
+                    shader_name, exc, traceback.format_exc()))
+    finally:
+        shutil.rmtree(swatches_path, ignore_errors=True)
+
+    LOGGER.info('Exported {} of {} shaders'.format(
+        len([export_result for export_result in export_results.values() if export_result['success']]),
+        len(export_results)))
+
+    return export_results
+
+
+def get_shader_swatch_file(shader_name, swatch_size=SWATCH_SIZE):
+    """
+    Returns swatch image of the given shader. Swatch is only rendered if its shading network changed since the
+    last time a swatch of the same network was rendered
+    :param shader_name: str
+    :param swatch_size: int
+    :return: str or None
+    """
+
+    swatches_path = tempfile.mkdtemp(prefix='solstice_swatches_')
+    try:
+        swatch_files = _render_shader_swatches([shader_name], swatches_path, swatch_size=swatch_size)
+        swatch_file = swatch_files.get(shader_name, None)
+        if not swatch_file or swatch_file.startswith(swatches_path):
+            return None
+        return swatch_file
+    finally:
+        shutil.rmtree(swatches_path, ignore_errors=True)
+
+
+def _render_placeholder_swatch(swatches_path, swatch_size=SWATCH_SIZE):
+    """
+    Internal function that renders the icon used by the shaders exported without swatch
+    :param swatches_path: str
+    :param swatch_size: int
+    :return: str or None
+    """
+
+    px = QPixmap(QSize(swatch_size, swatch_size))
+    px.fill(QColor(128, 128, 128))
+    swatch_file = os.path.join(swatches_path, 'swatch_placeholder.png')
+    if not px.save(swatch_file):
+        LOGGER.warning('Impossible to save placeholder swatch: {}'.format(swatch_file))
+        return None
+
+    return swatch_file
+
+
+def _get_shader_network_hash(shader_name, swatch_size=SWATCH_SIZE):
+    """
+    Internal function that returns the hash of the shading network of the given shader
+    Only the shader and the nodes it depends on are hashed, so the hash does not depend on the shading groups or
+    geometries the shader is assigned to
+    :param shader_name: str
+    :param swatch_size: int
+    :return: str or None
+    """
+
+    if not tp.is_maya():
+        return None
+
+    try:
+        shading_network = _get_nodes_network([shader_name])
+    except Exception as exc:
+        LOGGER.debug('Impossible to retrieve shading network of shader "{}" | {}'.format(shader_name, exc))
+        return None
+    if not shading_network:
+        return None
+
+    return swatches.get_network_hash(shading_network, swatch_size=swatch_size)
+
+
+def _render_shader_swatches(shader_names, swatches_path, shader_swatches=None, swatch_size=SWATCH_SIZE):
+    """
+    Internal function that renders the swatches of all the given shaders into the given folder
+    Swatches generated by the DCC are cached by the hash of their shading network, so they are only rendered again
+    when the network changes
+    :param shader_names: list(str)
+    :param swatches_path: str
+    :param shader_swatches: dict(str, QWidget) or None
+    :param swatch_size: int
+    :return: dict(str, str), maps each shader with its swatch file. Shaders without swatch are not included
+    """
+
+    shader_swatches = shader_swatches or dict()
+    swatch_cache = swatches.get_cache()
+    swatch_files = dict()
+    for i, shader_name in enumerate(shader_names):
+        network_hash = None
+        shader_swatch = shader_swatches.get(shader_name, None)
+        if not shader_swatch:
+            network_hash = _get_shader_network_hash(shader_name, swatch_size=swatch_size)
+            cached_swatch = swatch_cache.get(network_hash) if network_hash else None
+            if cached_swatch:
+                swatch_files[shader_name] = cached_swatch
+                continue
+            if tp.is_maya():
+                shader_swatch = maya_shader.get_shader_swatch(shader_name=shader_name)
+        if not shader_swatch:
+            LOGGER.warning('Impossible to render swatch of shader "{}"'.format(shader_name))
+            continue
+        px = QPixmap(QSize(swatch_size, swatch_size))
+        shader_swatch.render(px)
+        swatch_file = os.path.join(swatches_path, 'swatch_{}.png'.format(i))
+        if not px.save(swatch_file):
+            LOGGER.warning('Impossible to save swatch of shader "{}": {}'.format(shader_name, swatch_file))
+            continue
+        swatch_files[shader_name] = swatch_file
+        if network_hash:
+            swatch_files[shader_name] = swatch_cache.add(network_hash, swatch_file) or swatch_file
+
+    return swatch_files
+
+
+def get_assets_shader_files(assets, status=defines.ArtellaFileStatus.PUBLISHED, latest=False):
+    """
+    Resolves the files of all the shaders needed by the given assets
+    Shaders are collected through the shaders mapping file of each asset and deduplicated by shader name, so library
+    shaders shared by several assets are only resolved once
+    :param assets: list(ArtellaAsset)
+    :param status: str, status of the shader files
+    :param latest: bool, whether published shader files are resolved in the latest version published in Artella
+        server (instead of in the latest version synchronized locally, which can be outdated) or not
+    :return: OrderedDict(str, str), maps each shader with its file, in assets order
+    """
+
+    shader_files = OrderedDict()
+    for asset in assets:
+        shaders_mapping_file = SolsticeShaderMappingAssetFile(asset=asset)
+        for shader_name in shaders_mapping_file.get_shaders(status=status):
+            if shader_name in shader_files:
+                continue
+            shader_file = SolsticeShaderAssetFile(asset=asset, shader_name=shader_name)
+            file_path = shader_file.get_file_paths(return_first=True, status=status)
+            if latest and status == defines.ArtellaFileStatus.PUBLISHED:
+                file_path = _get_latest_published_file_path(shader_file, file_path)
+            shader_files[shader_name] = file_path
+
+    return shader_files
+
+
+def prefetch_shader_files(file_paths, max_workers=DEFAULT_PREFETCH_WORKERS):
+    """
+    Makes sure that all the given shader files are available locally before importing them
+    Published files are stored in version folders, so files resolved in their latest server version (see
+    get_assets_shader_files) that exist locally are up to date and only missing files are synchronized. Local files
+    are checked concurrently, but Artella synchronizations are done one at a time (see _ARTELLA_LOCK)
+    :param file_paths: list(str)
+    :param max_workers: int, maximum number of files checked at the same time
+    :return: dict(str, bool), maps each file with whether or not it is available locally
+    """
+
+    file_paths = list(OrderedDict.fromkeys(file_path for file_path in file_paths if file_path))
+    if not file_paths:
+        return dict()
+
+    def _prefetch_file(file_path):
+        if not os.path.isfile(file_path):
+            with _ARTELLA_LOCK:
+                try:
+                    if not artellalib.synchronize_file(file_path):
+                        LOGGER.warning('Shader file "{}" was not synchronized'.format(file_path))
+                except Exception as exc:
+                    LOGGER.warning('Impossible to synchronize shader file "{}" | {}'.format(file_path, exc))
+        return file_path, os.path.isfile(file_path)
+
+    pool = ThreadPool(max(1, min(int(max_workers or 1), len(file_paths))))
+    try:
+        prefetched_files = dict(pool.map(_prefetch_file, file_paths))
+    finally:
+        pool.close()
+        pool.join()
+
+    LOGGER.info('{} of {} shader files available locally'.format(
+        len([file_path for file_path, is_local in prefetched_files.items() if is_local]), len(file_paths)))
+
+    return prefetched_files
+
+
+def get_assets_shaders_load_plan(
+        assets, status=defines.ArtellaFileStatus.PUBLISHED, prefetch=True, max_workers=DEFAULT_PREFETCH_WORKERS):
+    """
+    Returns the shaders that must be loaded to shade all the given assets (for example, all the assets of a shot)
+    Shaders are deduplicated by shader name and file, so library shaders shared by several assets are only resolved
+    once. Shaders already in the scene are skipped
+    :param assets: list(ArtellaAsset), assets to load shaders of
+    :param status: str, status of the shader files to load
+    :param prefetch: bool, whether or not the latest version of the shader files should be synchronized before
+        checking them
+    :param max_workers: int, maximum number of shader files checked at the same time
+    :return: OrderedDict(str, str), maps each shader to load with its file, in assets order
+    """
+
+    shader_files = get_assets_shader_files(assets, status=status, latest=prefetch)
+
+    existing_shaders = _get_existing_nodes(list(shader_files.keys()))
+    for shader_name in existing_shaders:
+        LOGGER.info('Shader "{}" already exists in current scene. Skip importing ...'.format(shader_name))
+    shader_files = OrderedDict(
+        (shader_name, file_path) for shader_name, file_path in shader_files.items()
+        if shader_name not in existing_shaders)
+    checked_files = dict()
+    if prefetch:
+        checked_files = prefetch_shader_files(list(shader_files.values()), max_workers=max_workers)
+    load_plan = OrderedDict()
+    for shader_name, file_path in shader_files.items():
+        if file_path not in checked_files:
+            checked_files[file_path] = bool(file_path) and os.path.isfile(file_path)
+        if not checked_files[file_path]:
+            LOGGER.warning('Shader File "{}" for shader "{}" does not exists. Skip importing ...'.format(
+                file_path, shader_name))
+            continue
+        load_plan[shader_name] = file_path
+
+    return load_plan
+
+
+def load_assets_shaders(
+        assets, status=defines.ArtellaFileStatus.PUBLISHED, prefetch=True, max_workers=DEFAULT_PREFETCH_WORKERS,
+        deduplicate=False):
+    """
+    Loads all the shaders needed by the given assets into current scene
+    Each shading network is loaded only once, even if it is shared by several assets or shaders
+    :param assets: list(ArtellaAsset), assets to load shaders of
+    :param status: str, status of the shader files to load
+    :param prefetch: bool, whether or not shader files should be synchronized (concurrently) before importing them
+    :param max_workers: int, maximum number of shader files synchronized at the same time
+    :param deduplicate: bool, whether or not shading networks identical to networks already in the scene should be
+        reused instead of imported. If True, the result of each load is a dictionary that maps each imported shading
+        group with the shading group its assignments should use (see import_shader_network)
+    :return: OrderedDict(str, dict), maps each loaded shader with its load result ({'success', 'result', 'error'})
+    """
+
+    load_plan = get_assets_shaders_load_plan(assets, status=status, prefetch=prefetch, max_workers=max_workers)
+    networks_index = get_scene_networks_index(force=True) if deduplicate and load_plan else None
+
+    load_results = OrderedDict()
+    loaded_files = dict()
+    for shader_name, file_path in load_plan.items():
+        if file_path in loaded_files:
+            load_results[shader_name] = loaded_files[file_path]
+            continue
+        load_result = {'success': False, 'result': None, 'error': None}
+        LOGGER.info('Importing Asset Shader: {}'.format(file_path))
+        try:
+            if deduplicate:
+                load_result['result'] = import_shader_network(
+                    file_path, deduplicate=True, networks_index=networks_index)
+            else:
+                load_result['result'] = shader.ShadingNetwork.load_network(shader_file_path=file_path)
+            load_result['success'] = True
+        except Exception as exc:
+            load_result['error'] = str(exc)
+            LOGGER.error('Error while importing shader "{}": {} | {}'.format(
+                shader_name, exc, traceback.format_exc()))
+        loaded_files[file_path] = load_result
+        load_results[shader_name] = load_result
+
+    LOGGER.info('Loaded {} shader files for {} shaders of {} assets'.format(
+        len(loaded_files), len(load_results), len(assets)))
+
+    return load_results
+
+
+def get_scene_networks_index(force=False):
+    """
+    Returns the structural hashes of all the shading networks of current scene
+    Hashes are cached by shading group until the scene changes, so only shading groups created since the last call
+    are hashed. Shading networks edited after they were hashed are only hashed again if force is True
+    :param force: bool, whether or not to hash again all the shading groups of the scene
+    :return: dict(str, str), maps each structural hash with the first shading group that uses it
+    """
+
+    networks_index = dict()
+    if not tp.is_maya():
+        return networks_index
+
+    scene_name = maya.cmds.file(query=True, sceneName=True)
+    if force or _SCENE_NETWORKS_HASHES['scene'] != scene_name:
+        _SCENE_NETWORKS_HASHES['scene'] = scene_name
+        _SCENE_NETWORKS_HASHES['hashes'] = dict()
+    cached_hashes = _SCENE_NETWORKS_HASHES['hashes']
+
+    network_hashes = dict()
+    for shading_group in maya.cmds.ls(type='shadingEngine') or list():
+        if shading_group in cached_hashes:
+            network_hash = cached_hashes[shading_group]
+        else:
+            network_hash = shadingnetwork.get_network_structure_hash(_get_shading_network(shading_group))
+        network_hashes[shading_group] = network_hash
+        if network_hash:
+            networks_index.setdefault(network_hash, shading_group)
+    _SCENE_NETWORKS_HASHES['hashes'] = network_hashes
+
+    return networks_index
+
+
+def import_shader_network(file_path, deduplicate=False, networks_index=None):
+    """
+    Imports the shading network stored in the given file
+    If deduplicate is True, imported networks that are structurally identical (same node types, attribute values
+    and connections, whatever their names are) to a network already in the scene are removed and the existing
+    network is reused instead, so copies of the same shader published with different names are only loaded once
+    :param file_path: str
+    :param deduplicate: bool
+    :param networks_index: dict(str, str) or None, structural hashes of the scene networks (see
+        get_scene_networks_index). Imported networks are added to it. If not given, the cached index of the scene
+        is used
+    :return: OrderedDict(str, str), maps each imported shading group with the shading group its assignments
+        should use
+    """
+
+    if not tp.is_maya():
+        shader.ShadingNetwork.load_network(shader_file_path=file_path)
+        return OrderedDict()
+
+    if deduplicate and networks_index is None:
+        networks_index = get_scene_networks_index()
+
+    scene_shading_groups = set(maya.cmds.ls(type='shadingEngine') or list())
+    shader.ShadingNetwork.load_network(shader_file_path=file_path)
+
+    shading_group_aliases = OrderedDict()
+    for shading_group in maya.cmds.ls(type='shadingEngine') or list():
+        if shading_group in scene_shading_groups:
+            continue
+        shading_group_aliases[shading_group] = shading_group
+        if not deduplicate:
+            continue
+        shading_network = _get_shading_network(shading_group)
+        network_hash = shadingnetwork.get_network_structure_hash(shading_network)
+        _SCENE_NETWORKS_HASHES['hashes'][shading_group] = network_hash
+        if not network_hash:
+            continue
+        existing_shading_group = networks_index.get(network_hash, None)
+        if not existing_shading_group or not maya.cmds.objExists(existing_shading_group):
+            networks_index[network_hash] = shading_group
+            continue
+
+        members = maya.cmds.sets(shading_group, query=True) or list()
+        if members:
+            maya.cmds.sets(members, edit=True, forceElement=existing_shading_group)
+        existing_network = _get_shading_network(existing_shading_group)
+        # Only the nodes of the network itself are removed, never the geometries it was assigned to
+        duplicated_nodes = [
+            node for node in shadingnetwork.get_network_structure(shading_network)
+            if node not in existing_network and maya.cmds.objExists(node)]
+        if duplicated_nodes:
+            maya.cmds.delete(duplicated_nodes)
+        shading_group_aliases[shading_group] = existing_shading_group
+        LOGGER.info('Shading network "{}" is identical to "{}". Reusing it ...'.format(
+            shading_group, existing_shading_group))
+
+    return shading_group_aliases
+
+
+def _get_shading_network(shading_group):
+    """
+    Internal function that returns the description of the shading network of the given shading group
+    Network is collected starting from the shaders connected to the shading group, so its members (assigned
+    geometries and their history) are never walked
+    :param shading_group: str
+    :return: dict
+    """
+
+    try:
+        shading_group_data = {'asType': None, 'type': 'shadingEngine', 'attr': dict(), 'connection': dict()}
+        shader_nodes = list()
+        for attribute in shadingnetwork.SHADING_GROUP_SHADER_ATTRIBUTES:
+            plug = '{}.{}'.format(shading_group, attribute)
+            if not maya.cmds.attributeQuery(attribute, node=shading_group, exists=True):
+                continue
+            source_plug = maya.cmds.connectionInfo(plug, sourceFromDestination=True)
+            if not source_plug:
+                continue
+            shading_group_data['connection'][attribute] = source_plug
+            shader_nodes.append(source_plug.split('.')[0])
+
+        shading_network = _get_nodes_network(shader_nodes)
+        shading_network[shading_group] = shading_group_data
+    except Exception as exc:
+        LOGGER.debug('Impossible to retrieve shading network of "{}" | {}'.format(shading_group, exc))
+        return dict()
+
+    return shading_network
+
+
+def _get_nodes_network(root_nodes):
+    """
+    Internal function that returns the description of the given shading nodes and of all the nodes they depend on
+    :param root_nodes: list(str)
+    :return: dict
+    """
+
+    network_nodes = shadingnetwork.collect_network_nodes(
+        root_nodes, lambda node: maya.cmds.listConnections(node, source=True, destination=False),
+        get_node_type=maya.cmds.nodeType)
+
+    return dict((node, shader.ShadingNetwork._attrs_to_dict(node)) for node in network_nodes)
+
+
+def _get_existing_nodes(node_names):
+    """
+    Internal function that returns which of the given nodes exist in current scene
+    :param node_names: list(str)
+    :return: set(str)
+    """
+
+    if not node_names:
+        return set()
+
+    if tp.is_maya():
+        # A single query for all the nodes instead of an existence check per node
+        return set(maya.cmds.ls(node_names) or list())
+
+    return set(node_name for node_name in node_names if tp.Dcc.object_exists(node_name))
+
+
+@undo_decorator
+@refresh_decorator
+def assign_shader_mapping(mapping, namespace=None, shading_group_aliases=None):
+    """
+    Assigns the shading groups of the given mapping to its geometries
+    Mapping is inverted to shading group -> geometries, so each shading group is assigned to all its geometries with a
+    single DCC call. All assignments are done in a single undo chunk with viewport refresh suspended
+    :param mapping: dict or ShaderMapping, mapping data ({geometry: {shading_group: [shaders]}})
+    :param namespace: str or None, namespace of the asset geometries in current scene
+    :param shading_group_aliases: dict(str, str) or None, shading groups that should be assigned instead of the
+        ones stored in the mapping (for example, shading groups reused by import_shader_network)
+    :return: OrderedDict(str, list(str)), maps each assigned shading group with the geometries it was assigned to
+    """
+
+    if not tp.is_maya():
+        LOGGER.warning('Shaders assignment is only supported in Maya!')
+        return OrderedDict()
+
+    if not isinstance(mapping, shadermapping.ShaderMapping):
+        mapping = shadermapping.ShaderMapping(mapping)
+
+    shading_group_geometries = OrderedDict()
+    for shading_group, geometries in mapping.get_shading_group_geometry_mapping().items():
+        shading_group = (shading_group_aliases or dict()).get(shading_group, shading_group)
+        shading_group_geometries.setdefault(shading_group, list()).extend(geometries)
+
+    assigned_geometries = OrderedDict()
+    for shading_group, geometries in shading_group_geometries.items():
+        if not maya.cmds.objExists(shading_group):
+            LOGGER.warning('Shading group "{}" does not exists in current scene. Skip assignment ...'.format(
+                shading_group))
+            continue
+        if namespace:
+            geometries = [_get_namespaced_path(geometry, namespace) for geometry in geometries]
+        scene_geometries = maya.cmds.ls(geometries, long=True) or list()
+        if len(scene_geometries) < len(geometries):
+            LOGGER.warning('{} geometries of shading group "{}" do not exist in current scene'.format(
+                len(geometries) - len(scene_geometries), shading_group))
+        if not scene_geometries:
+            continue
+        try:
+            maya.cmds.sets(scene_geometries, edit=True, forceElement=shading_group)
+        except Exception as exc:
+            LOGGER.error('Error while assigning shading group "{}" | {}'.format(shading_group, exc))
+            continue
+        assigned_geometries[shading_group] = scene_geometries
+
+    LOGGER.info('Assigned {} shading groups to {} geometries'.format(
+        len(assigned_geometries), sum(len(geometries) for geometries in assigned_geometries.values())))
+
+    return assigned_geometries
+
+
+def _get_latest_published_file_path(shader_file, local_path):
+    """
+    Internal function that returns the path of the given shader file in the latest version published in Artella
+    server. Local published paths point to the latest version synchronized locally, which can be outdated
+    If the server cannot be reached, given local path is returned
+    :param shader_file: SolsticeShaderAssetFile
+    :param local_path: str or None, path of the shader file in its latest local version
+    :return: str or None
+    """
+
+    try:
+        server_path = shader_file.get_latest_server_published_path()
+    except Exception as exc:
+        LOGGER.warning('Impossible to retrieve latest published version of shader "{}" | {}'.format(
+            shader_file.shader_name, exc))
+        return local_path
+    if not server_path:
+        return local_path
+
+    server_path = artellapipe.FilesMgr().fix_path(server_path)
+    if local_path and server_path != local_path:
+        LOGGER.info('Shader file "{}" is outdated. Using latest published file "{}"'.format(local_path, server_path))
+
+    return server_path
+
+
+def _get_namespaced_path(node_path, namespace):
+    """
+    Internal function that adds given namespace to all the nodes of the given DAG path
+    :param node_path: str
+    :param namespace: str
+    :return: str
+    """
+
+    return '|'.join('{}:{}'.format(namespace, node) if node else node for node in node_path.split('|'))
+
 
 class SolsticeShaderFile(file.ArtellaFile, object):
     def __init__(self, project, file_name, file_path=None, file_extension=None):
@@ -65,34 +640,20 @@ class SolsticeShaderFile(file.ArtellaFile, object):
             LOGGER.warning('Shader "{}" already exists in current scene. Skip importing ...'.format(self.name))
             return
 
+        if kwargs.get('deduplicate', False):
+            return import_shader_network(
+                file_path, deduplicate=True, networks_index=kwargs.get('networks_index', None))
+
         shader.ShadingNetwork.load_network(shader_file_path=file_path)
 
     def _export_file(self, file_path, *args, **kwargs):
-
-        exported_shader = None
         shader_swatch = kwargs.get('shader_swatch', None)
 
-        if not shader_swatch and tp.is_maya():
-            shader_swatch = maya_shader.get_shader_swatch(shader_name=self.name)
+        export_result = export_shaders(
+            [self.name], shaders_path=os.path.dirname(file_path), shader_extension=self.extensions[0],
+            shader_swatches={self.name: shader_swatch} if shader_swatch else None)
 
-        px = QPixmap(QSize(100, 100))
-        shader_swatch.render(px)
-        temp_file = os.path.join(os.path.dirname(file_path), 'tmp.png')
-        px.save(temp_file)
-        try:
-            exported_shader = shader.ShadingNetwork.write_network(
-                shader_extension=self.extensions[0], shaders_path=os.path.dirname(file_path),
-                shaders=[self.name], icon_path=temp_file)
-        except Exception as exc:
-            LOGGER.error('Error while exporting shader: {} | {}'.format(exc, traceback.format_exc()))
-        finally:
-            if temp_file and os.path.isfile(temp_file):
-                try:
-                    os.remove(temp_file)
-                except Exception:
-                    LOGGER.warning('Impossible to remove temporary swatch file: {}'.format(temp_file))
-
-        return exported_shader
+        return export_result[self.name]['result']
 
 
 class SolsticeShadersAssetFile(assetfile.ArtellaAssetFile, object):
@@ -130,34 +691,20 @@ class SolsticeShaderAssetFile(assetfile.ArtellaAssetFile, object):
             LOGGER.warning('Shader "{}" already exists in current scene. Skip importing ...'.format(self.name))
             return
 
+        if kwargs.get('deduplicate', False):
+            return import_shader_network(
+                file_path, deduplicate=True, networks_index=kwargs.get('networks_index', None))
+
         shader.ShadingNetwork.load_network(shader_file_path=file_path)
 
     def _export_file(self, file_path, *args, **kwargs):
-
-        exported_shader = None
         shader_swatch = kwargs.get('shader_swatch', None)
 
-        if not shader_swatch and tp.is_maya():
-            shader_swatch = maya_shader.get_shader_swatch(shader_name=self._shader_name)
-
-        px = QPixmap(QSize(100, 100))
-        shader_swatch.render(px)
-        temp_file = os.path.join(os.path.dirname(file_path), 'tmp.png')
-        px.save(temp_file)
-        try:
-            exported_shader = shader.ShadingNetwork.write_network(
-                shader_extension=self.extensions[0], shaders_path=os.path.dirname(file_path),
-                shaders=[self._shader_name], icon_path=temp_file)
-        except Exception as exc:
-            LOGGER.error('Error while exporting shader: {} | {}'.format(exc, traceback.format_exc()))
-        finally:
-            if temp_file and os.path.isfile(temp_file):
-                try:
-                    os.remove(temp_file)
-                except Exception:
-                    LOGGER.warning('Impossible to remove temporary swatch file: {}'.format(temp_file))
+        export_result = export_shaders(
+            [self._shader_name], shaders_path=os.path.dirname(file_path), shader_extension=self.extensions[0],
+            shader_swatches={self._shader_name: shader_swatch} if shader_swatch else None)
 
-        return exported_shader
+        return export_result[self._shader_name]['result']
 
 
 class SolsticeShaderMappingAssetFile(assetfile.ArtellaAssetFile, object):
@@ -165,17 +712,29 @@ class SolsticeShaderMappingAssetFile(assetfile.ArtellaAssetFile, object):
         super(SolsticeShaderMappingAssetFile, self).__init__(file_asset=asset, file_path=file_path)
 
         self._data = dict()         # We do not initialize data here to avoid recursion calls
+        self._mapping = None
 
     def get_shaders_info(self, force=False, status=defines.ArtellaFileStatus.PUBLISHED):
         """
         Returns dictionary that maps the shaders contained in the file with the different geometries
+        Shader mappings are shared by all the files that use the same mapping file (see _load_mapping), so a copy is
+        returned and callers can modify it
         :return: dict
         """
 
-        if not self._data or force:
-            self._data = self._load_data(status=status)
+        return copy.deepcopy(self.get_shader_mapping(force=force, status=status).data)
 
-        return self._data
+    def get_shader_mapping(self, force=False, status=defines.ArtellaFileStatus.PUBLISHED):
+        """
+        Returns indexed mapping of the shaders contained in the file
+        :return: ShaderMapping
+        """
+
+        if not self._data or not self._mapping or force:
+            self._mapping = self._load_mapping(status=status)
+            self._data = copy.deepcopy(self._mapping.data)
+
+        return self._mapping
 
     def get_shaders(self, status=defines.ArtellaFileStatus.PUBLISHED, force=False):
         """
@@ -183,14 +742,7 @@ class SolsticeShaderMappingAssetFile(assetfile.ArtellaAssetFile, object):
         :return: list(str)
         """
 
-        found_shaders = list()
-        for transform_name, shape_data in self.get_shaders_info(status=status, force=force).items():
-            for shape_name, shaders_list in shape_data.items():
-                for shader in shaders_list:
-                    if shader not in found_shaders:
-                        found_shaders.append(shader)
-
-        return found_shaders
+        return self.get_shader_mapping(status=status, force=force).get_shaders()
 
     def get_shading_geometry_mapping(self, status=defines.ArtellaFileStatus.PUBLISHED):
         """
@@ -198,16 +750,7 @@ class SolsticeShaderMappingAssetFile(assetfile.ArtellaAssetFile, object):
         :return:
         """
 
-        shading_geo_mapping = dict()
-        for shape_name, shape_data in self.get_shaders_info(status=status).items():
-            for shading_group, shaders_list in shape_data.items():
-                if shape_name not in shading_geo_mapping:
-                    shading_geo_mapping[shape_name] = list()
-                for shader in shaders_list:
-                    if shader not in shading_geo_mapping[shape_name]:
-                        shading_geo_mapping[shape_name].append(shader)
-
-        return shading_geo_mapping
+        return self.get_shader_mapping(status=status).get_shading_geometry_mapping()
 
     def get_shading_group_shader_mapping(self):
         """
@@ -215,16 +758,19 @@ class SolsticeShaderMappingAssetFile(assetfile.ArtellaAssetFile, object):
         :return:
         """
 
-        shading_shader_mapping = dict()
-        for shape_name, shape_data in self._data.items():
-            for shading_group_name, shaders_list in shape_data.items():
-                if shading_group_name not in shading_shader_mapping:
-                    shading_shader_mapping[shading_group_name] = list()
-                for shader in shaders_list:
-                    if shader not in shading_shader_mapping[shading_group_name]:
-                        shading_shader_mapping[shading_group_name].append(shader)
+        return self.get_shader_mapping().get_shading_group_shader_mapping()
+
+    def assign_shaders(self, namespace=None, status=defines.ArtellaFileStatus.PUBLISHED, shading_group_aliases=None):
+        """
+        Assigns the shaders of the file to the asset geometries of current scene
+        :param namespace: str or None, namespace of the asset geometries in current scene
+        :param status: str
+        :param shading_group_aliases: dict(str, str) or None, shading groups to assign instead of the mapped ones
+        :return: OrderedDict(str, list(str)), maps each assigned shading group with the geometries it was assigned to
+        """
 
-        return shading_shader_mapping
+        return assign_shader_mapping(
+            self.get_shader_mapping(status=status), namespace=namespace, shading_group_aliases=shading_group_aliases)
 
     def _load_data(self, status=defines.ArtellaFileStatus.PUBLISHED):
         """
@@ -232,18 +778,59 @@ class SolsticeShaderMappingAssetFile(assetfile.ArtellaAssetFile, object):
         :return:
         """
 
+        return copy.deepcopy(self._load_mapping(status=status).data)
+
+    def _load_mapping(self, status=defines.ArtellaFileStatus.PUBLISHED):
+        """
+        Internal function that loads the shader mapping contained in the file
+        Mapping files are loaded through the process wide shader mapping cache, so a file is only read from disk once
+        no matter how many asset files or shader manager lookups use it
+        :return: ShaderMapping
+        """
+
         file_path = self.get_file_paths(return_first=True, status=status)
         if not file_path or not os.path.isfile(file_path):
-            return dict()
+            return shadermapping.ShaderMapping()
 
-        with open(file_path, 'r') as f:
-            return json.load(f)
+        try:
+            return shadermapping.get_cache().get_mapping(file_path)
+        except Exception as exc:
+            LOGGER.error('Error while loading Shaders Mapping File "{}" | {}'.format(file_path, exc))
+            return shadermapping.ShaderMapping()
+
+    def update_mapping_file(self, file_path, shaders_to_export=None):
+        """
+        Updates given shaders mapping file with the current shaders of the asset
+        New mapping is compared against the one stored in the file, so the file is not written if nothing changed.
+        Otherwise, the new mapping is written into a temporary file and the Artella lock is only held while the
+        temporary file replaces the mapping file
+        :param file_path: str
+        :param shaders_to_export: dict or None, mapping data to export. If None, current asset shaders are used
+        :return: OrderedDict or None, {'added', 'removed', 'changed'} geometries of the updated mapping
+        """
+
+        if shaders_to_export is None:
+            shaders_to_export = artellapipe.ShadersMgr().get_asset_shaders_to_export(
+                asset=self._asset, return_only_shaders=False)
+        if not shaders_to_export:
+            LOGGER.warning('No shaders found to export for "{}". Shaders Mapping File "{}" is not updated'.format(
+                self._asset, file_path))
+            return None
+
+        return shadermapping.update_shader_mapping_file(
+            file_path, shaders_to_export, lock_fn=artellapipe.FilesMgr().lock_file,
+            unlock_fn=artellapipe.FilesMgr().unlock_file)
 
     def _export_file(self, file_path, *args, **kwargs):
         if not tp.is_maya():
             LOGGER.warning('Shaders export is only supported in Maya!')
             return
 
+        if kwargs.get('incremental', False):
+            if self.update_mapping_file(file_path) is None:
+                return
+            return file_path
+
         shaders_to_export = artellapipe.ShadersMgr().get_asset_shaders_to_export(
             asset=self._asset, return_only_shaders=False)
 
@@ -259,8 +846,7 @@ class SolsticeShaderMappingAssetFile(assetfile.ArtellaAssetFile, object):
             locked_file = True
 
         try:
-            with open(file_path, 'w') as fp:
-                json.dump(shaders_to_export, fp)
+            shadermapping.write_shader_mapping_file(file_path, shaders_to_export)
         except Exception as exc:
             LOGGER.error('Error while exporting Shaders Mapping File "{}" | {}'.format(file_path, exc))
         finally:
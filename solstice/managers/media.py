@@ -13,10 +13,14 @@ __maintainer__ = "Tomas Poveda"
 __email__ = "tpovedatd@gmail.com"
 
 import os
+import time
+import shutil
 import logging
+import tempfile
 from collections import OrderedDict
 
 import fileseq
+from Qt.QtCore import *
 from Qt.QtGui import *
 
 import tpDcc as tp
@@ -25,8 +29,11 @@ from tpDcc.libs.qt.core import image
 
 import artellapipe
 from artellapipe.managers import media
+from artellapipe.libs import ffmpeg as ffmpeg_lib
 from artellapipe.libs.ffmpeg.core import ffmpeglib
 
+from solstice.core import stamp, rawstamp
+
 LOGGER = logging.getLogger()
 
 
@@ -35,11 +42,255 @@ class SolsticeMediaManager(media.MediaManager, object):
         super(SolsticeMediaManager, self).__init__()
 
     def stamp_video(self, source, output, config_dict=None):
-        raise Exception('Stamp video functionality is not supported yet!')
+        config_dict = config_dict or dict()
+
+        layout = self._prepare_video_stamp(source, config_dict)
+        if not layout:
+            return
+
+        return self._run_video_stamp(
+            source, output, layout, output_specs=stamp.get_output_specs(output, config_dict.get('outputs', None)))
 
     def stamp_image(self, source, output, config_dict=None):
-        res_x = image.get_image_width(source)
-        res_y = image.get_image_height(source)
+        config_dict = config_dict or dict()
+
+        sequence, layout = self._prepare_image_stamp(source, config_dict)
+        if not sequence:
+            return
+
+        return self._run_image_stamp(source, sequence, output, layout, config_dict)
+
+    def stamp_batch(self, jobs, workers=None):
+        """
+        Stamps all the given jobs (for example, all the shots of a dailies session)
+        Bands, fonts and project settings are loaded once and shared by all the jobs. Everything that uses Qt (stamp
+        layouts, empty frames and glyph atlases) and static layers are rendered in the calling thread while preparing
+        the jobs. Jobs are then executed in a bounded pool of worker threads, which run FFMpeg processes and, for NumPy
+        stamps, composite frames in memory
+        :param jobs: list(tuple(str, str, dict)), list of (source, output, config_dict) jobs
+        :param workers: int or None, maximum number of FFMpeg processes executed at the same time. It is split between
+            the jobs executed at the same time and the frame chunks rendered by each job (see stamp.split_workers)
+        :return: list(stamp.StampJobResult), ordered result of each job
+        """
+
+        cache = dict()
+        results = list()
+        prepared_jobs = list()
+        for source, output, config_dict in jobs:
+            config_dict = config_dict or dict()
+            job_result = stamp.StampJobResult(source, output)
+            results.append(job_result)
+            start_time = time.time()
+            try:
+                if stamp.is_video_file(source):
+                    sequence = None
+                    layout = self._prepare_video_stamp(source, config_dict, cache=cache)
+                else:
+                    sequence, layout = self._prepare_image_stamp(source, config_dict, cache=cache)
+            except Exception as exc:
+                LOGGER.error('Error while preparing stamp of "{}" | {}'.format(source, exc))
+                job_result.error = exc
+                continue
+            finally:
+                job_result.elapsed = time.time() - start_time
+            if not layout:
+                job_result.error = stamp.StampError('Nothing to stamp in "{}"'.format(source))
+                continue
+            prepared_jobs.append((job_result, sequence, layout, config_dict))
+
+        jobs_workers, job_workers = stamp.split_workers(workers, len(prepared_jobs))
+
+        def _run_job(chunk):
+            job_result, sequence, layout, config_dict = chunk[0]
+            config_dict = dict(config_dict, workers=min(config_dict.get('workers', None) or job_workers, job_workers))
+            start_time = time.time()
+            try:
+                if sequence is None:
+                    job_result.result = self._run_video_stamp(
+                        job_result.source, job_result.output, layout,
+                        output_specs=stamp.get_output_specs(job_result.output, config_dict.get('outputs', None)))
+                else:
+                    job_result.result = self._run_image_stamp(
+                        job_result.source, sequence, job_result.output, layout, config_dict)
+            finally:
+                job_result.elapsed += time.time() - start_time
+            if not job_result.result:
+                raise stamp.StampError('Error while stamping "{}"'.format(job_result.source))
+
+        for chunk_result in stamp.run_chunks(
+                _run_job, stamp.split_in_chunks(prepared_jobs, 1), workers=jobs_workers):
+            if not chunk_result.success:
+                chunk_result.items[0][0].error = chunk_result.error
+
+        LOGGER.info('Stamped {} of {} jobs'.format(len([result for result in results if result.success]), len(jobs)))
+
+        return results
+
+    def _prepare_video_stamp(self, source, config_dict, cache=None):
+        """
+        Internal function that computes the stamp layout of the given video and renders its static layer
+        Temporary files of the stamp are stored in their own temporary folder, which is removed when the stamp ends
+        or when the stamp cannot be prepared
+        :param source: str
+        :param config_dict: dict
+        :param cache: dict or None, cache shared by the jobs of a batch
+        :return: stamp.StampLayout or None
+        """
+
+        if not source or not os.path.isfile(source):
+            LOGGER.warning('Video to stamp "{}" does not exists!'.format(source))
+            return None
+
+        try:
+            video_info = stamp.probe_video(source, ffmpeg_executable=self._get_ffmpeg_executable())
+        except stamp.StampError as exc:
+            LOGGER.error('Error while reading video to stamp "{}" | {}'.format(source, exc))
+            return None
+
+        temp_dir = self._create_temp_directory(config_dict)
+        try:
+            layout = self._get_stamp_layout(
+                source, config_dict, resolution=(video_info['width'], video_info['height']), fps=video_info['fps'],
+                cache=cache)
+            layout.temp_dir = temp_dir
+            layout.frames_count = video_info['frames']
+            layout.static_layer = self._render_static_layer(layout, self._get_static_layer_path(source, temp_dir))
+        except Exception:
+            self._remove_temp_directory(temp_dir)
+            raise
+
+        return layout
+
+    def _run_video_stamp(self, source, output, layout, output_specs=None):
+        """
+        Internal function that stamps given video with the given layout
+        :param source: str
+        :param output: str
+        :param layout: stamp.StampLayout
+        :param output_specs: list(stamp.OutputSpec) or None, outputs generated from the stamped video
+        :return: str or None
+        """
+
+        output_specs = output_specs or stamp.get_output_specs(output)
+
+        # Video is decoded, stamped and encoded by a single FFMpeg process that streams the frames, so memory usage
+        # does not depend on the length of the video
+        input_args = ['-i', source]
+        filter_graph = self._get_stamp_filter_graph(layout, input_args)
+        try:
+            stamp.run_ffmpeg(
+                input_args + stamp.get_outputs_args(
+                    filter_graph, output_specs, fps=layout.fps, audio_input=0, frames_count=layout.frames_count),
+                ffmpeg_executable=self._get_ffmpeg_executable())
+        except stamp.StampError as exc:
+            LOGGER.error('Error while stamping video "{}" | {}'.format(source, exc))
+            return
+        finally:
+            self._remove_temp_directory(layout.temp_dir)
+
+        if not os.path.isfile(output):
+            LOGGER.error('Error while stamping video "{}" ...'.format(source))
+            return
+
+        return output
+
+    def _prepare_image_stamp(self, source, config_dict, cache=None):
+        """
+        Internal function that finds the image sequence to stamp, computes its stamp layout and renders its static
+        layer, its empty frame and, for NumPy stamps, its glyph atlas
+        Qt painting is not safe outside the main thread, so all Qt images used to stamp the sequence are rendered
+        here and not when the stamp is executed. Temporary files of the stamp are stored in their own temporary
+        folder, so stamps of the same source never share them. Folder is removed when the stamp ends or when the stamp
+        cannot be prepared
+        :param source: str
+        :param config_dict: dict
+        :param cache: dict or None, cache shared by the jobs of a batch
+        :return: tuple(fileseq.FileSequence, stamp.StampLayout) or tuple(None, None)
+        """
+
+        sequence = fileseq.findSequenceOnDisk(source)
+        if not sequence or not len(sequence):
+            LOGGER.warning('No frames found to stamp in "{}"'.format(source))
+            return None, None
+
+        temp_dir = self._create_temp_directory(config_dict)
+        try:
+            layout = self._get_stamp_layout(source, config_dict, cache=cache)
+            layout.temp_dir = temp_dir
+            layout.frames_count = len(sequence)
+            static_layer_path = self._get_static_layer_path(source, temp_dir)
+            layout.static_layer = self._render_static_layer(layout, static_layer_path)
+            layout.empty_frame = image.create_empty_image(
+                self._get_temp_file_path(os.path.join(temp_dir, os.path.basename(sequence[0])), 'empty'),
+                resolution_x=layout.width, resolution_y=layout.height, background_color=list(layout.background_color))
+            if not config_dict.get('incremental', False) and config_dict.get(
+                    'stamp_mode', stamp.StampModes.FILTERGRAPH) == stamp.StampModes.NUMPY and rawstamp.is_available():
+                glyph_atlas_path = self._get_temp_file_path(static_layer_path, 'glyphs')
+                try:
+                    layout.glyph_atlas = self._render_glyph_atlas(
+                        layout, rawstamp.FRAME_CHARACTERS + layout.timecode_text, glyph_atlas_path,
+                        ffmpeg_executable=self._get_ffmpeg_executable())
+                except (stamp.StampError, IOError, OSError, ValueError) as exc:
+                    LOGGER.warning('Impossible to render stamp glyph atlas of "{}" | {}'.format(source, exc))
+                finally:
+                    self._remove_temp_file(glyph_atlas_path)
+        except Exception:
+            self._remove_temp_directory(temp_dir)
+            raise
+
+        return sequence, layout
+
+    def _run_image_stamp(self, source, sequence, output, layout, config_dict):
+        """
+        Internal function that stamps given image sequence with the given layout
+        :param source: str
+        :param sequence: fileseq.FileSequence
+        :param output: str
+        :param layout: stamp.StampLayout
+        :param config_dict: dict
+        :return: str or None
+        """
+
+        output_specs = stamp.get_output_specs(output, config_dict.get('outputs', None))
+        try:
+            if config_dict.get('incremental', False):
+                return self._stamp_image_incremental(
+                    sequence, output, layout, config_dict, output_specs=output_specs)
+
+            stamp_mode = config_dict.get('stamp_mode', stamp.StampModes.FILTERGRAPH)
+            if stamp_mode == stamp.StampModes.NUMPY:
+                if not rawstamp.is_available():
+                    LOGGER.warning('NumPy is not available. Stamping "{}" with FFMpeg filters ...'.format(source))
+                elif self._stamp_image_numpy(
+                        sequence, output, layout, output_specs=output_specs, max_in_flight_frames=config_dict.get(
+                            'max_in_flight_frames', stamp.DEFAULT_MAX_IN_FLIGHT_FRAMES)):
+                    return output
+                stamp_mode = stamp.StampModes.FILTERGRAPH
+            if stamp_mode == stamp.StampModes.FILTERGRAPH:
+                if self._stamp_image_filter_graph(sequence, output, layout, output_specs=output_specs):
+                    return output
+                LOGGER.warning('Impossible to stamp "{}" in a single pass. Stamping frame by frame ...'.format(source))
+
+            return self._stamp_image_frames(sequence, output, layout, config_dict, output_specs=output_specs)
+        finally:
+            self._remove_temp_directory(layout.temp_dir)
+
+    def _get_stamp_layout(self, source, config_dict, resolution=None, fps=None, cache=None):
+        """
+        Internal function that computes the stamp layout used to stamp given source
+        :param source: str
+        :param config_dict: dict
+        :param resolution: tuple(int, int) or None, resolution of the source. If None, it is read from source image
+        :param fps: float or None, frame rate of the source. If None, project frame rate is used
+        :param cache: dict or None, if given, bands, fonts and project settings are loaded once and stored in it
+        :return: stamp.StampLayout
+        """
+
+        if resolution:
+            res_x, res_y = resolution
+        else:
+            res_x = image.get_image_width(source)
+            res_y = image.get_image_height(source)
 
         top_band = config_dict.get('top_band', None)
         bottom_band = config_dict.get('bottom_band', None)
@@ -52,130 +303,635 @@ class SolsticeMediaManager(media.MediaManager, object):
 
         top_band_height = 0
         if top_band and os.path.isfile(top_band):
-            top_band_height = image.get_image_height(top_band)
-            res_y += top_band_height
+            top_band_height = self._get_cached_value(
+                cache, ('band_height', top_band), lambda: image.get_image_height(top_band))
+        else:
+            top_band = None
 
         bottom_band_height = 0
         if bottom_band and os.path.isfile(bottom_band):
-            bottom_band_height = image.get_image_height(bottom_band)
-            res_y += bottom_band_height
+            bottom_band_height = self._get_cached_value(
+                cache, ('band_height', bottom_band), lambda: image.get_image_height(bottom_band))
+        else:
+            bottom_band = None
+
+        source_height = res_y
+        res_y += top_band_height + bottom_band_height
 
-        font_db = QFontDatabase()
-        font_db.addApplicationFont(font_file)
-        text_font = QFont(font_family)
         font_size = 32
-        font_height = QFontMetrics(text_font).height()
-        user = str(artellapipe.Tracker().get_user_name())
+        font_metrics = self._get_cached_value(
+            cache, ('font_metrics', font_file, font_family, font_size),
+            lambda: QFontMetrics(self._get_stamp_font(font_file, font_family, font_size)))
+        font_height = font_metrics.height()
+        # Texts are positioned by their baseline, so layout top positions are moved down by the font ascent
+        font_ascent = font_metrics.ascent()
+        user = self._get_cached_value(cache, ('user', ), lambda: str(artellapipe.Tracker().get_user_name()))
         shot_name = config_dict.get('shot_name', '') or ''
         task_name = config_dict.get('task_name', '') or ''
         task_comment = str(config_dict.get('task_comment', ''))
 
-        if artellapipe.Tracker().is_tracking_available():
-            fps = artellapipe.Tracker().get_project_fps()
-        else:
-            fps = 24
+        if not fps:
+            fps = self._get_cached_value(cache, ('project_fps', ), self._get_project_fps)
 
         camera = str(config_dict.get('camera', 'No camera'))
-        start_frame = str(config_dict.get('start_frame', None))
+        start_frame = config_dict.get('start_frame', None)
         focal_length = None
         if camera and camera != 'No camera' and tp.Dcc.object_exists(camera):
             focal_length = tp.Dcc.get_camera_focal_length(camera)
 
-        sequence = fileseq.findSequenceOnDisk(source)
-        frames_dict = OrderedDict()
-        total_frames = len(sequence)
-        for i in range(total_frames):
-            sequence_frame = sequence[i]
-            empty_frame_path = self._get_temp_file_path(sequence_frame, 'empty')
-            empty_frame = image.create_empty_image(
-                empty_frame_path, resolution_x=res_x, resolution_y=res_y, background_color=[92, 92, 92])
-            frames_dict[sequence_frame] = empty_frame
-
-        frame_outputs = dict()
-        for i, (frame, empty_frame) in enumerate(frames_dict.items()):
-            # Overlay playblast
-            stream = ffmpeglib.overlay_inputs(empty_frame, frame, y=top_band_height)
+        fps_text = 'FPS: {}'.format(str(int(float(fps))))
+        if focal_length:
+            fps_text = ' Focal Length: {}'.format(focal_length)
+
+        top_text_y = res_y - font_height - text_margin_y - 70 + font_ascent
+        bottom_text_y = res_y - font_height - text_margin_y - 20 + font_ascent
+        user_shot_text_width = max(font_metrics.width(user), font_metrics.width(shot_name))
+        texts = [
+            stamp.StampText(task_name, x=40, y=text_margin_y + font_height + font_ascent),
+            stamp.StampText(task_comment, x=40, y=text_margin_y + (font_height * 2) + 25 + font_ascent),
+            stamp.StampText(camera, x=res_x / 2 - font_metrics.width(camera), y=top_text_y),
+            stamp.StampText(fps_text, x=res_x / 2 - font_metrics.width(fps_text), y=bottom_text_y),
+            stamp.StampText(user, x=res_x - user_shot_text_width - text_margin_x, y=top_text_y),
+            stamp.StampText(shot_name, x=res_x - user_shot_text_width - text_margin_x, y=bottom_text_y)
+        ]
+
+        return stamp.StampLayout(
+            res_x, source_height, top_band=top_band, top_band_height=top_band_height, bottom_band=bottom_band,
+            bottom_band_height=bottom_band_height, font_file=font_file, font_family=font_family, font_size=font_size,
+            texts=texts,
+            frame_text_position=(40, top_text_y), start_frame=start_frame, fps=fps, framecode=framecode,
+            timecode_position=(40, bottom_text_y))
+
+    def _get_cached_value(self, cache, key, fn):
+        """
+        Internal function that returns the value stored in the given cache with the given key
+        If the value is not cached yet (or no cache is given), given function is called to get the value
+        :param cache: dict or None
+        :param key: tuple
+        :param fn: fn
+        :return: variant
+        """
+
+        if cache is None:
+            return fn()
+        if key not in cache:
+            cache[key] = fn()
+
+        return cache[key]
+
+    def _get_stamp_font(self, font_file, font_family, font_size):
+        """
+        Internal function that returns the Qt font loaded from the given font file, the same file used by FFMpeg
+        to draw stamp texts. If the font file cannot be loaded, given font family is used
+        :param font_file: str
+        :param font_family: str
+        :param font_size: int, size of the font in pixels
+        :return: QFont
+        """
+
+        font_families = list()
+        font_id = QFontDatabase.addApplicationFont(font_file) if font_file else -1
+        if font_id != -1:
+            font_families = QFontDatabase.applicationFontFamilies(font_id)
+        if font_families:
+            text_font = QFont(font_families[0])
+        else:
+            LOGGER.warning('Impossible to load stamp font file "{}". Using "{}" font family'.format(
+                font_file, font_family))
+            text_font = QFont(font_family) if font_family else QFont()
+        text_font.setPixelSize(font_size)
 
-            # Overlay top and bottom bands
-            if top_band:
-                stream = ffmpeglib.overlay_inputs(stream, top_band)
-            if bottom_band:
-                stream = ffmpeglib.overlay_inputs(stream, bottom_band, y=res_y - bottom_band_height)
-
-            # Draw task and comment texts
-            stream = ffmpeglib.draw_text(
-                stream, task_name, x=40,
-                y=text_margin_y + font_height, font_file=font_file, font_size=font_size)
-            stream = ffmpeglib.draw_text(
-                stream, task_comment, x=40,
-                y=text_margin_y + (font_height * 2) + 25, font_file=font_file, font_size=font_size)
-
-            # Draw frame
-            current_frame = int(float(start_frame)) + i
-            fps_text = '{} ({})'.format(current_frame, i + 1)
-            stream = ffmpeglib.draw_text(
-                stream, fps_text, x=40, y=res_y - font_height - text_margin_y - 70,
-                font_file=font_file, font_size=font_size)
-
-            # Draw camera name and focal length texts
-            camera_text_width = QFontMetrics(text_font).width(camera)
-            stream = ffmpeglib.draw_text(
-                stream, camera, x=res_x / 2 - camera_text_width,
-                y=res_y - font_height - text_margin_y - 70, font_file=font_file, font_size=font_size)
-            fps_text = 'FPS: {}'.format(str(int(float(fps))))
-            if focal_length:
-                fps_text = ' Focal Length: {}'.format(focal_length)
-            fps_focal_length_width = QFontMetrics(text_font).width(str(fps_text))
-            stream = ffmpeglib.draw_text(
-                stream, fps_text, x=res_x / 2 - fps_focal_length_width,
-                y=res_y - font_height - text_margin_y - 20, font_file=font_file, font_size=font_size)
-
-            # Draw user and shot texts
-            user_text_width = QFontMetrics(text_font).width(user)
-            shot_text_width = QFontMetrics(text_font).width(shot_name)
-            user_shot_text_width = max(user_text_width, shot_text_width)
-            stream = ffmpeglib.draw_text(
-                stream, user, x=res_x - user_shot_text_width - text_margin_x,
-                y=res_y - font_height - text_margin_y - 70, font_file=font_file, font_size=font_size)
-            stream = ffmpeglib.draw_text(
-                stream, shot_name, x=res_x - user_shot_text_width - text_margin_x,
-                y=res_y - font_height - text_margin_y - 20, font_file=font_file, font_size=font_size)
-
-            new_file_path = self._get_temp_file_path(empty_frame, 'main', index=i)
-            frame_save = ffmpeglib.save_to_file(stream, new_file_path)
-            frame_outputs[new_file_path] = frame_save
-
-        if not frame_outputs:
-            return
+        return text_font
 
-        frame_paths = frame_outputs.keys()
-        frame_outs = frame_outputs.values()
-        ffmpeglib.run_multiples_outputs_at_once(frame_outs)
+    def _get_project_fps(self):
+        """
+        Internal function that returns the frame rate of the project
+        :return: float
+        """
 
-        for frame_path in frame_paths:
-            if not frame_path or not os.path.isfile(frame_path):
+        if artellapipe.Tracker().is_tracking_available():
+            return artellapipe.Tracker().get_project_fps()
+
+        return 24
+
+    def _stamp_image_filter_graph(self, sequence, output, layout, output_specs=None):
+        """
+        Internal function that stamps given image sequence and encodes it into given output in a single FFMpeg pass
+        No intermediate frames are written into disk
+        :param sequence: fileseq.FileSequence
+        :param output: str
+        :param layout: stamp.StampLayout
+        :param output_specs: list(stamp.OutputSpec) or None, outputs generated from the stamped frames
+        :return: bool
+        """
+
+        output_specs = output_specs or stamp.get_output_specs(output)
+
+        if len(sequence) != sequence.end() - sequence.start() + 1:
+            LOGGER.debug('Image sequence "{}" has missing frames'.format(sequence))
+            return False
+
+        input_args = stamp.get_image_sequence_input_args(
+            self._get_sequence_pattern(sequence), start_number=sequence.start(), fps=layout.fps)
+        filter_graph = self._get_stamp_filter_graph(layout, input_args)
+        try:
+            stamp.run_ffmpeg(
+                input_args + stamp.get_outputs_args(
+                    filter_graph, output_specs, fps=layout.fps, frames_count=len(sequence)),
+                ffmpeg_executable=self._get_ffmpeg_executable())
+        except stamp.StampError as exc:
+            LOGGER.warning('Error while stamping image sequence "{}" | {}'.format(sequence, exc))
+            return False
+
+        return os.path.isfile(output)
+
+    def _get_stamp_filter_graph(self, layout, input_args):
+        """
+        Internal function that appends stamp layers inputs to given FFMpeg input arguments and returns the filter
+        graph that stamps the first input with the given layout
+        :param layout: stamp.StampLayout
+        :param input_args: list(str), FFMpeg input arguments. Stamp layers inputs are appended to it
+        :return: str
+        """
+
+        static_layer_label = top_band_label = bottom_band_label = None
+        input_index = input_args.count('-i')
+        if layout.static_layer:
+            input_args.extend(['-i', layout.static_layer])
+            static_layer_label = '{}:v'.format(input_index)
+        else:
+            if layout.top_band:
+                input_args.extend(['-i', layout.top_band])
+                top_band_label = '{}:v'.format(input_index)
+                input_index += 1
+            if layout.bottom_band:
+                input_args.extend(['-i', layout.bottom_band])
+                bottom_band_label = '{}:v'.format(input_index)
+
+        return stamp.build_stamp_filter_graph(
+            layout, static_layer_label=static_layer_label, top_band_label=top_band_label,
+            bottom_band_label=bottom_band_label)
+
+    def _render_static_layer(self, layout, file_path):
+        """
+        Internal function that renders into a transparent image all the elements of the given layout that are the
+        same for all the frames (bands and texts), so they only need to be composited once per frame
+        Static texts are drawn by FFMpeg with the same font file and baseline than frame counter and timecode
+        :param layout: stamp.StampLayout
+        :param file_path: str, path where static layer image will be stored
+        :return: str or None, path of the static layer image or None if it was not possible to render it
+        """
+
+        try:
+            return stamp.render_static_layer(layout, file_path, ffmpeg_executable=self._get_ffmpeg_executable())
+        except stamp.StampError as exc:
+            LOGGER.warning('Impossible to render stamp static layer: "{}" | {}'.format(file_path, exc))
+            self._remove_temp_file(file_path)
+            return None
+
+    def _stamp_image_numpy(self, sequence, output, layout, output_specs=None,
+                           max_in_flight_frames=stamp.DEFAULT_MAX_IN_FLIGHT_FRAMES):
+        """
+        Internal function that stamps given image sequence compositing its frames in memory with NumPy
+        Frames are decoded by a single FFMpeg process and piped as raw frames into a single FFMpeg encoder
+        :param sequence: fileseq.FileSequence
+        :param output: str
+        :param layout: stamp.StampLayout
+        :param output_specs: list(stamp.OutputSpec) or None, outputs generated from the stamped frames
+        :param max_in_flight_frames: int, maximum number of frames kept in memory at the same time
+        :return: bool
+        """
+
+        output_specs = output_specs or stamp.get_output_specs(output)
+
+        # Glyph atlas is rendered with Qt when the stamp is prepared, in the calling thread
+        if not layout.glyph_atlas:
+            LOGGER.warning('No stamp glyph atlas available for "{}"'.format(sequence))
+            return False
+
+        ffmpeg_executable = self._get_ffmpeg_executable()
+        try:
+            static_layer = None
+            if layout.static_layer:
+                static_layer = rawstamp.read_image(
+                    layout.static_layer, layout.width, layout.height, ffmpeg_executable=ffmpeg_executable)
+            compositor = rawstamp.FrameCompositor(layout, static_layer=static_layer, glyph_atlas=layout.glyph_atlas)
+
+            if len(sequence) == sequence.end() - sequence.start() + 1:
+                frames = rawstamp.iter_sequence_frames(
+                    stamp.get_image_sequence_input_args(
+                        self._get_sequence_pattern(sequence), start_number=sequence.start(), fps=layout.fps),
+                    layout.source_width, layout.source_height, ffmpeg_executable=ffmpeg_executable)
+            else:
+                frames = rawstamp.iter_image_frames(
+                    list(sequence), layout.source_width, layout.source_height, ffmpeg_executable=ffmpeg_executable)
+
+            frames_count = rawstamp.stamp_frames(
+                frames, output_specs, compositor, layout, max_in_flight_frames=max_in_flight_frames,
+                frames_count=len(sequence), ffmpeg_executable=ffmpeg_executable)
+        except (stamp.StampError, IOError, OSError, ValueError) as exc:
+            # Decoding, piping or compositing errors (for example, frames with unexpected shapes) are not fatal, the
+            # sequence is stamped again with FFMpeg filter graphs
+            LOGGER.warning('Error while stamping image sequence "{}" with NumPy | {}'.format(sequence, exc))
+            return False
+
+        if frames_count != len(sequence):
+            LOGGER.warning('Only {} of {} frames of "{}" were stamped'.format(frames_count, len(sequence), sequence))
+            return False
+
+        return os.path.isfile(output)
+
+    def _render_glyph_atlas(self, layout, characters, file_path, ffmpeg_executable=None):
+        """
+        Internal function that rasterizes given characters with the font of the given layout into a glyph atlas
+        :param layout: stamp.StampLayout
+        :param characters: str
+        :param file_path: str, path where glyph atlas image is stored
+        :param ffmpeg_executable: str or None
+        :return: rawstamp.GlyphAtlas or None
+        """
+
+        text_font = self._get_stamp_font(layout.font_file, layout.font_family, layout.font_size)
+        font_metrics = QFontMetrics(text_font)
+
+        glyph_boxes = OrderedDict()
+        atlas_width = 0
+        for character in sorted(set(characters)):
+            character_width = font_metrics.width(character)
+            glyph_boxes[character] = (atlas_width, character_width)
+            atlas_width += character_width
+        if not atlas_width:
+            return None
+
+        glyph_atlas = QImage(atlas_width, font_metrics.height(), QImage.Format_ARGB32)
+        glyph_atlas.fill(Qt.transparent)
+        painter = QPainter(glyph_atlas)
+        try:
+            painter.setRenderHint(QPainter.TextAntialiasing)
+            painter.setFont(text_font)
+            painter.setPen(QColor(layout.font_color))
+            for character, (x, character_width) in glyph_boxes.items():
+                painter.drawText(
+                    QRect(x, 0, character_width, font_metrics.height()), Qt.AlignLeft | Qt.AlignTop, character)
+        finally:
+            painter.end()
+
+        if not glyph_atlas.save(file_path):
+            LOGGER.warning('Impossible to render stamp glyph atlas: "{}"'.format(file_path))
+            return None
+
+        return rawstamp.GlyphAtlas(
+            rawstamp.read_image(
+                file_path, atlas_width, font_metrics.height(), ffmpeg_executable=ffmpeg_executable), glyph_boxes,
+            ascent=font_metrics.ascent())
+
+    def _stamp_image_frames(self, sequence, output, layout, config_dict, output_specs=None):
+        """
+        Internal function that stamps given image sequence frame by frame using intermediate frames and encodes them
+        into given output
+        Frames are stamped in windows while an FFMpeg encoder reads the already stamped frames through a pipe, and
+        intermediate frames are deleted as soon as they are encoded, so scratch disk usage is bounded by the
+        'max_in_flight_frames' config value and not by the length of the sequence
+        Outputs are encoded into partial files that only replace the outputs when the whole sequence is encoded, so a
+        failed stamp never leaves truncated outputs. Intermediate frames are always removed
+        :param sequence: fileseq.FileSequence
+        :param output: str
+        :param layout: stamp.StampLayout
+        :param config_dict: dict
+        :param output_specs: list(stamp.OutputSpec) or None, outputs generated from the stamped frames
+        :return: str or None
+        """
+
+        output_specs = output_specs or stamp.get_output_specs(output)
+        max_in_flight_frames = config_dict.get('max_in_flight_frames', stamp.DEFAULT_MAX_IN_FLIGHT_FRAMES)
+        workers = config_dict.get('workers', None)
+        chunk_size = config_dict.get('chunk_size', stamp.DEFAULT_CHUNK_SIZE)
+        max_missing_frames = int(len(sequence) * config_dict.get(
+            'max_missing_frames_ratio', stamp.DEFAULT_MAX_MISSING_FRAMES_RATIO))
+
+        # Empty frame is rendered with Qt when the stamp is prepared, in the calling thread
+        empty_frame = layout.empty_frame
+
+        # One window is encoded while the next one is stamped and another one waits in the queue
+        windows = stamp.split_in_chunks(list(enumerate(sequence)), chunk_size=max(1, max_in_flight_frames // 3))
+
+        window_frames = list()
+
+        def _stamp_windows():
+            for window in windows:
+                frame_outputs = OrderedDict()
+                for i, frame in window:
+                    new_file_path = self._get_temp_file_path(empty_frame, 'main', index=i)
+                    window_frames.append(new_file_path)
+                    frame_outputs[new_file_path] = self._get_frame_stamp_output(
+                        frame, i, empty_frame, layout, new_file_path)
+                # Missing frames are checked against the whole sequence and not against each window
+                frame_paths, missing_frames = self._render_frames(
+                    frame_outputs, workers=workers, chunk_size=chunk_size, max_missing_frames_ratio=1.0)
+                yield frame_paths, missing_frames
+
+        stamped_windows = stamp.iter_in_background(_stamp_windows(), max_items=1)
+
+        def _read_stamped_frames():
+            missing_frames_count = 0
+            for frame_paths, missing_frames in stamped_windows:
+                missing_frames_count += len(missing_frames)
+                if not frame_paths or missing_frames_count > max_missing_frames:
+                    for frame_path in frame_paths or list():
+                        self._remove_temp_file(frame_path)
+                    raise stamp.StampError('{} frames of "{}" were not generated (maximum allowed: {})'.format(
+                        missing_frames_count, output, max_missing_frames))
+                for frame_path in frame_paths:
+                    with open(frame_path, 'rb') as fh:
+                        frame_data = fh.read()
+                    self._remove_temp_file(frame_path)
+                    yield frame_data
+
+        partial_output_specs = stamp.get_partial_output_specs(output_specs)
+        encode_args = ['-f', 'image2pipe', '-framerate', layout.fps, '-i', '-'] + stamp.get_outputs_args(
+            stamp.build_timecode_filter_graph(layout), partial_output_specs, fps=layout.fps,
+            frames_count=len(sequence))
+        try:
+            frames_count = stamp.pipe_to_ffmpeg(
+                _read_stamped_frames(), encode_args, ffmpeg_executable=self._get_ffmpeg_executable())
+            if not frames_count or not os.path.isfile(partial_output_specs[0].path):
                 LOGGER.warning('Some frames were not generated properly. Aborting operation ...')
                 return
-
-        video_file_path = self._get_temp_file_path(source, 'video')
-        if not video_file_path.endswith('.mp4'):
-            video_file_path_split = os.path.splitext(video_file_path)
-            video_file_path = '{}.mp4'.format(video_file_path_split[0])
-        ffmpeglib.create_video_from_sequence_file(frame_paths[0], video_file_path)
-        if not os.path.isfile(video_file_path):
-            LOGGER.error('Error while stamping playblast video ...')
+            stamp.commit_partial_outputs(partial_output_specs, output_specs)
+        except (stamp.StampError, IOError, OSError) as exc:
+            LOGGER.error('Error while stamping playblast video "{}" | {}'.format(output, exc))
             return
+        finally:
+            # Stops the window that is being stamped (if any) before removing the frames it generates
+            stamped_windows.close()
+            for frame_path in window_frames:
+                self._remove_temp_file(frame_path)
+            stamp.discard_partial_outputs(partial_output_specs)
 
-        # scale = ffmpeglib.scale_video(video_file_path, 1920, 1080)
-        # ffmpeglib.save_to_file(scale, output, run_stream=True)
+        return output
 
-        draw_timestamp_stream = ffmpeglib.draw_timestamp_on_video(
-            video_file_path, text='Time: ', x=40, y=res_y - font_height - text_margin_y - 20,
-            font_file=font_file, font_size=font_size, timecode_rate=fps, timecode=framecode)
-        ffmpeglib.save_to_file(draw_timestamp_stream, output, run_stream=True)
+    def _stamp_image_incremental(self, sequence, output, layout, config_dict, output_specs=None):
+        """
+        Internal function that stamps given image sequence reusing stamped frames of a previous stamp of the same
+        output. Only frames whose source pixels or overlay changed are stamped again. Stamped frames are stored next to
+        the output together with a manifest that stores the hashes used to detect changed frames
+        :param sequence: fileseq.FileSequence
+        :param output: str
+        :param layout: stamp.StampLayout
+        :param config_dict: dict
+        :param output_specs: list(stamp.OutputSpec) or None, outputs generated from the stamped frames
+        :return: str or None
+        """
+
+        output_specs = output_specs or stamp.get_output_specs(output)
+        stamped_frames_dir = self._get_stamped_frames_directory(output)
+        if not os.path.isdir(stamped_frames_dir):
+            os.makedirs(stamped_frames_dir)
+
+        manifest = stamp.StampManifest(self._get_stamp_manifest_path(output)).load()
+        layout_hash = stamp.get_layout_hash(layout)
+
+        empty_frame = layout.empty_frame
+        frames_to_stamp = OrderedDict()
+        frame_outputs = OrderedDict()
+        for i, frame in enumerate(sequence):
+            stamped_frame = path_utils.clean_path(os.path.join(stamped_frames_dir, 'stamped.{}.png'.format(
+                str(i).zfill(4))))
+            source_hash = manifest.get_source_hash(frame)
+            overlay_hash = stamp.hash_values(layout_hash, layout.get_frame_text(i))
+            if manifest.is_frame_valid(frame, source_hash, overlay_hash, stamped_frame):
+                continue
+            self._remove_temp_file(stamped_frame)
+            frames_to_stamp[stamped_frame] = (frame, source_hash, overlay_hash)
+            frame_outputs[stamped_frame] = self._get_frame_stamp_output(frame, i, empty_frame, layout, stamped_frame)
+
+        LOGGER.info('Stamping {} of {} frames of "{}" ...'.format(len(frame_outputs), len(sequence), output))
+        manifest.clean(list(sequence))
+        if frame_outputs:
+            frame_paths, missing_frames = self._render_frames(
+                frame_outputs, workers=config_dict.get('workers', None),
+                chunk_size=config_dict.get('chunk_size', stamp.DEFAULT_CHUNK_SIZE),
+                max_missing_frames_ratio=config_dict.get(
+                    'max_missing_frames_ratio', stamp.DEFAULT_MAX_MISSING_FRAMES_RATIO))
+            for stamped_frame, (frame, source_hash, overlay_hash) in frames_to_stamp.items():
+                if not os.path.isfile(stamped_frame) or stamped_frame in (missing_frames or list()):
+                    manifest.remove_frame(frame)
+                    continue
+                manifest.set_frame(frame, source_hash, overlay_hash, stamped_frame)
+            if frame_paths is None:
+                manifest.save()
+                LOGGER.error('Too many frames of "{}" were not stamped. Aborting operation ...'.format(output))
+                return None
+        manifest.save()
+
+        # Stamped frames from a previous and longer version of the sequence are not needed anymore
+        stamped_frames = fileseq.findSequencesOnDisk(stamped_frames_dir)
+        for stamped_sequence in stamped_frames:
+            for stamped_frame_index in stamped_sequence.frameSet() or list():
+                if stamped_frame_index >= len(sequence):
+                    self._remove_temp_file(stamped_sequence.frame(stamped_frame_index))
+
+        input_args = stamp.get_image_sequence_input_args(
+            path_utils.clean_path(os.path.join(stamped_frames_dir, 'stamped.%04d.png')), start_number=0,
+            fps=layout.fps)
+        try:
+            stamp.run_ffmpeg(
+                input_args + stamp.get_outputs_args(
+                    stamp.build_timecode_filter_graph(layout), output_specs, fps=layout.fps,
+                    frames_count=len(sequence)), ffmpeg_executable=self._get_ffmpeg_executable())
+        except stamp.StampError as exc:
+            LOGGER.error('Error while encoding stamped frames of "{}" | {}'.format(output, exc))
+            return
 
         return output
 
+    def _get_frame_stamp_output(self, frame, frame_index, empty_frame, layout, output_path):
+        """
+        Internal function that returns FFMpeg output that stamps given frame into given output path
+        :param frame: str, path of the frame to stamp
+        :param frame_index: int, index of the frame in its sequence
+        :param empty_frame: str, path of the empty image used as background
+        :param layout: stamp.StampLayout
+        :param output_path: str
+        :return: ffmpeg.nodes.OutputStream
+        """
+
+        # Overlay playblast
+        stream = ffmpeglib.overlay_inputs(empty_frame, frame, y=layout.top_band_height)
+
+        if layout.static_layer:
+            # Overlay bands and texts precomposited in the static layer
+            stream = ffmpeglib.overlay_inputs(stream, layout.static_layer)
+        else:
+            # Overlay top and bottom bands
+            if layout.top_band:
+                stream = ffmpeglib.overlay_inputs(stream, layout.top_band)
+            if layout.bottom_band:
+                stream = ffmpeglib.overlay_inputs(
+                    stream, layout.bottom_band, y=layout.height - layout.bottom_band_height)
+
+            # Draw task, comment, camera, focal length, user and shot texts
+            for stamp_text in layout.texts:
+                stream = ffmpeglib.draw_text(
+                    stream, stamp_text.text, x=stamp_text.x, y=stamp.get_text_y(stamp_text.y),
+                    font_file=layout.font_file, font_size=layout.font_size)
+
+        # Draw frame
+        frame_x, frame_y = layout.frame_text_position
+        stream = ffmpeglib.draw_text(
+            stream, layout.get_frame_text(frame_index), x=frame_x, y=stamp.get_text_y(frame_y),
+            font_file=layout.font_file, font_size=layout.font_size)
+
+        return ffmpeglib.save_to_file(stream, output_path)
+
+    def _render_frames(self, frame_outputs, workers=None, chunk_size=stamp.DEFAULT_CHUNK_SIZE,
+                       max_missing_frames_ratio=stamp.DEFAULT_MAX_MISSING_FRAMES_RATIO):
+        """
+        Internal function that renders given frame outputs splitting them in chunks that are executed in parallel
+        Frames that fail are replaced by its closest valid frame, so a bad frame does not invalidate the whole job. If
+        too many frames fail, frames are not replaced and the render fails
+        :param frame_outputs: OrderedDict, dictionary mapping frame paths with its FFMpeg outputs
+        :param workers: int or None, maximum number of chunks rendered at the same time
+        :param chunk_size: int, number of frames rendered by each chunk
+        :param max_missing_frames_ratio: float, maximum ratio of frames that can be replaced by its closest valid frame
+        :return: tuple(list(str), list(str)), ordered list of rendered frame paths (or None if the render failed)
+            and list of frame paths that were not rendered
+        """
+
+        chunks = stamp.split_in_chunks(frame_outputs.items(), chunk_size=chunk_size)
+        chunk_results = stamp.run_chunks(self._render_frames_chunk, chunks, workers=workers)
+
+        frame_paths = list()
+        for chunk_result in chunk_results:
+            if not chunk_result.success:
+                LOGGER.warning('Stamp chunk {} failed: {}'.format(chunk_result.index, chunk_result.error))
+            frame_paths.extend([frame_path for frame_path, _ in chunk_result.items])
+
+        valid_frames = [frame_path for frame_path in frame_paths if os.path.isfile(frame_path)]
+        valid_frames_set = set(valid_frames)
+        missing_frames = [frame_path for frame_path in frame_paths if frame_path not in valid_frames_set]
+        max_missing_frames = int(len(frame_paths) * max(0.0, max_missing_frames_ratio or 0.0))
+        if not valid_frames or len(missing_frames) > max_missing_frames:
+            LOGGER.warning('{} of {} frames were not generated (maximum allowed: {})'.format(
+                len(missing_frames), len(frame_paths), max_missing_frames))
+            return None, missing_frames
+
+        last_valid_frame = valid_frames[0]
+        for frame_path in frame_paths:
+            if frame_path in valid_frames_set:
+                last_valid_frame = frame_path
+                continue
+            LOGGER.warning('Frame "{}" was not generated. Using "{}" instead ...'.format(frame_path, last_valid_frame))
+            shutil.copyfile(last_valid_frame, frame_path)
+
+        return frame_paths, missing_frames
+
+    def _render_frames_chunk(self, chunk):
+        """
+        Internal function that renders a chunk of frames. If the chunk fails, its frames are rendered one by one
+        :param chunk: list(tuple(str, ffmpeg.nodes.OutputStream))
+        :return: list(str), list of frame paths that were not rendered
+        """
+
+        try:
+            ffmpeglib.run_multiples_outputs_at_once([frame_output for _, frame_output in chunk])
+        except Exception as exc:
+            LOGGER.warning('Error while rendering frames chunk. Rendering frames one by one ... | {}'.format(exc))
+
+        missing_frames = list()
+        for frame_path, frame_output in chunk:
+            if os.path.isfile(frame_path):
+                continue
+            try:
+                ffmpeglib.launch_stream(frame_output)
+            except Exception as exc:
+                LOGGER.warning('Error while rendering frame "{}" | {}'.format(frame_path, exc))
+            if not os.path.isfile(frame_path):
+                missing_frames.append(frame_path)
+
+        return missing_frames
+
+    def _get_ffmpeg_executable(self):
+        """
+        Internal function that returns FFMpeg executable used to stamp
+        :return: str or None
+        """
+
+        return stamp.find_ffmpeg_executable(ffmpeg_lib.get_ffmpeg_executable())
+
+    def _get_sequence_pattern(self, sequence):
+        """
+        Internal function that returns FFMpeg pattern of the given image sequence (image.%04d.png)
+        :param sequence: fileseq.FileSequence
+        :return: str
+        """
+
+        return path_utils.clean_path('{}{}%0{}d{}'.format(
+            sequence.dirname(), sequence.basename(), sequence.zfill(), sequence.extension()))
+
+    def _get_stamped_frames_directory(self, output):
+        """
+        Internal function that returns directory where stamped frames of the given output are stored
+        :param output: str
+        :return: str
+        """
+
+        return path_utils.clean_path('{}_stamped_frames'.format(os.path.splitext(output)[0]))
+
+    def _get_stamp_manifest_path(self, output):
+        """
+        Internal function that returns path of the stamp manifest of the given output
+        :param output: str
+        :return: str
+        """
+
+        return path_utils.clean_path('{}.stamp.json'.format(os.path.splitext(output)[0]))
+
+    def _get_static_layer_path(self, source, temp_dir):
+        """
+        Internal function that returns path where static stamp layer of the given source is stored
+        :param source: str
+        :param temp_dir: str, temporary folder of the stamp
+        :return: str
+        """
+
+        return self._get_temp_file_path(
+            os.path.join(temp_dir, '{}.png'.format(os.path.splitext(os.path.basename(source))[0])), 'overlay')
+
+    def _create_temp_directory(self, config_dict):
+        """
+        Internal function that creates the folder where temporary files of a stamp are stored
+        :param config_dict: dict, 'temp_path' config value can be used to create the folder in a specific location
+        :return: str
+        """
+
+        return path_utils.clean_path(tempfile.mkdtemp(prefix='solstice_stamp_', dir=config_dict.get('temp_path', None)))
+
+    def _remove_temp_directory(self, temp_dir):
+        """
+        Internal function that removes given temporary folder and all its contents
+        :param temp_dir: str
+        """
+
+        if not temp_dir or not os.path.isdir(temp_dir):
+            return
+
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _remove_temp_file(self, file_path):
+        """
+        Internal function that removes given temporary file
+        :param file_path: str
+        """
+
+        if not file_path or not os.path.isfile(file_path):
+            return
+
+        try:
+            os.remove(file_path)
+        except Exception:
+            LOGGER.warning('Impossible to remove temporary stamp file: {}'.format(file_path))
+
     def _get_temp_file_path(self, file_path, suffix=None, index=None, padding=4):
         if not suffix:
             suffix = 'new'
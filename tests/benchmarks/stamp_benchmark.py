@@ -0,0 +1,380 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark suite for solstice stamp backends
+Generates a synthetic image sequence and stamps it with SolsticeMediaManager.stamp_image using each stamp backend,
+reporting frames per second, peak RSS and scratch bytes written as JSON. Stamps run through the same code used in
+production, so the pipeline environment (Qt, tpDcc and artellapipe) is needed. Qt uses its offscreen platform, so
+it can be run headless:
+
+    python -m tests.benchmarks.stamp_benchmark --width 1920 --height 1080 --frames 100 --output results.json
+
+Each backend is executed in its own process, so peak RSS values are not shared between backends. Results report
+the stamp paths that were executed, so a backend that falls back to another one is not reported as its own
+"""
+
+from __future__ import print_function, division, absolute_import
+
+__author__ = "Tomas Poveda"
+__license__ = "MIT"
+__maintainer__ = "Tomas Poveda"
+__email__ = "tpovedatd@gmail.com"
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from solstice.core import stamp, rawstamp
+
+# Defines the backends that can be benchmarked
+BACKENDS = [stamp.StampModes.FILTERGRAPH, stamp.StampModes.FRAMES, stamp.StampModes.NUMPY]
+
+# Defines the first frame of the synthetic sequences
+START_FRAME = 1001
+
+
+class ScratchMonitor(object):
+    """
+    Class that samples the size of the files created in the given directories in a background thread
+    """
+
+    def __init__(self, scratch_dirs, ignored_files=None, interval=0.05):
+        super(ScratchMonitor, self).__init__()
+
+        self._scratch_dirs = list(OrderedDict.fromkeys(scratch_dirs))
+        self._ignored_files = set(os.path.normpath(file_path) for file_path in ignored_files or list())
+        self._interval = interval
+        self._files = dict()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self.peak_bytes = 0
+
+    @property
+    def written_bytes(self):
+        """
+        Returns the bytes written in the scratch directory (biggest sampled size of each file ever seen)
+        :return: int
+        """
+
+        return sum(self._files.values())
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        self._sample()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._sample()
+            self._stop_event.wait(self._interval)
+
+    def _sample(self):
+        total_bytes = 0
+        for root, _, file_names in (walk for scratch_dir in self._scratch_dirs for walk in os.walk(scratch_dir)):
+            for file_name in file_names:
+                file_path = os.path.normpath(os.path.join(root, file_name))
+                if file_path in self._ignored_files:
+                    continue
+                try:
+                    file_size = os.path.getsize(file_path)
+                except OSError:
+                    continue
+                total_bytes += file_size
+                self._files[file_path] = max(self._files.get(file_path, 0), file_size)
+        self.peak_bytes = max(self.peak_bytes, total_bytes)
+
+
+def generate_sequence(frames_dir, width, height, frames_count, ffmpeg_executable=None):
+    """
+    Generates a synthetic PNG image sequence
+    :param frames_dir: str
+    :param width: int
+    :param height: int
+    :param frames_count: int
+    :param ffmpeg_executable: str or None
+    :return: str, printf style pattern of the generated sequence
+    """
+
+    if not os.path.isdir(frames_dir):
+        os.makedirs(frames_dir)
+    sequence_pattern = os.path.join(frames_dir, 'frame.%04d.png')
+    stamp.run_ffmpeg(
+        ['-f', 'lavfi', '-i', 'testsrc2=size={}x{}:rate=24'.format(width, height), '-frames:v', frames_count,
+         '-start_number', START_FRAME, sequence_pattern], ffmpeg_executable=ffmpeg_executable)
+
+    return sequence_pattern
+
+
+def generate_band(band_path, width, height, color='0x303030', ffmpeg_executable=None):
+    """
+    Generates a solid color band image
+    :param band_path: str
+    :param width: int
+    :param height: int
+    :param color: str
+    :param ffmpeg_executable: str or None
+    :return: str or None
+    """
+
+    if not height:
+        return None
+
+    stamp.run_ffmpeg(
+        ['-f', 'lavfi', '-i', 'color=c={}:s={}x{}'.format(color, width, height), '-frames:v', 1, band_path],
+        ffmpeg_executable=ffmpeg_executable)
+
+    return band_path
+
+
+def get_config(backend, options):
+    """
+    Returns the stamp configuration used by all the backends
+    :param backend: str
+    :param options: dict
+    :return: dict
+    """
+
+    return {
+        'stamp_mode': backend, 'top_band': options['top_band_path'], 'bottom_band': options['bottom_band_path'],
+        'task_name': 'Animation', 'task_comment': 'Benchmark comment', 'shot_name': 'shot_010',
+        'camera': 'No camera', 'start_frame': START_FRAME, 'workers': options['workers'],
+        'max_in_flight_frames': options['max_in_flight_frames'], 'temp_path': options['scratch_path']}
+
+
+def get_media_manager():
+    """
+    Returns the media manager used to stamp. Qt is initialized with its offscreen platform, so text is rasterized
+    by the same code used in production without a display
+    :return: SolsticeMediaManager
+    """
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from Qt.QtWidgets import QApplication
+    if not QApplication.instance():
+        get_media_manager.app = QApplication([])
+
+    import artellapipe.register
+    if not hasattr(artellapipe, 'Tracker'):
+        # Stamps only query the user name and the frame rate of the project, so no tracking server is needed
+        artellapipe.register.register_class('Tracker', BenchmarkTracker)
+
+    from solstice.managers import media
+
+    return media.SolsticeMediaManager()
+
+
+class BenchmarkTracker(object):
+    """
+    Class that provides the tracking values used by stamps when the benchmark runs outside a project
+    """
+
+    def get_user_name(self):
+        return 'benchmark'
+
+    def is_tracking_available(self):
+        return False
+
+
+def track_stamp_paths(media_manager, stamp_paths):
+    """
+    Records which stamp paths of the given media manager are executed, so fallbacks between backends are reported
+    :param media_manager: SolsticeMediaManager
+    :param stamp_paths: list, list where executed (path, result) pairs are stored
+    """
+
+    def _get_tracked_method(backend, method):
+        def _tracked_method(*args, **kwargs):
+            result = method(*args, **kwargs)
+            stamp_paths.append((backend, bool(result)))
+            return result
+        return _tracked_method
+
+    for backend, method_name in (
+            (stamp.StampModes.FILTERGRAPH, '_stamp_image_filter_graph'),
+            (stamp.StampModes.FRAMES, '_stamp_image_frames'),
+            (stamp.StampModes.NUMPY, '_stamp_image_numpy')):
+        setattr(media_manager, method_name, _get_tracked_method(backend, getattr(media_manager, method_name)))
+
+
+def get_peak_rss():
+    """
+    Returns peak resident set size (in bytes) of this process and of its biggest child process
+    :return: tuple(int or None, int or None)
+    """
+
+    if not resource:
+        return None, None
+
+    # ru_maxrss is returned in kilobytes on Linux and in bytes on macOS
+    multiplier = 1 if sys.platform == 'darwin' else 1024
+
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * multiplier,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * multiplier)
+
+
+def run_backend(backend, options):
+    """
+    Stamps the synthetic sequence with the given backend through the media manager and returns its benchmark result
+    :param backend: str
+    :param options: dict
+    :return: dict
+    """
+
+    media_manager = get_media_manager()
+    stamp_paths = list()
+    track_stamp_paths(media_manager, stamp_paths)
+
+    # Media manager writes its temporary files into its temporary folder, next to the sequence and next to the output
+    scratch_dirs = [
+        options['scratch_path'], os.path.dirname(options['sequence_pattern']), os.path.dirname(options['output_path'])]
+    monitor = ScratchMonitor(scratch_dirs, ignored_files=options['sequence_files'] + [options['output_path']])
+    result = OrderedDict([('backend', backend)])
+    monitor.start()
+    start_time = time.time()
+    try:
+        output = media_manager.stamp_image(
+            options['sequence_pattern'] % START_FRAME, options['output_path'], config_dict=get_config(backend, options))
+        elapsed = time.time() - start_time
+        if not output or not os.path.isfile(options['output_path']):
+            raise stamp.StampError('Stamp did not generate "{}"'.format(options['output_path']))
+        result['frames'] = options['frames']
+        result['seconds'] = round(elapsed, 3)
+        result['fps'] = round(options['frames'] / elapsed, 2) if elapsed else None
+        result['output_bytes'] = os.path.getsize(options['output_path'])
+    except Exception as exc:
+        result['error'] = str(exc)
+    finally:
+        monitor.stop()
+
+    result['stamp_paths'] = ['{}:{}'.format(path, 'ok' if success else 'failed') for path, success in stamp_paths]
+    result['fallback'] = not stamp_paths or stamp_paths[0][0] != backend or not stamp_paths[0][1]
+    result['peak_rss_bytes'], result['peak_children_rss_bytes'] = get_peak_rss()
+    result['peak_scratch_bytes'] = monitor.peak_bytes
+    result['scratch_bytes_written'] = monitor.written_bytes
+
+    return result
+
+
+def run_backend_process(backend, options):
+    """
+    Runs the benchmark of the given backend in a new Python process
+    :param backend: str
+    :param options: dict
+    :return: dict
+    """
+
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'tests.benchmarks.stamp_benchmark', '--run-backend', backend,
+         '--options', json.dumps(options)], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    if process.returncode != 0:
+        return OrderedDict([('backend', backend), ('error', err.decode('utf-8', 'replace').strip())])
+
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1], object_pairs_hook=OrderedDict)
+
+
+def run_benchmark(options):
+    """
+    Generates the synthetic sequence and benchmarks all the requested backends
+    :param options: dict
+    :return: dict
+    """
+
+    work_dir = tempfile.mkdtemp(prefix='stamp_benchmark_')
+    try:
+        options['work_dir'] = work_dir
+        options['scratch_path'] = os.path.join(work_dir, 'scratch')
+        os.makedirs(options['scratch_path'])
+        options['sequence_pattern'] = generate_sequence(
+            os.path.join(work_dir, 'frames'), options['width'], options['height'], options['frames'],
+            ffmpeg_executable=options['ffmpeg_executable'])
+        options['sequence_files'] = [
+            options['sequence_pattern'] % (START_FRAME + i) for i in range(options['frames'])]
+        options['top_band_path'] = generate_band(
+            os.path.join(work_dir, 'top_band.png'), options['width'], options['top_band'],
+            ffmpeg_executable=options['ffmpeg_executable'])
+        options['bottom_band_path'] = generate_band(
+            os.path.join(work_dir, 'bottom_band.png'), options['width'], options['bottom_band'],
+            ffmpeg_executable=options['ffmpeg_executable'])
+
+        results = list()
+        for backend in options['backends']:
+            for _ in range(options['repeat']):
+                options['output_path'] = os.path.join(work_dir, 'output', '{}.mp4'.format(backend))
+                if not os.path.isdir(os.path.dirname(options['output_path'])):
+                    os.makedirs(os.path.dirname(options['output_path']))
+                results.append(run_backend_process(backend, options))
+                if os.path.isfile(options['output_path']):
+                    os.remove(options['output_path'])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    settings = OrderedDict((key, options[key]) for key in (
+        'width', 'height', 'frames', 'top_band', 'bottom_band', 'max_in_flight_frames', 'workers', 'repeat'))
+
+    return OrderedDict([
+        ('python', platform.python_version()), ('platform', platform.platform()),
+        ('numpy', rawstamp.np.__version__ if rawstamp.is_available() else None),
+        ('settings', settings), ('results', results)])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmarks solstice stamp backends with a synthetic sequence')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--frames', type=int, default=48)
+    parser.add_argument('--top-band', type=int, default=100)
+    parser.add_argument('--bottom-band', type=int, default=100)
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--max-in-flight-frames', type=int, default=stamp.DEFAULT_MAX_IN_FLIGHT_FRAMES)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--ffmpeg', default=None, help='FFMpeg executable. If not given, PATH is searched')
+    parser.add_argument('--output', default=None, help='JSON file where results are stored')
+    parser.add_argument('--run-backend', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--options', default=None, help=argparse.SUPPRESS)
+    parsed_args = parser.parse_args(args)
+
+    if parsed_args.run_backend:
+        print(json.dumps(run_backend(parsed_args.run_backend, json.loads(parsed_args.options))))
+        return
+
+    backends = [backend.strip() for backend in parsed_args.backends.split(',') if backend.strip()]
+    invalid_backends = [backend for backend in backends if backend not in BACKENDS]
+    if invalid_backends:
+        parser.error('Invalid backends: {}. Valid backends: {}'.format(invalid_backends, BACKENDS))
+
+    report = run_benchmark({
+        'width': parsed_args.width, 'height': parsed_args.height, 'frames': parsed_args.frames,
+        'top_band': parsed_args.top_band, 'bottom_band': parsed_args.bottom_band, 'backends': backends,
+        'max_in_flight_frames': parsed_args.max_in_flight_frames, 'workers': parsed_args.workers,
+        'repeat': max(1, parsed_args.repeat),
+        'ffmpeg_executable': stamp.find_ffmpeg_executable(parsed_args.ffmpeg)})
+
+    report_data = json.dumps(report, indent=4)
+    if parsed_args.output:
+        with open(parsed_args.output, 'w') as fh:
+            fh.write(report_data)
+    print(report_data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains tests for solstice scene asset nodes index
+"""
+
+import sys
+import types
+import importlib
+
+import pytest
+
+import solstice.core
+
+
+class _AssetNode(object):
+    def __init__(self, namespace):
+        self.id = namespace
+        self.node = '|{0}:root'.format(namespace.lstrip(':'))
+        self.asset = None
+
+    def get_tag_node(self):
+        return None
+
+
+class _AssetsMgr(object):
+    def __init__(self, namespaces):
+        self.namespaces = list(namespaces)
+        self.queries = list()
+
+    def get_scene_assets(self, node_id=None):
+        self.queries.append(node_id)
+        if node_id is not None:
+            return _AssetNode(node_id) if node_id in self.namespaces else None
+        return [_AssetNode(namespace) for namespace in self.namespaces] or None
+
+
+@pytest.fixture
+def sceneindex(monkeypatch):
+    # Index only talks to the DCC and to Artella through tpDcc and artellapipe modules, so they are replaced
+    tpdcc = types.ModuleType('tpDcc')
+    tpdcc.is_maya = lambda: False
+    tpdcc_managers = types.ModuleType('tpDcc.managers')
+    tpdcc_managers.callbacks = types.ModuleType('tpDcc.managers.callbacks')
+    tpdcc.managers = tpdcc_managers
+    artellapipe = types.ModuleType('artellapipe')
+    for module_name, module in (
+            ('tpDcc', tpdcc), ('tpDcc.managers', tpdcc_managers),
+            ('tpDcc.managers.callbacks', tpdcc_managers.callbacks), ('artellapipe', artellapipe)):
+        monkeypatch.setitem(sys.modules, module_name, module)
+    monkeypatch.delitem(sys.modules, 'solstice.core.sceneindex', raising=False)
+    monkeypatch.delattr(solstice.core, 'sceneindex', raising=False)
+
+    module = importlib.import_module('solstice.core.sceneindex')
+    monkeypatch.setattr(module.AssetNodesIndex, 'register_callbacks', lambda self: setattr(
+        self, '_callbacks_registered', True))
+    monkeypatch.setattr(module, '_invalidate_kinds', lambda: None)
+    monkeypatch.setattr(module, '_get_asset_nodes_kinds', lambda asset_nodes: dict(
+        (asset_node, 'other') for asset_node in asset_nodes))
+    yield module
+
+    sys.modules.pop('solstice.core.sceneindex', None)
+    if hasattr(solstice.core, 'sceneindex'):
+        delattr(solstice.core, 'sceneindex')
+
+
+@pytest.fixture
+def assets_mgr(sceneindex, monkeypatch):
+    assets_mgr = _AssetsMgr([':chair', 'table', 'set:lamp'])
+    monkeypatch.setattr(sceneindex.artellapipe, 'AssetsMgr', lambda: assets_mgr, raising=False)
+
+    return assets_mgr
+
+
+def test_get_node_namespaces(sceneindex):
+    assert sceneindex._get_node_namespaces('pCube1') == list()
+    assert sceneindex._get_node_namespaces('') == list()
+    assert sceneindex._get_node_namespaces(':chair:root') == ['chair']
+    assert sceneindex._get_node_namespaces('set:chair:root') == ['set', 'set:chair']
+    assert sceneindex._get_node_namespaces('|set:chair:root|set:chair:geo|set:chair:body') == ['set', 'set:chair']
+    assert sceneindex._get_node_namespaces('|group1|pCube1') == list()
+
+
+def test_invalidate_only_indexes_dirty_namespaces(sceneindex, assets_mgr):
+    index = sceneindex.AssetNodesIndex()
+    index.invalidate('chair')
+    assert not index._dirty_namespaces
+
+    assert len(index) == 3
+    assert assets_mgr.queries == [None]
+    assert index.get_asset_node_by_namespace(':chair').id == ':chair'
+
+    index._on_node_changed('|chair:root|chair:geo', 'chair:geo')
+    index._on_node_changed('|set:lamp:root', None)
+    index.invalidate(':missing')
+    assert index._dirty_namespaces == {'chair', 'set', 'set:lamp', 'missing'}
+    assert index.get_node_kind('|chair:root', update=False) is None
+    assert index.get_node_kind('|table:root', update=False) == 'other'
+
+    assets_mgr.namespaces.remove('table')
+    assets_mgr.namespaces.remove('set:lamp')
+    assert index.get_asset_node_by_namespace('set:lamp') is None
+    assert not index._dirty_namespaces
+    # Dirty namespaces are indexed again with a single scene query. Clean namespaces are kept
+    assert assets_mgr.queries == [None, None]
+    assert index.get_asset_node_by_namespace('chair').id == ':chair'
+    assert index.get_asset_node_by_namespace('table').node == '|table:root'
+
+    index.invalidate()
+    assert len(index) == 1
+    assert assets_mgr.queries == [None, None, None]
@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains tests for solstice shader mapping
+"""
+
+import json
+from collections import OrderedDict
+
+from solstice.core import shadermapping
+
+MAPPING_DATA = OrderedDict([
+    ('|prop|bodyShape', OrderedDict([('bodySG', ['body_mat']), ('sharedSG', ['shared_mat'])])),
+    ('|prop|eyeShape', OrderedDict([('sharedSG', ['shared_mat']), ('eyeSG', [])]))
+])
+
+
+def test_shader_mapping_indexes():
+    mapping = shadermapping.ShaderMapping(MAPPING_DATA)
+
+    assert len(mapping) == 2
+    assert mapping.get_shaders() == ['body_mat', 'shared_mat']
+    assert mapping.get_shader_geometries('shared_mat') == ['|prop|bodyShape', '|prop|eyeShape']
+    assert mapping.get_shader_shading_groups('shared_mat') == ['sharedSG']
+    assert mapping.get_shading_geometry_mapping() == {
+        '|prop|bodyShape': ['body_mat', 'shared_mat'], '|prop|eyeShape': ['shared_mat']}
+    assert mapping.get_shading_group_shader_mapping() == {
+        'bodySG': ['body_mat'], 'sharedSG': ['shared_mat'], 'eyeSG': []}
+    assert mapping.get_shading_group_geometry_mapping() == {
+        'bodySG': ['|prop|bodyShape'], 'sharedSG': ['|prop|bodyShape', '|prop|eyeShape'], 'eyeSG': ['|prop|eyeShape']}
+
+
+def test_shader_mapping_relations_round_trip():
+    mapping = shadermapping.ShaderMapping(MAPPING_DATA)
+
+    assert shadermapping.ShaderMapping.from_relations(mapping.iter_relations()).data == MAPPING_DATA
+
+
+def test_shader_mapping_cache(tmpdir):
+    mapping_file = tmpdir.join('mapping.json')
+    mapping_file.write(json.dumps(MAPPING_DATA))
+    other_file = tmpdir.join('other.json')
+    other_file.write(json.dumps({'|other|otherShape': {'otherSG': ['other_mat']}}))
+    cache = shadermapping.ShaderMappingCache(max_entries=1)
+
+    mapping = cache.get_mapping(str(mapping_file))
+    assert cache.get_mapping(str(mapping_file)) is mapping
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.get_mapping(str(other_file))
+    assert len(cache) == 1
+    assert cache.get_mapping(str(mapping_file)) is not mapping
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    mapping_file.write(json.dumps({'|prop|bodyShape': {'bodySG': ['new_mat']}}))
+    assert cache.get_mapping(str(mapping_file)).get_shaders() == ['new_mat']
+
+
+def test_compact_shader_mapping_file(tmpdir):
+    json_file = tmpdir.join('mapping.json')
+    json_file.write(json.dumps(MAPPING_DATA))
+    compact_file = str(tmpdir.join('mapping.compact'))
+
+    shadermapping.write_shader_mapping_file(compact_file, MAPPING_DATA)
+    compact_mapping = shadermapping.load_shader_mapping_file(compact_file)
+
+    assert compact_mapping.data == MAPPING_DATA
+    assert compact_mapping.get_shaders() == shadermapping.load_shader_mapping_file(str(json_file)).get_shaders()
+
+
+def test_shader_mapping_diff(tmpdir):
+    new_data = OrderedDict([
+        ('|prop|bodyShape', OrderedDict([('bodySG', ['body_mat']), ('sharedSG', ['other_mat'])])),
+        ('|prop|armShape', OrderedDict([('bodySG', ['body_mat'])]))
+    ])
+
+    mapping_diff = shadermapping.diff_shader_mappings(shadermapping.ShaderMapping(MAPPING_DATA), new_data)
+    assert mapping_diff == {'added': ['|prop|armShape'], 'removed': ['|prop|eyeShape'], 'changed': ['|prop|bodyShape']}
+    assert not any(shadermapping.diff_shader_mappings(MAPPING_DATA, MAPPING_DATA).values())
+
+    mapping_file = tmpdir.join('mapping.smap')
+    mapping_file.write('')
+    shadermapping.write_shader_mapping_file(str(tmpdir.join('mapping.tmp')), new_data)
+    shadermapping.replace_shader_mapping_file(str(tmpdir.join('mapping.tmp')), str(mapping_file))
+    assert shadermapping.load_shader_mapping_file(str(mapping_file)).data == new_data
+    assert not tmpdir.join('mapping.tmp').exists()
+
+
+def test_shader_mapping_selection_expression():
+    assert shadermapping.get_selection_expression(['|prop|bodyShape', '|ns:prop|ns:eyeShape', '|prop|bodyShape']) == (
+        '*/prop/bodyShape or */prop/eyeShape')
+
+
+def test_shader_mapping_update_skips_empty_mappings(tmpdir):
+    mapping_file = tmpdir.join('mapping.smap')
+    shadermapping.write_shader_mapping_file(str(mapping_file), MAPPING_DATA)
+    file_data = mapping_file.read_binary()
+
+    assert shadermapping.update_shader_mapping_file(str(mapping_file), None) is None
+    assert shadermapping.update_shader_mapping_file(str(mapping_file), dict()) is None
+    assert mapping_file.read_binary() == file_data
+
+    locked_files = list()
+    mapping_diff = shadermapping.update_shader_mapping_file(
+        str(mapping_file), {'|prop|bodyShape': {'bodySG': ['body_mat']}}, lock_fn=locked_files.append)
+    assert mapping_diff['removed'] == ['|prop|eyeShape']
+    assert locked_files == [str(mapping_file)]
@@ -0,0 +1,30 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains tests for solstice tag nodes shaders info
+"""
+
+from solstice.core import shadersinfo
+
+
+def test_decode_legacy_shaders_info():
+    shaders_info = str({'body_geo': 'body_SG', 'eyes_geo': 'eyes_SG'})
+
+    assert shadersinfo.decode_shaders_info(shaders_info) == {'body_geo': 'body_SG', 'eyes_geo': 'eyes_SG'}
+
+
+def test_decode_json_shaders_info():
+    shaders_dict = {'body_geo': 'body_SG', 'eyes_geo': 'eyes_SG'}
+
+    shaders_info = shadersinfo.encode_shaders_info(shaders_dict)
+
+    assert shadersinfo.decode_shaders_info(shaders_info) == shaders_dict
+    assert shadersinfo.decode_shaders_info(
+        '{"version": 99, "shaders": {"body_geo": "body_SG"}}') is None
+
+
+def test_decode_malformed_shaders_info():
+    for shaders_info in ('', None, '{body_geo: body_SG', '["body_SG"]', 'None', '{[1]: 2}', {'body_geo': 'body_SG'}):
+        assert shadersinfo.decode_shaders_info(shaders_info) is None
+    assert shadersinfo.get_shaders_info('tag', {'body_geo': 'body_SG'}) is None
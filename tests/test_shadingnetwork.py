@@ -0,0 +1,52 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains tests for solstice shading networks
+"""
+
+from solstice.core import shadingnetwork
+
+
+def _get_network(prefix, base=0.8):
+    return {
+        '{}SG'.format(prefix): {
+            'type': 'shadingEngine', 'attr': {},
+            'connection': {'surfaceShader': '{}_mat.outColor'.format(prefix)}},
+        '{}_mat'.format(prefix): {
+            'type': 'aiStandardSurface', 'attr': {'base': base},
+            'connection': {'baseColor': '{}_tex.outColor'.format(prefix)}},
+        '{}_tex'.format(prefix): {'type': 'file', 'attr': {'fileTextureName': 'body.tx'}, 'connection': {}}
+    }
+
+
+def test_network_structure_hash_ignores_node_names():
+    network_hash = shadingnetwork.get_network_structure_hash(_get_network('body'))
+
+    assert network_hash == shadingnetwork.get_network_structure_hash(_get_network('bodyCopy'))
+    assert network_hash != shadingnetwork.get_network_structure_hash(_get_network('body', base=0.5))
+    assert shadingnetwork.get_network_structure_hash(dict()) is None
+
+
+def test_network_structure_hash_ignores_assignments():
+    assigned_network = _get_network('body')
+    assigned_network['bodySG']['connection'].update({
+        'dagSetMembers[0]': 'bodyShape.instObjGroups[0]', 'dagSetMembers[1]': 'eyeShape.instObjGroups[0]'})
+    assigned_network['bodyShape'] = {
+        'type': 'mesh', 'attr': {'visibility': True}, 'connection': {'inMesh': 'polyCube1.output'}}
+    assigned_network['eyeShape'] = {'type': 'mesh', 'attr': {'visibility': True}, 'connection': {}}
+    assigned_network['polyCube1'] = {'type': 'polyCube', 'attr': {'width': 1.0}, 'connection': {}}
+
+    assert shadingnetwork.get_network_structure_hash(assigned_network) == shadingnetwork.get_network_structure_hash(
+        _get_network('bodyCopy'))
+
+
+def test_collect_network_nodes_skips_geometries_and_cycles():
+    sources = {
+        'body_mat': ['body_tex', 'bodyShape'], 'body_tex': ['place', 'body_mat'], 'place': [],
+        'bodyShape': ['skinCluster1'], 'skinCluster1': ['bodyShape']}
+    node_types = {'bodyShape': 'mesh'}
+
+    nodes = shadingnetwork.collect_network_nodes(['body_mat'], sources.get, node_types.get)
+
+    assert nodes == ['body_mat', 'body_tex', 'place']
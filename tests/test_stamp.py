@@ -0,0 +1,229 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains tests for solstice stamp utilities
+"""
+
+import os
+import subprocess
+
+import pytest
+
+from solstice.core import stamp
+
+
+def _find_font_file():
+    for fonts_path in ('/usr/share/fonts', '/Library/Fonts', 'C:/Windows/Fonts'):
+        for root, _, file_names in os.walk(fonts_path):
+            for file_name in sorted(file_names):
+                if file_name.lower().endswith('.ttf'):
+                    return os.path.join(root, file_name)
+
+    return None
+
+
+def _read_rgb_image(image_path, width):
+    return bytearray(stamp.run_ffmpeg(['-i', image_path, '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'])), width
+
+
+def _get_pixel(image, x, y):
+    data, width = image
+    return tuple(data[(y * width + x) * 3:(y * width + x) * 3 + 3])
+
+
+def test_split_in_chunks():
+    chunks = stamp.split_in_chunks(range(10), chunk_size=4)
+    assert chunks == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_split_workers_between_jobs_and_chunks(monkeypatch):
+    monkeypatch.setattr(stamp.multiprocessing, 'cpu_count', lambda: 8)
+
+    assert stamp.split_workers(4, 2) == (2, 2)
+    assert stamp.split_workers(4, 10) == (4, 1)
+    assert stamp.split_workers(4, 1) == (1, 4)
+    assert stamp.split_workers(5, 2) == (2, 2)
+
+
+def test_run_chunks_keeps_order_and_isolates_failures():
+    def _sum_chunk(chunk):
+        if 5 in chunk:
+            raise ValueError('bad frame')
+        return sum(chunk)
+
+    results = stamp.run_chunks(_sum_chunk, stamp.split_in_chunks(range(12), chunk_size=3), workers=4)
+
+    assert [result.index for result in results] == [0, 1, 2, 3]
+    assert [result.result for result in results] == [3, None, 21, 30]
+    assert not results[1].success
+    assert isinstance(results[1].error, ValueError)
+
+
+def test_format_filter_escapes_option_values():
+    assert stamp.format_filter('drawtext', [('text', 'a: b, c'), ('x', 10)]) == 'drawtext=text=a\\\\: b\\, c:x=10'
+
+
+def test_build_stamp_filter_graph():
+    layout = stamp.StampLayout(
+        320, 180, top_band='top.png', top_band_height=20, bottom_band='bottom.png', bottom_band_height=20,
+        start_frame=101)
+
+    filter_graph = stamp.build_stamp_filter_graph(layout, top_band_label='1:v', bottom_band_label='2:v')
+
+    assert layout.height == 220
+    assert filter_graph.startswith('[0:v]pad=width=320:height=220:x=0:y=20')
+    assert '[top][2:v]overlay=x=0:y=200[bottom]' in filter_graph
+    assert 'n+101' in filter_graph
+    assert filter_graph.endswith('[stamped]')
+
+
+def test_build_stamp_filter_graph_with_static_layer():
+    layout = stamp.StampLayout(
+        320, 180, top_band='top.png', top_band_height=20, texts=[stamp.StampText('Shot', 10, 10)])
+
+    filter_graph = stamp.build_stamp_filter_graph(layout, static_layer_label='1:v')
+
+    assert '[base][1:v]overlay=x=0:y=0[static]' in filter_graph
+    assert 'text=Shot' not in filter_graph
+    assert filter_graph.count('drawtext') == 2
+
+
+def test_stamp_manifest_detects_changed_frames(tmpdir):
+    frame = tmpdir.join('frame.0001.png')
+    frame.write('pixels')
+    stamped_frame = tmpdir.join('stamped.0000.png')
+    stamped_frame.write('stamped')
+
+    manifest = stamp.StampManifest(str(tmpdir.join('output.stamp.json')))
+    source_hash = manifest.get_source_hash(str(frame))
+    manifest.set_frame(str(frame), source_hash, 'overlay', str(stamped_frame))
+    manifest.save()
+
+    manifest = stamp.StampManifest(manifest.file_path).load()
+    assert manifest.is_frame_valid(str(frame), manifest.get_source_hash(str(frame)), 'overlay', str(stamped_frame))
+    assert not manifest.is_frame_valid(str(frame), source_hash, 'new overlay', str(stamped_frame))
+
+    frame.write('new pixels')
+    assert not manifest.is_frame_valid(
+        str(frame), manifest.get_source_hash(str(frame)), 'overlay', str(stamped_frame))
+
+
+def test_get_timecode_text():
+    layout = stamp.StampLayout(320, 180, fps=24, framecode='00:00:59:20')
+
+    assert stamp.get_timecode_text(layout, 0) == 'Time: 00:00:59:20'
+    assert stamp.get_timecode_text(layout, 4) == 'Time: 00:01:00:00'
+
+
+def test_frame_compositor_blends_static_layer_and_glyphs():
+    np = pytest.importorskip('numpy')
+    from solstice.core import rawstamp
+
+    layout = stamp.StampLayout(
+        4, 2, top_band_height=1, background_color=(0, 0, 0), frame_text_position=(0, 0), timecode_position=(0, 2))
+    static_layer = np.zeros((layout.height, layout.width, 4), dtype=np.uint8)
+    static_layer[0, :] = (255, 255, 255, 255)
+    glyphs = np.zeros((1, 2, 4), dtype=np.uint8)
+    glyphs[0, 0] = (255, 0, 0, 255)
+    atlas = rawstamp.GlyphAtlas(glyphs, {'0': (0, 1), '1': (1, 1)})
+
+    compositor = rawstamp.FrameCompositor(layout, static_layer=static_layer, glyph_atlas=atlas)
+    stamped_frame = compositor.composite(np.full((2, 4, 3), 10, dtype=np.uint8), 0)
+
+    assert stamped_frame.shape == (3, 4, 3)
+    assert stamped_frame[0, 0].tolist() == [255, 0, 0]
+    assert stamped_frame[0, 3].tolist() == [255, 255, 255]
+    assert stamped_frame[1, 0].tolist() == [10, 10, 10]
+
+
+def test_iter_in_background_keeps_order_and_raises_producer_errors():
+    assert list(stamp.iter_in_background(range(20), max_items=2)) == list(range(20))
+
+    def _failing_items():
+        yield 1
+        raise ValueError('bad frame')
+
+    items = stamp.iter_in_background(_failing_items(), max_items=1)
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_partial_outputs_only_replace_outputs_when_committed(tmpdir):
+    output_specs = stamp.get_output_specs(str(tmpdir.join('shot.mp4')), [{'type': 'thumbnail', 'path': 'shot.jpg'}])
+    tmpdir.join('shot.mp4').write('old')
+
+    partial_output_specs = stamp.get_partial_output_specs(output_specs)
+    assert [os.path.splitext(spec.path)[-1] for spec in partial_output_specs] == ['.mp4', '.jpg']
+    assert partial_output_specs[1].output_type == stamp.OutputTypes.THUMBNAIL
+    with open(partial_output_specs[0].path, 'w') as fh:
+        fh.write('new')
+    stamp.discard_partial_outputs(partial_output_specs)
+    assert tmpdir.join('shot.mp4').read() == 'old'
+    assert not os.path.isfile(partial_output_specs[0].path)
+
+    with open(partial_output_specs[0].path, 'w') as fh:
+        fh.write('new')
+    stamp.commit_partial_outputs(partial_output_specs, output_specs)
+    assert tmpdir.join('shot.mp4').read() == 'new'
+    assert not os.path.isfile(partial_output_specs[0].path)
+
+
+def test_get_outputs_args_splits_stamped_frames():
+    output_specs = stamp.get_output_specs('shot.mp4', [
+        {'type': stamp.OutputTypes.MOVIE, 'path': 'shot_proxy.mp4', 'scale': 0.5},
+        {'type': stamp.OutputTypes.THUMBNAIL, 'path': 'shot.jpg', 'frame': 12}])
+
+    output_args = stamp.get_outputs_args('[0:v]null[stamped]', output_specs, fps=24)
+    filter_graph = output_args[1]
+
+    assert '[stamped]split=outputs=3[stamped0][stamped1][stamped2]' in filter_graph
+    assert '[stamped2]select=expr=eq(n\\,12)[stamped2_out]' in filter_graph
+    assert output_args.count('-map') == 3
+    assert output_args[-1] == 'shot.jpg'
+    assert stamp.get_outputs_args('[0:v]null[stamped]', stamp.get_output_specs('shot.mp4'))[:3] == [
+        '-filter_complex', '[0:v]null[stamped]', '-map']
+
+
+def test_static_layer_matches_drawtext_layout(tmpdir):
+    ffmpeg_executable = stamp.find_ffmpeg_executable()
+    if not ffmpeg_executable or ' drawtext ' not in subprocess.check_output(
+            [ffmpeg_executable, '-hide_banner', '-filters']).decode('utf-8'):
+        pytest.skip('FFMpeg drawtext filter is not available')
+    font_file = _find_font_file()
+    if not font_file:
+        pytest.skip('No font file available')
+
+    source = str(tmpdir.join('source.png'))
+    top_band = str(tmpdir.join('top.png'))
+    stamp.run_ffmpeg(['-f', 'lavfi', '-i', 'color=color=0x406080:size=160x90', '-frames:v', '1', source])
+    stamp.run_ffmpeg(['-f', 'lavfi', '-i', 'color=color=0x202020:size=160x20', '-frames:v', '1', top_band])
+    layout = stamp.StampLayout(
+        160, 90, top_band=top_band, top_band_height=20, font_file=font_file, font_size=20,
+        texts=[stamp.StampText('Shot', 10, 16), stamp.StampText('0', 10, 60)],
+        frame_text_position=(60, 60), timecode_position=(10, 100))
+
+    stamped_images = list()
+    for static_layer in (None, stamp.render_static_layer(layout, str(tmpdir.join('static.png')))):
+        input_args = ['-i', source, '-i', static_layer or top_band]
+        filter_graph = stamp.build_stamp_filter_graph(
+            layout, static_layer_label='1:v' if static_layer else None, top_band_label=None if static_layer else '1:v')
+        stamped_path = str(tmpdir.join('stamped_{}.png'.format(len(stamped_images))))
+        stamp.run_ffmpeg(input_args + ['-filter_complex', filter_graph, '-map', '[stamped]', '-frames:v', '1',
+                                       stamped_path])
+        stamped_images.append(_read_rgb_image(stamped_path, layout.width))
+
+    # Static layer only changes how texts are composited, not their font or their position
+    baseline_image, static_image = stamped_images
+    assert len(baseline_image[0]) == len(static_image[0]) == layout.width * layout.height * 3
+    assert max(abs(a - b) for a, b in zip(baseline_image[0], static_image[0])) <= 4
+
+    # Static texts and frame counter share their baseline
+    background = _get_pixel(static_image, 150, 50)
+
+    def _get_lowest_row(x):
+        return max(y for y in range(30, 80) for column in range(x, x + 8)
+                   if max(abs(a - b) for a, b in zip(_get_pixel(static_image, column, y), background)) > 64)
+
+    assert _get_lowest_row(10) == _get_lowest_row(60)
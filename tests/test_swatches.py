@@ -0,0 +1,63 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Module that contains tests for solstice shader swatches cache
+"""
+
+import os
+
+from solstice.core import swatches
+
+
+def test_network_hash_depends_on_network_structure():
+    network = {'body_mat': {'type': 'aiStandardSurface', 'attr': {'base': 0.8}, 'connection': {}}}
+    same_network = {'body_mat': {'connection': {}, 'attr': {'base': 0.8}, 'type': 'aiStandardSurface'}}
+    changed_network = {'body_mat': {'type': 'aiStandardSurface', 'attr': {'base': 0.5}, 'connection': {}}}
+
+    assert swatches.get_network_hash(network) == swatches.get_network_hash(same_network)
+    assert swatches.get_network_hash(network) != swatches.get_network_hash(changed_network)
+    assert swatches.get_network_hash(network, swatch_size=100) != swatches.get_network_hash(network, swatch_size=200)
+
+
+def test_swatch_cache_evicts_least_recently_used_swatches(tmpdir):
+    swatch_file = tmpdir.join('swatch.png')
+    swatch_file.write('x' * 10)
+    cache = swatches.SwatchCache(cache_path=str(tmpdir.join('cache')), max_bytes=25)
+
+    first_path = cache.add('aa11', str(swatch_file))
+    second_path = cache.add('bb22', str(swatch_file))
+    os.utime(first_path, (1, 1))
+    os.utime(second_path, (2, 2))
+    assert cache.get('aa11') == first_path
+    cache.add('cc33', str(swatch_file))
+
+    assert cache.get('bb22') is None
+    assert cache.get('aa11') and cache.get('cc33')
+
+
+def test_network_hash_ignores_node_names_and_assignments():
+    network = {'body_mat': {'type': 'aiStandardSurface', 'attr': {'base': 0.8}, 'connection': {}}}
+    renamed_network = {'bodyCopy_mat': {'type': 'aiStandardSurface', 'attr': {'base': 0.8}, 'connection': {}}}
+    assigned_network = dict(network, bodyShape={'type': 'mesh', 'attr': {}, 'connection': {}})
+
+    assert swatches.get_network_hash(network) == swatches.get_network_hash(renamed_network)
+    assert swatches.get_network_hash(network) == swatches.get_network_hash(assigned_network)
+    assert swatches.get_network_hash(dict()) is None
+
+
+def test_swatch_cache_only_scans_folder_when_needed(tmpdir, monkeypatch):
+    swatch_file = tmpdir.join('swatch.png')
+    swatch_file.write('x' * 10)
+    cache = swatches.SwatchCache(cache_path=str(tmpdir.join('cache')), max_bytes=25)
+    scans = list()
+    get_swatches = cache._get_swatches
+    monkeypatch.setattr(cache, '_get_swatches', lambda: scans.append(True) or get_swatches())
+
+    cache.add('aa11', str(swatch_file))
+    cache.add('bb22', str(swatch_file))
+    cache.add('bb22', str(swatch_file))
+    assert len(scans) == 1
+
+    cache.add('cc33', str(swatch_file))
+    assert len(scans) == 2